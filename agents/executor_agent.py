@@ -1,24 +1,109 @@
 # agents/executor_agent.py
-from crewai import Agent
-from agents.labeling_agent import label_bank_statement
+from core.lazy import lazy_agent
+from agents.labeling_agent import (
+    label_bank_statement, label_bank_statement_chunks, labeled_output_path,
+    label_chunk, read_statement_chunks, LabeledOutputWriter, MODEL_BACKEND,
+)
+from core.pipeline import Stage, run_pipeline
 from database.logger import log_action
-from retrieval.rag import index_labeled_file, retrieve_and_answer
-from retrieval.generators import generator_fn
+from core.tracing import traced
 import os
+from functools import partial
+
+# retrieval.* is imported inside the functions: it loads faiss, which
+# importing crew_setup (the job workers' entry point) should not pay for.
+
+LABEL_WORKERS = int(os.getenv("PIPELINE_LABEL_WORKERS", 2))
+EMBED_WORKERS = int(os.getenv("PIPELINE_EMBED_WORKERS", 2))
+# "thread" or "process" (see core.pipeline.Stage); a process worker loads its own copy of the model
+LABEL_KIND = os.getenv("PIPELINE_LABEL_KIND", "thread")
+EMBED_KIND = os.getenv("PIPELINE_EMBED_KIND", "thread")
 
+@traced()
 def execute_audit(file_path):
-    labeled_csv = label_bank_statement(file_path)
-    labeled_json = labeled_csv.replace(".csv", ".json")
-    index_info = index_labeled_file(labeled_json)
-    log_action("Executor Agent", "Executed labeling and indexing", {"labeled_csv": labeled_csv, "index": index_info})
-    return labeled_csv
+    from retrieval.rag import index_labeled_file
+    labeled_file = label_bank_statement(file_path)
+    index_info = index_labeled_file(labeled_file)
+    log_action("Executor Agent", "Executed labeling and indexing", {"labeled_file": labeled_file, "index": index_info})
+    return labeled_file
+
+def execute_audit_streaming(file_path, chunksize):
+    """
+    Label and index `file_path` chunk by chunk.
+    Yields each labeled chunk once it is indexed, so callers can keep
+    processing (e.g. Q&A generation) while later chunks are still labeling.
+    """
+    from retrieval.rag import DocumentIndexer, labeled_doc_id, embed_labeled_rows
+    labeled_file = labeled_output_path(file_path)
+    doc_id = labeled_doc_id(labeled_file)
+    indexer = DocumentIndexer(doc_id)
+    for chunk, offset in label_bank_statement_chunks(file_path, chunksize):
+        # embeds only the rows of this chunk that are not indexed yet
+        indexer.index(*embed_labeled_rows(chunk, doc_id, offset, embed=False))
+        yield chunk
+    info = indexer.finish()
+    log_action("Executor Agent", "Executed streaming labeling and indexing", {"labeled_file": labeled_file, "rows_indexed": info["added"], "rows_removed": info["removed"]})
+
+# pipeline stages are module-level so process workers can unpickle them
+def _label_stage(item):
+    chunk, offset = item
+    chunk, stats = label_chunk(chunk)
+    return chunk, offset, stats
 
-def answer_query(query_text, top_k=None):
+def _embed_stage(doc_id, item):
+    from retrieval.rag import embed_labeled_rows
+    chunk, offset, stats = item
+    return chunk, stats, embed_labeled_rows(chunk, doc_id, offset)
+
+def execute_audit_parallel(file_path, chunksize, label_workers=None, embed_workers=None):
+    """
+    Chunked labeling and indexing with overlapping stages.
+    Labeling and embedding each run on their own workers, threads or
+    processes (PIPELINE_LABEL_KIND / PIPELINE_EMBED_KIND), connected by
+    bounded queues; writing the outputs and adding to the index happen here,
+    in file order. Yields each labeled chunk once it is indexed.
+    """
+    from retrieval.rag import DocumentIndexer, labeled_doc_id
+    doc_id = labeled_doc_id(labeled_output_path(file_path))
+    stages = [
+        Stage("label", _label_stage, label_workers or LABEL_WORKERS, kind=LABEL_KIND),
+        Stage("embed", partial(_embed_stage, doc_id), embed_workers or EMBED_WORKERS, kind=EMBED_KIND),
+    ]
+    writer = LabeledOutputWriter(file_path)
+    indexer = DocumentIndexer(doc_id)
+    try:
+        for chunk, stats, embedded in run_pipeline(read_statement_chunks(file_path, chunksize), stages):
+            writer.write(chunk, stats)
+            # fingerprints need file order, so they are taken here, not in the embed stage
+            indexer.index(*embedded)
+            yield chunk
+    finally:
+        writer.close()
+    info = indexer.finish()
+    log_action("Labeling Agent", "Labeled document", {"file": file_path, "output": writer.out_path, "exports": writer.exports, "backend": MODEL_BACKEND, "chunksize": chunksize, **writer.stats})
+    log_action("Executor Agent", "Executed parallel labeling and indexing", {"labeled_file": writer.out_path, "rows_indexed": info["added"], "rows_removed": info["removed"], "workers": {s.name: f"{s.workers} {s.kind}" for s in stages}})
+
+def answer_query(query_text, top_k=None, filters=None):
+    """`filters` scopes the question, e.g. {"doc_id": ..., "category": ..., "date_from": ..., "date_to": ...}."""
+    from retrieval.rag import retrieve_and_answer
+    from retrieval.generators import generator_fn
     top_k = top_k or int(os.getenv("RAG_TOP_K", 5))
-    answer, results = retrieve_and_answer(query_text, generator_fn, top_k=top_k)
+    answer, results = retrieve_and_answer(query_text, generator_fn, top_k=top_k, filters=filters)
     return answer, results
 
-executor_agent = Agent(
+def answer_queries(queries, top_k=None, batch_size=None, filters=None):
+    """
+    Answer a list of questions in one batched pass (see retrieve_and_answer_batch).
+    Returns [{"query", "answer", "results", "latency_s", "cached"}] in the order of `queries`.
+    """
+    from retrieval.rag import retrieve_and_answer_batch
+    from retrieval.generators import batch_generator_fn
+    top_k = top_k or int(os.getenv("RAG_TOP_K", 5))
+    return retrieve_and_answer_batch(queries, batch_generator_fn, top_k=top_k, batch_size=batch_size, filters=filters)
+
+# built on first access (see core.lazy)
+__getattr__ = lazy_agent(
+    __name__, "executor_agent",
     role="Executor Agent",
     goal="Parse, label, and summarize financial data.",
     backstory="Executor that runs labeling and indexing tasks.",
@@ -1,123 +1,277 @@
 # agents/fine_tuner_agent.py
-import os
-from crewai import Agent
+import os, shutil, hashlib
+from core.lazy import lazy_agent
 from database.logger import log_action
+from core.adapters import active_version, save_version, promote, SERVING_DIR
+from core.qa_store import get_qa_store
+from core.jobs import report_progress, JobCancelled
+from core.tracing import span, traced
 from dotenv import load_dotenv
 
-import pandas as pd
-from datasets import Dataset
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, TrainingArguments, Trainer
-from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
+from datasets import Dataset, concatenate_datasets, load_from_disk
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, DataCollatorForSeq2Seq, TrainingArguments, Trainer, TrainerCallback
+from peft import LoraConfig, PeftModel, get_peft_model, prepare_model_for_kbit_training
 
 load_dotenv()
 
 MODEL_NAME = os.getenv("MODEL_NAME", "google/flan-t5-base")
+BATCH_SIZE = int(os.getenv("FINETUNE_BATCH_SIZE", 16))
+GRAD_ACCUM = int(os.getenv("FINETUNE_GRAD_ACCUM", 1))
+MAX_INPUT_LENGTH = int(os.getenv("FINETUNE_MAX_INPUT_LENGTH", 256))
+MAX_TARGET_LENGTH = int(os.getenv("FINETUNE_MAX_TARGET_LENGTH", 128))
+TOKENIZED_CACHE_DIR = os.getenv("FINETUNE_TOKENIZED_CACHE", "outputs/cache/tokenized")
+TOKENIZE_BLOCK = int(os.getenv("FINETUNE_TOKENIZE_BLOCK", 10000))
+REPLAY_RATIO = float(os.getenv("FINETUNE_REPLAY_RATIO", 0.2))
+MAX_STEPS = int(os.getenv("FINETUNE_MAX_STEPS", -1))  # -1 = one full epoch
 
-# Directory where labeled or Q&A data is stored
+# Directory where labeled data is stored
 LABELED_DIR = "datasets/labeled_data"
-QA_DIR = "datasets/qa_data"
-FINETUNE_DIR = "models/fine_tuned"
+FINETUNE_DIR = SERVING_DIR
+RUNS_DIR = "outputs/finetune_runs"
 
 os.makedirs(FINETUNE_DIR, exist_ok=True)
 
 # -------------------------------
 # Helper: prepare dataset for fine-tuning
 # -------------------------------
-def load_training_data():
+def _qa_samples(after_seq, until_seq, store_path, content_hash):
+    # store_path and content_hash are not read here; they only key the datasets cache
+    for pair in get_qa_store().iter_pairs(after_seq=after_seq, until_seq=until_seq):
+        yield {"input_text": pair["question"], "target_text": pair["answer"]}
+
+
+def _qa_dataset(after_seq, until_seq, content_hash=None):
+    """
+    Pairs (after_seq, until_seq] as a Dataset. from_generator caches on the
+    generator and its gen_kwargs only, and sequence numbers restart in a
+    recreated store, so the store path and the range's content hash are
+    passed along to keep a cached build from being reused for other pairs.
+    """
+    store = get_qa_store()
+    if content_hash is None:
+        content_hash = store.content_hash(after_seq, until_seq)[0]
+    return Dataset.from_generator(_qa_samples, gen_kwargs={
+        "after_seq": after_seq, "until_seq": until_seq,
+        "store_path": os.path.abspath(store.path), "content_hash": content_hash,
+    })
+
+
+def load_training_data(after_seq=0):
     """
-    Collects Q&A pairs from your labeled CSV or QA JSONs.
-    Expect JSON lines: [{"question": "...", "answer": "..."}]
+    Streams Q&A pairs from the Q&A store (see core.qa_store) into a Dataset.
+    Rows are read in batches and written to an on-disk Arrow cache, so the
+    pairs are never all held in memory at once.
     """
-    data = []
-    # 1️⃣ Load any Q&A JSON files
-    if os.path.exists(QA_DIR):
-        for f in os.listdir(QA_DIR):
-            if f.endswith(".json"):
-                df = pd.read_json(os.path.join(QA_DIR, f))
-                for _, row in df.iterrows():
-                    if "question" in row and "answer" in row:
-                        data.append({
-                            "input_text": row["question"],
-                            "target_text": row["answer"]
-                        })
-
-    if not data:
+    until_seq = get_qa_store().last_seq()
+    if until_seq <= after_seq:
         print("[fine_tuner_agent] No Q&A data found for fine-tuning.")
         return None
 
+    data = _qa_dataset(after_seq, until_seq)
     print(f"[fine_tuner_agent] Loaded {len(data)} samples for training.")
-    return Dataset.from_list(data)
+    return data
+
+
+def _tokenizer_key(tokenizer):
+    h = hashlib.sha1(f"{type(tokenizer).__name__}|{tokenizer.name_or_path}|{len(tokenizer)}|{MAX_INPUT_LENGTH}|{MAX_TARGET_LENGTH}".encode())
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        h.update(backend.to_str().encode())
+    return h.hexdigest()[:16]
+
+
+def _preprocess(tokenizer):
+    # no padding here: DataCollatorForSeq2Seq pads each batch to its longest row
+    def preprocess(examples):
+        model_inputs = tokenizer(examples["input_text"], max_length=MAX_INPUT_LENGTH, truncation=True)
+        labels = tokenizer(text_target=examples["target_text"], max_length=MAX_TARGET_LENGTH, truncation=True)
+        model_inputs["labels"] = labels["input_ids"]
+        model_inputs["length"] = [len(ids) for ids in model_inputs["input_ids"]]
+        return model_inputs
+    return preprocess
+
+
+def tokenized_training_data(tokenizer, after_seq=0, until_seq=None):
+    """
+    Tokenized Q&A pairs with sequence number in (`after_seq`, `until_seq`].
+
+    The store is append-only, so pairs are tokenized in blocks of
+    TOKENIZE_BLOCK sequence numbers cached on disk under a key made of the
+    tokenizer hash and the block's content hash. Full blocks never change,
+    so a retrain only tokenizes pairs added since the previous run.
+    Returns (dataset or None, {"blocks", "cached_blocks"}).
+    """
+    store = get_qa_store()
+    until_seq = store.last_seq() if until_seq is None else until_seq
+    info = {"blocks": 0, "cached_blocks": 0}
+    if until_seq <= after_seq:
+        return None, info
+    tok_key = _tokenizer_key(tokenizer)
+    os.makedirs(TOKENIZED_CACHE_DIR, exist_ok=True)
+    bounds = [after_seq, *range((after_seq // TOKENIZE_BLOCK + 1) * TOKENIZE_BLOCK, until_seq, TOKENIZE_BLOCK), until_seq]
+    blocks = []
+    for start, end in zip(bounds, bounds[1:]):
+        digest, count = store.content_hash(start, end)
+        if not count:
+            continue
+        prefix = f"{tok_key}-{start}-"
+        path = os.path.join(TOKENIZED_CACHE_DIR, prefix + digest)
+        if os.path.exists(path):
+            blocks.append(load_from_disk(path))
+            info["cached_blocks"] += 1
+            continue
+        raw = _qa_dataset(start, end, digest)
+        block = raw.map(_preprocess(tokenizer), batched=True, remove_columns=raw.column_names)
+        block.save_to_disk(path)
+        # a block that was still filling up has been superseded by this one
+        for name in os.listdir(TOKENIZED_CACHE_DIR):
+            if name.startswith(prefix) and name != os.path.basename(path):
+                shutil.rmtree(os.path.join(TOKENIZED_CACHE_DIR, name), ignore_errors=True)
+        blocks.append(block)
+    info["blocks"] = len(blocks)
+    if not blocks:
+        return None, info
+    return (blocks[0] if len(blocks) == 1 else concatenate_datasets(blocks)), info
+
+
+def _replay_data(tokenizer, until_seq, count):
+    """A random sample of `count` older pairs, mixed into delta runs against forgetting."""
+    pairs = get_qa_store().sample(count, until_seq=until_seq) if count > 0 else []
+    if not pairs:
+        return None
+    raw = Dataset.from_list([{"input_text": p["question"], "target_text": p["answer"]} for p in pairs])
+    return raw.map(_preprocess(tokenizer), batched=True, remove_columns=raw.column_names)
+
+
+class _JobProgress(TrainerCallback):
+    """Reports training progress to the job runner and stops training when the job is cancelled."""
+
+    def __init__(self):
+        self.cancelled = False
+
+    def on_step_end(self, args, state, control, **kwargs):
+        try:
+            report_progress(0.1 + 0.8 * state.global_step / max(state.max_steps, 1), f"step {state.global_step}/{state.max_steps}")
+        except JobCancelled:
+            self.cancelled = True
+            control.should_training_stop = True
 
 
 # -------------------------------
 # Core Fine-tuning Function
 # -------------------------------
-def fine_tune_local_model(mode="auto"):
+@traced("fine_tune")
+def fine_tune_local_model(mode="auto", replay_ratio=None):
     """
-    mode = "auto" → triggered by low review accuracy (fine-tune on combined_qa.json)
-    mode = "global" → user-triggered retraining on all data
+    mode = "global" → retrain a fresh adapter from MODEL_NAME on all Q&A data
+    mode = "delta"  → continue training the active adapter version on the pairs
+                      added since it was trained (its watermark), plus a replay
+                      sample of `replay_ratio` (FINETUNE_REPLAY_RATIO) older pairs
+    mode = "auto"   → triggered by low review accuracy; delta when an adapter
+                      version exists, global otherwise
+
+    Every run is saved as a new adapter version and promoted (see core.adapters),
+    so `python -m core.adapters rollback` restores the previous one.
     """
+    base = active_version()
+    if mode == "auto":
+        mode = "delta" if base else "global"
+    if mode == "delta" and not base:
+        print("[fine_tuner_agent] No adapter version to continue from, running a global fine-tune.")
+        mode = "global"
     print(f"[fine_tuner_agent] Starting fine-tuning mode: {mode}")
-    dataset = load_training_data()   # this already loads all QA files
+    report_progress(0.0, f"preparing {mode} fine-tune")
+
+    after_seq = base["watermark"] if mode == "delta" else 0
+    until_seq = get_qa_store().last_seq()
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    with span("tokenize") as s:
+        dataset, cache_info = tokenized_training_data(tokenizer, after_seq, until_seq)
+        s.add("cached_blocks", cache_info["cached_blocks"])
+        s.add("blocks", cache_info["blocks"])
     if not dataset:
         print("[fine_tuner_agent] No data available for fine-tuning.")
         return None
+    new_samples = len(dataset)
+    replayed = 0
+    if mode == "delta":
+        ratio = REPLAY_RATIO if replay_ratio is None else replay_ratio
+        replay = _replay_data(tokenizer, after_seq, int(new_samples * ratio))
+        if replay is not None:
+            replayed = len(replay)
+            dataset = concatenate_datasets([dataset, replay])
+    print(f"[fine_tuner_agent] {new_samples} new + {replayed} replayed samples ({cache_info['cached_blocks']}/{cache_info['blocks']} tokenized blocks from cache)")
 
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
     model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
 
-    # LoRA configuration (lightweight fine-tuning)
-    lora_config = LoraConfig(
-        r=8,
-        lora_alpha=16,
-        target_modules=["q", "v"],  # T5 attention submodules
-        lora_dropout=0.05,
-        bias="none",
-        task_type="SEQ_2_SEQ_LM"
-    )
-
-    model = get_peft_model(model, lora_config)
-
-    def preprocess(examples):
-        inputs = examples["input_text"]
-        targets = examples["target_text"]
-        model_inputs = tokenizer(
-            inputs, max_length=256, truncation=True, padding="max_length"
-        )
-        labels = tokenizer(
-            targets, max_length=128, truncation=True, padding="max_length"
+    if mode == "delta":
+        model = PeftModel.from_pretrained(model, base["path"], is_trainable=True)
+    else:
+        # LoRA configuration (lightweight fine-tuning)
+        lora_config = LoraConfig(
+            r=8,
+            lora_alpha=16,
+            target_modules=["q", "v"],  # T5 attention submodules
+            lora_dropout=0.05,
+            bias="none",
+            task_type="SEQ_2_SEQ_LM"
         )
-        model_inputs["labels"] = labels["input_ids"]
-        return model_inputs
-
-    tokenized_dataset = dataset.map(preprocess, batched=True, remove_columns=dataset.column_names)
+        model = get_peft_model(model, lora_config)
 
     training_args = TrainingArguments(
-        output_dir=FINETUNE_DIR,
+        output_dir=RUNS_DIR,
         num_train_epochs=1,
-        per_device_train_batch_size=2,
+        max_steps=MAX_STEPS,
+        per_device_train_batch_size=BATCH_SIZE,
+        gradient_accumulation_steps=GRAD_ACCUM,
+        # batches of similar length, so dynamic padding adds few pad tokens
+        group_by_length=True,
+        length_column_name="length",
         learning_rate=5e-5,
-        logging_dir=os.path.join(FINETUNE_DIR, "logs"),
-        save_total_limit=1,
-        save_strategy="epoch",
-        remove_unused_columns=False,
+        logging_dir=os.path.join(RUNS_DIR, "logs"),
+        # the adapter is saved as a version below; no trainer checkpoints
+        save_strategy="no",
         push_to_hub=False,
         report_to="none",
     )
 
+    progress = _JobProgress()
     trainer = Trainer(
         model=model,
         args=training_args,
-        train_dataset=tokenized_dataset,
+        train_dataset=dataset,
+        # label padding is -100 so padded target positions are ignored by the loss
+        data_collator=DataCollatorForSeq2Seq(tokenizer, model=model, label_pad_token_id=-100),
+        callbacks=[progress],
     )
 
     print("[fine_tuner_agent] Starting fine-tuning...")
-    trainer.train()
-    model.save_pretrained(FINETUNE_DIR)
-    tokenizer.save_pretrained(FINETUNE_DIR)
+    with span("train", samples=len(dataset)):
+        metrics = trainer.train().metrics
+    if progress.cancelled:
+        # a cancelled run is discarded, never promoted
+        raise JobCancelled("fine-tune cancelled")
+
+    report = {
+        "samples": new_samples,
+        "replayed": replayed,
+        "model": MODEL_NAME,
+        "mode": mode,
+        "watermark": until_seq,
+        "batch_size": BATCH_SIZE,
+        "grad_accum": GRAD_ACCUM,
+        "train_seconds": round(metrics.get("train_runtime", 0), 2),
+        "samples_per_sec": round(metrics.get("train_samples_per_second", 0), 2),
+        "tokenized_blocks_cached": cache_info["cached_blocks"],
+    }
+    report_progress(0.95, "saving adapter")
+    with span("save_adapter"):
+        version = save_version(model, tokenizer, report)
+        # points FINETUNE_DIR at a copy of the version and hot-swaps it into the shared model
+        promote(version, FINETUNE_DIR)
 
-    log_action("FineTuner Agent", "Model fine-tuned", {"samples": len(dataset), "model": MODEL_NAME})
-    print(f"[fine_tuner_agent] ✅ Fine-tuning complete! Model saved to {FINETUNE_DIR}")
+    log_action("FineTuner Agent", "Model fine-tuned", {**report, "version": version})
+    print(f"[fine_tuner_agent] ✅ Fine-tuning complete! Adapter {version} promoted to {FINETUNE_DIR} ({report['samples_per_sec']} samples/sec)")
 
     return FINETUNE_DIR
 
@@ -125,7 +279,9 @@ def fine_tune_local_model(mode="auto"):
 # -------------------------------
 # CrewAI Agent Wrapper
 # -------------------------------
-fine_tuner_agent = Agent(
+# built on first access (see core.lazy)
+__getattr__ = lazy_agent(
+    __name__, "fine_tuner_agent",
     role="FineTuner Agent",
     goal="Perform LoRA fine-tuning on labeled or Q&A data using flan-t5-base.",
     backstory="This agent fine-tunes the local model incrementally as new labeled or Q&A data appears.",
@@ -1,68 +1,221 @@
 # agents/labeling_agent.py
-from crewai import Agent
+from core.lazy import lazy_agent
 import pandas as pd
-import os, json
+import os, json, re
 from database.logger import log_action
 from dotenv import load_dotenv
 load_dotenv()
 
-from core.model_loader import load_phi3_model, generate_with_model
+from core.model_loader import get_model, generate_with_model, generate_batch_with_model, get_model_version
+from core.label_cache import get_label_cache
+from core.rules import load_rules
+from core.tracing import span, traced, count
+from core.labeled_store import LABELED_EXT, LabeledWriter, write_labeled, export_configured
+from core.statement_summary import summarize, merge_summaries, write_summary
 
 MODEL_BACKEND = os.getenv("MODEL_BACKEND", "transformers")
 MODEL_NAME = os.getenv("MODEL_NAME", "microsoft/phi-3-mini-4k-instruct")
-
-# load model once
-if MODEL_BACKEND == "transformers":
-    model, tokenizer = load_phi3_model()
+LABEL_BATCH_SIZE = int(os.getenv("LABEL_BATCH_SIZE", 16))
+LABELED_DIR = "datasets/labeled_data"
+AMOUNT_COLUMNS = ("DEBIT", "CREDIT", "BALANCE")
 
 def detect_category(desc: str):
-    if not isinstance(desc, str): return None
-    d = desc.lower()
-    if "atm" in d or "cash" in d: return "Cash Withdrawal"
-    if "salary" in d and ("credit" in d or "salary" in d): return "Income"
-    if "amazon" in d or "flipkart" in d or "myntra" in d: return "Shopping"
-    if "interest" in d: return "Interest"
-    return None
+    """Rule-based category for one description (see config/category_rules.json)."""
+    return load_rules().match(desc)
 
-def label_with_llm(description: str):
-    prompt = (
+_REF_NUMBER = re.compile(r"\d{4,}")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_description(desc: str):
+    """Key used to deduplicate descriptions: lowercased, whitespace collapsed,
+    long digit runs (reference / account numbers) masked."""
+    if not isinstance(desc, str): return ""
+    d = _REF_NUMBER.sub("#", desc.lower())
+    return _WHITESPACE.sub(" ", d).strip()
+
+def normalize_descriptions(descriptions: pd.Series):
+    """Vectorized `normalize_description` over a Series."""
+    return (descriptions.astype(str).str.lower()
+            .str.replace(_REF_NUMBER, "#", regex=True)
+            .str.replace(_WHITESPACE, " ", regex=True)
+            .str.strip())
+
+def build_label_prompt(description: str):
+    return (
         "You are a helpful assistant. Classify the following bank transaction description into one of:\n"
         "[Income, Expense, Shopping, Interest, Transfer, Cash Withdrawal, Other(whenever you are specifying other category you should also specify the sub category also in bracket)]\n\n"
         f"Transaction: \"{description}\"\n\n"
         "Answer with the single category name."
     )
+
+@traced()
+def label_with_llm(description: str):
+    cache, version, key = get_label_cache(), get_model_version(), normalize_description(description)
+    cached = cache.get(version, key)
+    if cached:
+        count("cache_hits")
+        return cached
+    prompt = build_label_prompt(description)
     try:
-        return generate_with_model(model, tokenizer, prompt, max_new_tokens=32).split("\n")[0].strip()
+        model, tokenizer = get_model()
+        label = generate_with_model(model, tokenizer, prompt, max_new_tokens=32).split("\n")[0].strip()
     except Exception as e:
         print("[label_with_llm] LLM error:", e)
         return "Other"
+    if label and label != "Other":
+        cache.put(version, key, label)
+    return label
+
+@traced()
+def label_batch_with_llm(descriptions, batch_size=None):
+    """
+    Label many descriptions with padded batches through the local model.
+    Returns a list of categories aligned with `descriptions`.
+    """
+    batch_size = batch_size or LABEL_BATCH_SIZE
+    if not descriptions:
+        return []
+    count("rows", len(descriptions))
+    prompts = [build_label_prompt(d) for d in descriptions]
+    try:
+        model, tokenizer = get_model()
+        outputs = generate_batch_with_model(model, tokenizer, prompts, max_new_tokens=32, batch_size=batch_size)
+    except Exception as e:
+        print("[label_batch_with_llm] LLM error:", e)
+        return ["Other"] * len(descriptions)
+    return [(o.split("\n")[0].strip() or "Other") for o in outputs]
+
+@traced()
+def label_descriptions(descriptions, batch_size=None):
+    """
+    Label a sequence of raw descriptions.
+    Rules are applied column-wise first. The rows they miss are normalized and
+    deduplicated, the label cache is consulted, and only the remaining unique
+    misses go to the LLM.
+    Returns (categories aligned with input, stats dict).
+    """
+    descriptions = pd.Series(descriptions, dtype=object).reset_index(drop=True)
+    with span("rules", rows=len(descriptions)):
+        categories, needs_llm = load_rules().apply(descriptions)
+
+    pending = descriptions[needs_llm]
+    keys = normalize_descriptions(pending)
+    representative = pending.groupby(keys, sort=False).first()
+    misses = representative.index.tolist()
+
+    cache, version = get_label_cache(), get_model_version()
+    with span("label_cache", lookups=len(misses)):
+        labels = cache.get_many(version, misses)
+    cache_hits = len(labels)
+    misses = [k for k in misses if k not in labels]
+
+    llm_labels = label_batch_with_llm(representative[misses].tolist(), batch_size=batch_size)
+    labels.update(zip(misses, llm_labels))
+    cache.put_many(version, {k: l for k, l in zip(misses, llm_labels) if l and l != "Other"})
 
-def label_bank_statement(file_path):
-    df = pd.read_csv(file_path)
+    categories[needs_llm] = keys.map(labels)
+    stats = {
+        "rows": len(descriptions),
+        "rule_hits": int((~needs_llm).sum()),
+        "unique_llm_candidates": len(representative),
+        "cache_hits": cache_hits,
+        "llm_calls": len(misses),
+    }
+    for key in ("rows", "rule_hits", "cache_hits", "llm_calls"):
+        count(key, stats[key])
+    return categories.fillna("Other").tolist(), stats
+
+def labeled_output_path(file_path):
+    os.makedirs(LABELED_DIR, exist_ok=True)
+    return os.path.join(LABELED_DIR, os.path.basename(file_path).replace(".csv", "_labeled" + LABELED_EXT))
+
+def statement_dtypes(file_path):
+    """Text for every column but the amounts, so a column's type cannot change between chunks."""
+    return {c: str for c in pd.read_csv(file_path, nrows=0).columns if c not in AMOUNT_COLUMNS}
+
+def label_bank_statement(file_path, batch_size=None):
+    df = pd.read_csv(file_path, dtype=statement_dtypes(file_path))
     if "DESCRIPTION" not in df.columns:
         raise ValueError("CSV must contain DESCRIPTION column.")
-    categories = []
-    for desc in df["DESCRIPTION"].astype(str):
-        rule = detect_category(desc)
-        print(rule)
-        if rule:
-            print("i am an rule based agent")
-            categories.append(rule)
-        else:
-            cat = label_with_llm(desc)
-            categories.append(cat if cat else "Other")
+    categories, stats = label_descriptions(df["DESCRIPTION"].astype(str).tolist(), batch_size=batch_size)
     df["CATEGORY"] = categories
+    print(f"[labeling_agent] {stats['rows']} rows, {stats['rule_hits']} rule hits, {stats['cache_hits']} from cache, {stats['llm_calls']} sent to LLM")
+
+    out_path = write_labeled(df, labeled_output_path(file_path))
+    summary = summarize(df)
+    write_summary(summary, out_path)
+    exports = export_configured(out_path)
+
+    log_action("Labeling Agent", "Labeled document", {"file": file_path, "output": out_path, "exports": exports, "backend": MODEL_BACKEND, "balance_breaks": summary["balance"]["breaks"], **stats})
+    return out_path
+
+def label_chunk(chunk, batch_size=None):
+    """Label one DataFrame chunk in place of a streamed statement; returns (chunk, stats)."""
+    if "DESCRIPTION" not in chunk.columns:
+        raise ValueError("CSV must contain DESCRIPTION column.")
+    categories, stats = label_descriptions(chunk["DESCRIPTION"].astype(str).tolist(), batch_size=batch_size)
+    chunk["CATEGORY"] = categories
+    return chunk, stats
 
-    os.makedirs("datasets/labeled_data", exist_ok=True)
-    out_csv = os.path.join("datasets/labeled_data", os.path.basename(file_path).replace(".csv","_labeled.csv"))
-    df.to_csv(out_csv, index=False)
-    json_path = out_csv.replace(".csv", ".json")
-    df.to_json(json_path, orient="records", indent=2)
+class LabeledOutputWriter:
+    """
+    Appends labeled chunks, in order, to the labeled Parquet output and
+    folds each into the statement summary, written on close.
+    """
+
+    def __init__(self, file_path):
+        self.out_path = labeled_output_path(file_path)
+        self.stats = {}
+        self.exports = {}
+        self.summary = None
+        self._writer = LabeledWriter(self.out_path)
+
+    @property
+    def rows(self):
+        return self._writer.rows
+
+    def write(self, chunk, stats=None):
+        self.summary = merge_summaries(self.summary, summarize(chunk, self.rows), contiguous=True)
+        self._writer.write(chunk)
+        for k, v in (stats or {}).items():
+            self.stats[k] = self.stats.get(k, 0) + v
+
+    def close(self):
+        self._writer.close()
+        write_summary(self.summary or summarize(pd.DataFrame()), self.out_path)
+        self.exports = export_configured(self.out_path)
+
+def read_statement_chunks(file_path, chunksize):
+    """Yield (chunk, first_row_index) for a CSV read `chunksize` rows at a time."""
+    offset = 0
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, dtype=statement_dtypes(file_path)):
+        chunk = chunk.reset_index(drop=True)
+        yield chunk, offset
+        offset += len(chunk)
+
+def label_bank_statement_chunks(file_path, chunksize, batch_size=None):
+    """
+    Streaming variant of label_bank_statement.
+    Reads the CSV `chunksize` rows at a time, labels each chunk and appends it
+    to the labeled Parquet output, yielding (labeled_chunk, first_row_index)
+    so downstream stages can start before the whole file is labeled.
+    Only one chunk is held in memory at a time.
+    """
+    writer = LabeledOutputWriter(file_path)
+    try:
+        for chunk, offset in read_statement_chunks(file_path, chunksize):
+            chunk, stats = label_chunk(chunk, batch_size=batch_size)
+            writer.write(chunk, stats)
+            print(f"[labeling_agent] Labeled rows {offset}-{offset + len(chunk) - 1}")
+            yield chunk, offset
+    finally:
+        writer.close()
 
-    log_action("Labeling Agent", "Labeled document", {"file": file_path, "output_csv": out_csv, "rows": len(df), "backend": MODEL_BACKEND})
-    return out_csv
+    log_action("Labeling Agent", "Labeled document", {"file": file_path, "output": writer.out_path, "exports": writer.exports, "backend": MODEL_BACKEND, "chunksize": chunksize, **writer.stats})
 
-labeling_agent = Agent(
+# built on first access (see core.lazy)
+__getattr__ = lazy_agent(
+    __name__, "labeling_agent",
     role="Labeling Agent",
     goal="Label and categorize fields in bank statements using rule + local LLM.",
     backstory="Hybrid labeling agent.",
@@ -1,5 +1,5 @@
 # agents/planner_agent.py
-from crewai import Agent
+from core.lazy import lazy_agent
 from database.logger import log_action
 
 def plan_task(user_query):
@@ -14,7 +14,9 @@ def plan_task(user_query):
     log_action("Planner Agent", "Plan created", {"query": user_query, "steps": steps})
     return steps
 
-planner_agent = Agent(
+# built on first access (see core.lazy)
+__getattr__ = lazy_agent(
+    __name__, "planner_agent",
     role="Planner Agent",
     goal="Break user queries into sequential audit subtasks.",
     backstory="Planner that decomposes audit workflows.",
@@ -1,55 +1,56 @@
 # agents/qa_generator_agent.py
-from crewai import Agent
+from core.lazy import lazy_agent
 import pandas as pd
-import os, json
+import os
+from core.qa_store import get_qa_store
+from core.labeled_store import read_labeled
 from database.logger import log_action
+from core.tracing import traced, count
 from dotenv import load_dotenv
 
 load_dotenv()
 
-QA_DIR = "datasets/qa_data"
-os.makedirs(QA_DIR, exist_ok=True)
-COMBINED_QA_PATH = os.path.join(QA_DIR, "combined_qa.json")
 
+def build_qa_pairs(df):
+    """Q&A pairs for the rows of a labeled DataFrame."""
+    if "DESCRIPTION" not in df or df.empty:
+        return []
+    desc = df["DESCRIPTION"]
+    keep = desc.notna() & (desc.astype(str) != "")
+    desc = desc[keep].astype(str)
+    category = df["CATEGORY"][keep].astype(str) if "CATEGORY" in df else ""
+    pairs = pd.DataFrame({
+        "question": "What type of transaction is '" + desc + "'?",
+        "answer": "The transaction '" + desc + "' belongs to the '" + category + "' category.",
+    })
+    return pairs.drop_duplicates().to_dict(orient="records")
 
-def generate_qa_from_labeled_data(json_path):
-    """Generate Q&A pairs from labeled bank data and append to a single cumulative file."""
-    df = pd.read_json(json_path)
-    qa_pairs = []
 
-    for _, row in df.iterrows():
-        desc = row.get("DESCRIPTION", "")
-        category = row.get("CATEGORY", "")
-        if not desc:
-            continue
-        question = f"What type of transaction is '{desc}'?"
-        answer = f"The transaction '{desc}' belongs to the '{category}' category."
-        qa_pairs.append({"question": question, "answer": answer})
+@traced("qa_store_append")
+def append_qa_pairs(qa_pairs, source=None):
+    """Add `qa_pairs` to the cumulative Q&A store; pairs already stored are skipped."""
+    store = get_qa_store()
+    added = store.add_many(qa_pairs, source=source)
+    count("pairs", len(qa_pairs))
+    count("added", added)
+    total = len(store)
 
-    # Load existing combined QA file
-    if os.path.exists(COMBINED_QA_PATH):
-        try:
-            with open(COMBINED_QA_PATH, "r") as f:
-                existing = json.load(f)
-        except Exception:
-            existing = []
-    else:
-        existing = []
+    log_action("QAGenerator Agent", "Appended new Q&A data", {"new": added, "duplicates": len(qa_pairs) - added, "total": total})
+    print(f"[qa_generator_agent] ✅ Appended {added} new Q&A pairs (total {total})")
 
-    # Append and deduplicate
-    existing.extend(qa_pairs)
-    unique_data = [dict(t) for t in {tuple(d.items()) for d in existing}]
+    return store.path
 
-    with open(COMBINED_QA_PATH, "w") as f:
-        json.dump(unique_data, f, indent=2)
 
-    log_action("QAGenerator Agent", "Appended new Q&A data", {"new": len(qa_pairs), "total": len(unique_data)})
-    print(f"[qa_generator_agent] ✅ Appended {len(qa_pairs)} new Q&A pairs (total {len(unique_data)})")
+@traced("qa_generation")
+def generate_qa_from_labeled_data(labeled_path):
+    """Generate Q&A pairs from labeled bank data and append them to the cumulative store."""
+    df = read_labeled(labeled_path, columns=["DESCRIPTION", "CATEGORY"])
+    return append_qa_pairs(build_qa_pairs(df), source=os.path.basename(labeled_path))
 
-    return COMBINED_QA_PATH
 
-
-qa_generator_agent = Agent(
+# built on first access (see core.lazy)
+__getattr__ = lazy_agent(
+    __name__, "qa_generator_agent",
     role="QA Generator Agent",
     goal="Generate and append Q&A pairs for audit data.",
     backstory="This agent creates incremental Q&A datasets for fine-tuning the local model.",
@@ -1,25 +1,26 @@
 # agents/reviewer_agent.py
-from crewai import Agent
-import pandas as pd
+from core.lazy import lazy_agent
 import os
 from database.logger import log_action
+from core.statement_summary import load_summary, ratios
 
 def simple_review_check(file_path):
     """
     Review labeled data for consistency and accuracy.
+    Reads the statement summary written at labeling time instead of the rows.
     Returns a structured JSON: {"accuracy": float, "comments": str}
     """
     try:
-        df = pd.read_csv(file_path)
+        summary = load_summary(file_path)
 
         # Basic rule-based quality metrics
-        total = len(df)
+        total = summary["rows"]
         if total == 0:
             return {"accuracy": 0.0, "comments": "Empty dataset."}
 
         # Check for missing categories
-        missing = df["CATEGORY"].isna().sum() if "CATEGORY" in df.columns else total
-        missing_ratio = missing / total
+        missing = summary["missing"]
+        missing_ratio = ratios(summary)["missing_ratio"]
 
         # Calculate an approximate accuracy
         accuracy = round(max(0.0, 1.0 - missing_ratio - 0.05), 2)
@@ -27,8 +28,11 @@ def simple_review_check(file_path):
 
         if missing_ratio > 0.1:
             comments.append("Too many unlabeled transactions.")
-        if any(df["CATEGORY"].str.lower().str.contains("other", na=False)):
+        if summary["other"]:
             comments.append("Contains generic 'Other' categories — may need tuning.")
+        balance = summary["balance"]
+        if balance["breaks"]:
+            comments.append(f"Balance does not carry over at {balance['breaks']} rows (first at row {balance['break_rows'][0]}).")
         if accuracy >= 0.9:
             comments.append("Excellent labeling quality.")
         elif accuracy >= 0.8:
@@ -37,7 +41,7 @@ def simple_review_check(file_path):
             comments.append("Poor labeling quality — fine-tuning recommended.")
 
         review = {"accuracy": accuracy, "comments": " ".join(comments)}
-        log_action("Reviewer Agent", "Review completed", {"accuracy": accuracy, "missing": missing})
+        log_action("Reviewer Agent", "Review completed", {"accuracy": accuracy, "missing": missing, "other": summary["other"], "balance_breaks": balance["breaks"]})
         print(f"[Reviewer Agent] ✅ Review complete — Accuracy: {accuracy}")
 
         return review
@@ -47,7 +51,9 @@ def simple_review_check(file_path):
         return {"accuracy": 0.0, "comments": f"Error during review: {e}"}
 
 
-reviewer_agent = Agent(
+# built on first access (see core.lazy)
+__getattr__ = lazy_agent(
+    __name__, "reviewer_agent",
     role="Reviewer Agent",
     goal="Review labeled data and provide feedback on model performance.",
     backstory="The Reviewer Agent checks data quality and decides if fine-tuning is needed.",
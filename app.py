@@ -1,20 +1,47 @@
 # app.py
 import streamlit as st
 import pandas as pd
-import os, json
-from crew_setup import run_audit_query
+import os, time
 from database.mongo_client import get_database
-from agents.fine_tuner_agent import fine_tune_local_model
-from agents.reviewer_agent import simple_review_check
+from core.jobs import get_job_runner, ACTIVE
+from core.qa_store import get_qa_store
+from core.tracing import breakdown
+from core.labeled_store import read_labeled
+from core.statement_summary import read_summary
+
+POLL_SECONDS = float(os.getenv("APP_POLL_SECONDS", 2))
 
 st.set_page_config(page_title="Audit AI", layout="wide")
 st.title("Local Audit Intelligence System")
 
-db = get_database()
+# Heavy resources are created once per server process and shared by every
+# session and rerun. Models, FAISS and agents are only loaded inside the job
+# workers, so the page renders without importing torch/transformers/crewai.
+# The work runs in the background; this script only submits jobs and polls them.
+runner = st.cache_resource(get_job_runner)()
+qa_store = st.cache_resource(get_qa_store)()
+
 st.sidebar.header("Controls")
 
 uploaded_file = st.sidebar.file_uploader("Upload bank CSV", type=["csv"])
 
+
+def show_job(job, label):
+    status = job["status"]
+    st.write(f"**{label}** `{job['id']}` — {status}" + (f" ({job['message']})" if job.get("message") else ""))
+    if status in ACTIVE:
+        st.progress(min(max(job.get("progress") or 0.0, 0.0), 1.0))
+        if st.button("Cancel", key=f"cancel-{job['id']}"):
+            runner.cancel(job["id"])
+            st.rerun()
+    elif status == "failed":
+        st.error(job.get("error") or "Job failed")
+    if job.get("trace") and status not in ACTIVE:
+        trace = job["trace"]
+        with st.expander(f"⏱ Stage timings ({trace['wall_s']:.1f}s wall, {trace['cpu_s']:.1f}s CPU)"):
+            st.dataframe(pd.DataFrame(breakdown(trace)), hide_index=True)
+
+
 # -----------------------------
 # Run Analysis and Q&A
 # -----------------------------
@@ -26,35 +53,47 @@ if st.sidebar.button("Run Analysis and Q&A"):
         os.makedirs("datasets", exist_ok=True)
         with open(path, "wb") as f:
             f.write(uploaded_file.getbuffer())
+        st.session_state["audit_job"] = runner.submit("audit", file_path=path)
 
-        result = run_audit_query(path)
+audit_job = runner.get(st.session_state["audit_job"]) if "audit_job" in st.session_state else None
+if audit_job:
+    show_job(audit_job, "Analysis")
+    if audit_job["status"] == "succeeded":
+        result = audit_job["result"]
         st.success("✅ Run complete!")
 
         st.subheader("📄 Labeled Data Preview")
-        df = pd.read_csv(result["labeled_file"])
-        st.dataframe(df.head())
+        df = read_labeled(result["labeled_file"], stop=5)
+        st.dataframe(df)
+
+        summary = read_summary(result["labeled_file"])
+        if summary:
+            st.subheader("📊 Statement Summary")
+            balance = summary["balance"]
+            st.caption(f"{summary['rows']} rows, {summary['date_from']} to {summary['date_to']}; {balance['breaks']} balance breaks in {balance['checked']} checked rows")
+            by_category, by_month = st.columns(2)
+            # an empty statement (or one with no categories) has no rows to tabulate
+            if summary["categories"]:
+                by_category.dataframe(pd.DataFrame.from_dict(summary["categories"], orient="index").sort_values("count", ascending=False))
+            if summary["months"]:
+                by_month.dataframe(pd.DataFrame.from_dict(summary["months"], orient="index"))
 
         if result.get("qa_file") and os.path.exists(result["qa_file"]):
             st.subheader("💬 Generated Q&A")
             try:
-                with open(result["qa_file"], "r") as f:
-                    qa_data = json.load(f)
-                st.json(qa_data[-5:])
+                st.json(qa_store.tail(5))
             except Exception as e:
-                st.error(f"Could not load Q&A JSON: {e}")
+                st.error(f"Could not load Q&A store: {e}")
 
-        # Run reviewer
         st.subheader("🔍 Review Summary")
-        review = simple_review_check(result["labeled_file"])
+        review = result.get("review")
         st.json(review)
 
         # ✅ Conditional fine-tuning button
         if review and review.get("accuracy", 1) < 0.85:
             st.warning("⚠ Review score is below threshold. Fine-tuning recommended.")
             if st.button("Run Fine-tuning for This Dataset"):
-                with st.spinner("Fine-tuning model for current dataset..."):
-                    out = fine_tune_local_model(mode="auto")
-                st.success(f"Fine-tuning complete. Model saved to {out}")
+                st.session_state["fine_tune_job"] = runner.submit("fine_tune", mode="auto")
         else:
             st.info("✅ Model performance is good. No fine-tuning needed.")
 
@@ -62,17 +101,35 @@ if st.sidebar.button("Run Analysis and Q&A"):
 # ✅ Global fine-tuning (manual)
 # -----------------------------
 if st.sidebar.button("Run Global Fine-tuning"):
-    st.sidebar.info("Starting global fine-tuning on all accumulated Q&A data...")
-    with st.spinner("Fine-tuning model on full dataset..."):
-        out = fine_tune_local_model(mode="global")
-    st.sidebar.success(f"Global fine-tuning finished. Model saved to {out}")
+    # single-flight: returns the running fine-tune instead of starting a second one
+    st.session_state["fine_tune_job"] = runner.submit("fine_tune", mode="global")
+    st.sidebar.info("Global fine-tuning on all accumulated Q&A data queued.")
+
+fine_tune_job = runner.get(st.session_state["fine_tune_job"]) if "fine_tune_job" in st.session_state else None
+if fine_tune_job:
+    show_job(fine_tune_job, "Fine-tuning")
+    if fine_tune_job["status"] == "succeeded":
+        st.success(f"Fine-tuning complete. Model saved to {fine_tune_job['result']}")
+
+# -----------------------------
+# Jobs
+# -----------------------------
+with st.sidebar.expander("Recent jobs"):
+    for job in runner.list(limit=10):
+        st.write(f"`{job['id']}` {job['kind']} — {job['status']} {round(100 * (job.get('progress') or 0))}%")
 
 # -----------------------------
 # Logs
 # -----------------------------
 if st.sidebar.button("Show Recent Logs"):
+    db = st.cache_resource(get_database)()
     logs = list(db.logs.find().sort("timestamp", -1).limit(10))
     st.subheader("🧾 Recent Logs")
     for l in logs:
         st.write(f"[{l['timestamp']}] {l['agent']} → {l['action']}")
-        st.json(l["details"])
\ No newline at end of file
+        st.json(l["details"])
+
+# keep polling while this session has work in flight
+if any(job and job["status"] in ACTIVE for job in (audit_job, fine_tune_job)):
+    time.sleep(POLL_SECONDS)
+    st.rerun()
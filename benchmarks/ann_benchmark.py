@@ -0,0 +1,108 @@
+# benchmarks/ann_benchmark.py
+"""
+Recall@k versus latency of the ANN index types against the exact Flat baseline.
+
+    python -m benchmarks.ann_benchmark --rows 1000000 --dim 384 --out outputs/bench/ann.json
+
+By default vectors are synthetic (clustered Gaussian, normalized, shaped like
+MiniLM embeddings). Pass --csv to embed real transaction text instead.
+"""
+import argparse, json, os, time
+import numpy as np
+import faiss
+from retrieval.faiss_store import build_index, search_params
+
+
+def synthetic_vectors(rows, dim, clusters=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, rows)] + 0.3 * rng.standard_normal((rows, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def csv_vectors(path, rows):
+    import pandas as pd
+    from retrieval.embeddings import embed_texts
+    df = pd.read_csv(path, nrows=rows)
+    texts = (df["DATE"].astype(str) + " " + df["DESCRIPTION"].astype(str)).tolist()
+    vectors = np.ascontiguousarray(embed_texts(texts), dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def timed_search(index, queries, k, params):
+    start = time.perf_counter()
+    _, ids = index.search(queries, k, params=params)
+    return ids, 1000 * (time.perf_counter() - start) / len(queries)
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found.tolist(), truth.tolist()))
+    return hits / (len(truth) * k)
+
+
+def run(vectors, queries, k, index_types, nprobes, ef_searches):
+    results = []
+    start = time.perf_counter()
+    flat = build_index("flat", vectors)
+    truth, flat_ms = timed_search(flat, queries, k, None)
+    results.append({"index": "flat", "build_s": round(time.perf_counter() - start, 2), "recall": 1.0, "ms_per_query": round(flat_ms, 3)})
+    del flat
+
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(index_type, vectors)
+        build_s = round(time.perf_counter() - start, 2)
+        sweep = ef_searches if index_type == "hnsw" else nprobes
+        for value in sweep:
+            params = search_params(index, nprobe=value, ef_search=value)
+            found, ms = timed_search(index, queries, k, params)
+            results.append({
+                "index": index_type,
+                "build_s": build_s,
+                "efSearch" if index_type == "hnsw" else "nprobe": value,
+                "recall": round(recall_at_k(found, truth), 4),
+                "ms_per_query": round(ms, 3),
+                "speedup": round(flat_ms / ms, 2) if ms else None,
+            })
+        del index
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--csv", help="embed DESCRIPTION rows from this CSV instead of synthetic vectors")
+    parser.add_argument("--types", default="hnsw,ivf_flat,ivf_pq")
+    parser.add_argument("--nprobe", default="1,4,16,64")
+    parser.add_argument("--ef-search", default="16,32,64,128")
+    parser.add_argument("--out", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    vectors = csv_vectors(args.csv, args.rows) if args.csv else synthetic_vectors(args.rows, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    faiss.normalize_L2(queries)
+
+    report = {
+        "rows": len(vectors),
+        "dim": vectors.shape[1],
+        "k": args.k,
+        "results": run(
+            vectors, queries, args.k,
+            [t for t in args.types.split(",") if t],
+            [int(v) for v in args.nprobe.split(",")],
+            [int(v) for v in args.ef_search.split(",")],
+        ),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
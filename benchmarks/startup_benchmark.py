@@ -0,0 +1,60 @@
+# benchmarks/startup_benchmark.py
+"""
+Cold-start import time of the app and the CLI entry point.
+
+    python -m benchmarks.startup_benchmark --runs 5 --out outputs/bench/startup.json
+
+Every run imports the target in a fresh interpreter and records the wall time
+of the import plus which heavy libraries it pulled in (they should only load
+on first use of a model, the FAISS store or an agent).
+"""
+import argparse, json, os, statistics, subprocess, sys
+
+TARGETS = ("app", "crew_setup")
+HEAVY = ("torch", "transformers", "sentence_transformers", "peft", "datasets", "crewai", "faiss", "optimum")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {target}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(target, runs):
+    code = _PROBE.format(target=target, heavy=HEAVY)
+    times, loaded, error = [], [], None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=os.getcwd())
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+            break
+        # the probe prints last; anything before it is the module's own output
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        loaded = result["loaded"]
+    if error:
+        return {"target": target, "error": error}
+    return {
+        "target": target,
+        "runs": runs,
+        "median_s": round(statistics.median(times), 3),
+        "min_s": round(min(times), 3),
+        "heavy_modules_loaded": loaded,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--out", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = {"python": sys.version.split()[0], "results": [measure(t, args.runs) for t in args.targets.split(",") if t]}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,306 @@
+# benchmarks/suite.py
+"""
+Throughput / latency benchmark of every pipeline stage on synthetic statements.
+
+    python -m benchmarks.suite --rows 100000 --out outputs/bench/suite.json
+    python -m benchmarks.suite --tiny --stages label_rules,embed,index,retrieve
+    python -m benchmarks.suite --baseline outputs/bench/suite.json   # exit 1 on regression
+
+Stages: label_rules (label_bank_statement with the LLM stubbed out),
+label_llm (real model on --llm-rows rows), embed (embed_texts), index
+(index_documents + checkpoint), retrieve (per-query top-k), answer (a
+question checklist through answer_queries, compared with looping
+answer_query), qa (generate_qa_from_labeled_data) and fine_tune (one
+fine_tune_local_model step). Each stage runs in its own interpreter so its
+peak RSS is its own, against stores under --workdir instead of the real ones. --tiny swaps in
+small models so the suite runs quickly offline once they are cached.
+
+The JSON report has rows/sec, p50/p99 latency of the stage's unit of work
+(a call, batch or query) and peak RSS per stage. With --baseline, stages
+whose rows/sec drops or p99 grows by more than --tolerance are reported as
+regressions.
+"""
+import argparse, json, os, resource, shutil, subprocess, sys, time
+
+STAGES = ("label_rules", "label_llm", "embed", "index", "retrieve", "answer", "qa", "fine_tune")
+TINY_MODELS = {
+    "MODEL_NAME": "google/t5-efficient-tiny",
+    "EMBEDDING_MODEL": "sentence-transformers/paraphrase-MiniLM-L3-v2",
+}
+BATCH_ROWS = {"embed": 1024, "index": 10000}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def _summary(stage, rows, seconds, latencies, extra=None):
+    return {
+        "stage": stage,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "p50_ms": round(1000 * _percentile(latencies, 50), 3) if latencies else None,
+        "p99_ms": round(1000 * _percentile(latencies, 99), 3) if latencies else None,
+        "calls": len(latencies),
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        **(extra or {}),
+    }
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+# -------------------------------
+# Stages (run in a child process)
+# -------------------------------
+def _labeling(workdir):
+    import agents.labeling_agent as la
+    la.LABELED_DIR = os.path.join(workdir, "labeled")
+    return la
+
+
+def stage_label_rules(args):
+    la = _labeling(args.workdir)
+    # every rule miss gets "Other" instantly: measures rules, I/O and bookkeeping only
+    la.label_batch_with_llm = lambda descriptions, batch_size=None: ["Other"] * len(descriptions)
+    runs = [_timed(la.label_bank_statement, args.statement) for _ in range(args.repeat)]
+    latencies = [seconds for _, seconds in runs]
+    labeled_mb = round(os.path.getsize(runs[-1][0]) / 2**20, 2)
+    return _summary("label_rules", args.rows * args.repeat, sum(latencies), latencies, {"labeled_mb": labeled_mb})
+
+
+def stage_label_llm(args):
+    la = _labeling(args.workdir)
+    from core.label_cache import get_label_cache
+    la.get_model()  # load outside the timed region
+    latencies = []
+    for _ in range(args.repeat):
+        get_label_cache().clear()
+        latencies.append(_timed(la.label_bank_statement, args.llm_statement)[1])
+    return _summary("label_llm", args.llm_rows * args.repeat, sum(latencies), latencies, {"model": os.getenv("MODEL_NAME")})
+
+
+def _texts(args, rows):
+    import pandas as pd
+    from retrieval.rag import chunk_text_rows
+    df = pd.read_csv(args.statement, nrows=rows)
+    return chunk_text_rows(df.to_dict(orient="records"), "bench")
+
+
+def stage_embed(args):
+    import numpy as np
+    from retrieval.embeddings import embed_texts, get_embedding_model
+    texts, _ = _texts(args, args.embed_rows)
+    get_embedding_model()
+    latencies, vectors = [], []
+    for start in range(0, len(texts), BATCH_ROWS["embed"]):
+        out, seconds = _timed(embed_texts, texts[start:start + BATCH_ROWS["embed"]], use_cache=False)
+        vectors.append(out)
+        latencies.append(seconds)
+    np.save(os.path.join(args.workdir, "embeddings.npy"), np.vstack(vectors).astype("float32"))
+    return _summary("embed", len(texts), sum(latencies), latencies, {"model": os.getenv("EMBEDDING_MODEL"), "batch_rows": BATCH_ROWS["embed"]})
+
+
+def _vectors(args, rows):
+    import numpy as np
+    path = os.path.join(args.workdir, "embeddings.npy")
+    base = np.load(path) if os.path.exists(path) else np.random.default_rng(0).standard_normal((min(rows, 10000), 384)).astype("float32")
+    # tile the embedded rows (plus noise) up to `rows` so indexing can scale past what was embedded
+    reps = -(-rows // len(base))
+    vectors = np.tile(base, (reps, 1))[:rows]
+    return vectors + 0.01 * np.random.default_rng(1).standard_normal(vectors.shape).astype("float32")
+
+
+def stage_index(args):
+    from retrieval.faiss_store import get_store, index_documents
+    shutil.rmtree(os.path.join(args.workdir, "faiss"), ignore_errors=True)
+    vectors = _vectors(args, args.rows)
+    metadatas = [{"doc_id": "bench", "row_index": i, "description": "", "category": ""} for i in range(len(vectors))]
+    latencies = []
+    for start in range(0, len(vectors), BATCH_ROWS["index"]):
+        end = start + BATCH_ROWS["index"]
+        latencies.append(_timed(index_documents, None, metadatas[start:end], vectors[start:end])[1])
+    _, flush_seconds = _timed(get_store().flush)
+    return _summary("index", len(vectors), sum(latencies) + flush_seconds, latencies, {
+        "batch_rows": BATCH_ROWS["index"], "checkpoint_seconds": round(flush_seconds, 3), "index_type": os.getenv("FAISS_INDEX_TYPE", "flat"),
+    })
+
+
+def stage_retrieve(args):
+    import numpy as np
+    from retrieval.faiss_store import get_store, retrieve
+    store = get_store()
+    if store.index is None:
+        raise RuntimeError("run the index stage first")
+    rng = np.random.default_rng(2)
+    queries = _vectors(args, min(args.rows, 10000))[rng.choice(min(args.rows, 10000), args.queries)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype("float32")
+    latencies = [_timed(retrieve, q, 5)[1] for q in queries]
+    return _summary("retrieve", len(queries), sum(latencies), latencies, {"index_vectors": store.index.ntotal})
+
+
+def stage_answer(args):
+    import pandas as pd
+    from agents.executor_agent import answer_query, answer_queries
+    from retrieval.faiss_store import get_store
+    if get_store().index is None:
+        raise RuntimeError("run the index stage first")
+    descriptions = pd.read_csv(args.statement, nrows=args.questions * 10)["DESCRIPTION"].drop_duplicates()
+    questions = [f"How much was spent on {d}?" for d in descriptions[:args.questions]]
+    answer_query(questions[0])  # load both models outside the timed region
+    loop = [_timed(answer_query, q)[1] for q in questions]
+    batch, seconds = _timed(answer_queries, questions)
+    loop_summary = _summary("answer_loop", len(questions), sum(loop), loop)
+    return _summary("answer", len(questions), seconds, [r["latency_s"] for r in batch], {
+        "loop_rows_per_sec": loop_summary["rows_per_sec"],
+        "loop_p50_ms": loop_summary["p50_ms"],
+        "speedup": round(sum(loop) / seconds, 2) if seconds else None,
+    })
+
+
+def stage_qa(args):
+    import core.qa_store as qs
+    from agents.qa_generator_agent import generate_qa_from_labeled_data
+    labeled_file = _labeling(args.workdir).labeled_output_path(args.statement)
+    if not os.path.exists(labeled_file):
+        stage_label_rules(argparse.Namespace(**{**vars(args), "repeat": 1}))
+    latencies = []
+    for _ in range(args.repeat):
+        # a fresh store each time, so every repeat inserts instead of only deduplicating
+        if os.path.exists(qs.STORE_PATH):
+            os.remove(qs.STORE_PATH)
+        qs._store = qs.QAStore(qs.STORE_PATH, qa_dir=None)
+        latencies.append(_timed(generate_qa_from_labeled_data, labeled_file)[1])
+    return _summary("qa", args.rows * args.repeat, sum(latencies), latencies)
+
+
+def stage_fine_tune(args):
+    import core.adapters as adapters
+    import core.qa_store as qs
+    import agents.fine_tuner_agent as ft
+    ft.FINETUNE_DIR = os.path.join(args.workdir, "fine_tuned")
+    ft.RUNS_DIR = os.path.join(args.workdir, "finetune_runs")
+    if not os.path.exists(qs.STORE_PATH):
+        stage_qa(argparse.Namespace(**{**vars(args), "repeat": 1}))
+    qs._store = qs.QAStore(qs.STORE_PATH, qa_dir=None)
+    _, seconds = _timed(ft.fine_tune_local_model, mode="global")
+    info = adapters.active_version() or {}
+    steps = ft.MAX_STEPS if ft.MAX_STEPS > 0 else None
+    samples = ft.BATCH_SIZE * ft.GRAD_ACCUM * steps if steps else info.get("samples", 0)
+    return _summary("fine_tune", samples, seconds, [seconds], {
+        "steps": steps, "model": os.getenv("MODEL_NAME"), "train_samples_per_sec": info.get("samples_per_sec"),
+    })
+
+
+# -------------------------------
+# Orchestration
+# -------------------------------
+def _stage_env(args):
+    w = args.workdir
+    env = {
+        **os.environ,
+        "FAISS_INDEX_PATH": os.path.join(w, "faiss", "faiss_index.idx"),
+        "FAISS_META_PATH": os.path.join(w, "faiss", "faiss_meta.db"),
+        "FAISS_FLUSH_SECONDS": "0",
+        "LABEL_CACHE_PATH": os.path.join(w, "label_cache.db"),
+        "EMBEDDING_CACHE_DIR": os.path.join(w, "embeddings"),
+        "QA_STORE_PATH": os.path.join(w, "qa_store.db"),
+        "ADAPTER_VERSIONS_DIR": os.path.join(w, "adapters"),
+        "MODEL_ADAPTER": "none",
+        "FINETUNE_MAX_STEPS": str(args.fine_tune_steps),
+        "FINETUNE_TOKENIZED_CACHE": os.path.join(w, "tokenized"),
+    }
+    if args.tiny:
+        env.update(TINY_MODELS)
+    return env
+
+
+def _result_path(workdir, stage):
+    return os.path.join(workdir, f"result_{stage}.json")
+
+
+def run_stage(stage, args):
+    cmd = [sys.executable, "-m", "benchmarks.suite", "--run-stage", stage,
+           "--workdir", args.workdir, "--rows", str(args.rows), "--llm-rows", str(args.llm_rows),
+           "--embed-rows", str(args.embed_rows), "--queries", str(args.queries), "--questions", str(args.questions), "--repeat", str(args.repeat)]
+    result_path = _result_path(args.workdir, stage)
+    if os.path.exists(result_path):
+        os.remove(result_path)
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=_stage_env(args))
+    if proc.returncode != 0 or not os.path.exists(result_path):
+        tail = (proc.stderr.strip().splitlines() or [f"exit code {proc.returncode}"])[-1]
+        return {"stage": stage, "error": tail}
+    # a file rather than stdout: the modules print their own output, including at exit
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance):
+    """Stages that got slower than `baseline` by more than `tolerance` (a fraction)."""
+    previous = {r["stage"]: r for r in baseline.get("results", []) if "error" not in r}
+    regressions = []
+    for r in results:
+        old = previous.get(r["stage"])
+        if old is None or "error" in r:
+            continue
+        if old.get("rows_per_sec") and r.get("rows_per_sec") and r["rows_per_sec"] < old["rows_per_sec"] * (1 - tolerance):
+            regressions.append({"stage": r["stage"], "metric": "rows_per_sec", "baseline": old["rows_per_sec"], "current": r["rows_per_sec"]})
+        if old.get("p99_ms") and r.get("p99_ms") and r["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            regressions.append({"stage": r["stage"], "metric": "p99_ms", "baseline": old["p99_ms"], "current": r["p99_ms"]})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="statement rows for rules labeling, indexing and Q&A")
+    parser.add_argument("--llm-rows", type=int, default=1000, help="statement rows for the LLM labeling stage")
+    parser.add_argument("--embed-rows", type=int, default=20000, help="rows embedded (indexing tiles these up to --rows)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=100, help="checklist size for the answer stage")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fine-tune-steps", type=int, default=1)
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--tiny", action="store_true", help="use small local models: " + ", ".join(TINY_MODELS.values()))
+    parser.add_argument("--workdir", default="outputs/bench/suite")
+    parser.add_argument("--out", help="write the JSON report here as well as stdout")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--run-stage", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.statement = os.path.join(args.workdir, "statement.csv")
+    args.llm_statement = os.path.join(args.workdir, "statement_llm.csv")
+
+    if args.run_stage:
+        result = globals()[f"stage_{args.run_stage}"](args)
+        with open(_result_path(args.workdir, args.run_stage), "w") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    from benchmarks.synthetic import write_statement
+    os.makedirs(args.workdir, exist_ok=True)
+    write_statement(args.statement, args.rows)
+    write_statement(args.llm_statement, args.llm_rows, seed=1)
+
+    report = {
+        "rows": args.rows,
+        "tiny": args.tiny,
+        "cpu_count": os.cpu_count(),
+        "results": [run_stage(s, args) for s in args.stages.split(",") if s],
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report["results"], json.load(f), args.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+    print(json.dumps(report, indent=2))
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(exit_code)
@@ -0,0 +1,103 @@
+# benchmarks/synthetic.py
+"""
+Synthetic bank statements shaped like datasets/bank_transactions.csv
+(DATE, DESCRIPTION, DEBIT, CREDIT, BALANCE).
+
+    python -m benchmarks.synthetic --rows 1000000 --out outputs/bench/statement_1m.csv
+
+Rows are generated and written in vectorized chunks, so millions of rows
+take seconds and bounded memory. `unknown_ratio` controls the share of
+descriptions no category rule matches (the rows that go to the LLM).
+"""
+import argparse, os
+import numpy as np
+import pandas as pd
+
+# (description template, is_credit, typical amount); {ref} becomes a reference number
+KNOWN = [
+    ("ATM Withdrawal {ref}", False, 500),
+    ("Cash Withdrawal Branch {ref}", False, 2000),
+    ("Salary Credit", True, 45000),
+    ("Amazon Purchase {ref}", False, 1200),
+    ("Flipkart Order {ref}", False, 900),
+    ("Myntra Order {ref}", False, 1500),
+    ("Interest Credit", True, 50),
+]
+UNKNOWN = [
+    ("UPI/{ref}/Swiggy", False, 350),
+    ("UPI/{ref}/Zomato", False, 420),
+    ("NEFT Rent Transfer {ref}", False, 15000),
+    ("Electricity Bill BESCOM {ref}", False, 1800),
+    ("Mobile Recharge Airtel", False, 299),
+    ("Netflix Subscription", False, 649),
+    ("Uber Trip {ref}", False, 260),
+    ("Insurance Premium LIC {ref}", False, 5200),
+    ("IMPS Refund {ref}", True, 700),
+    ("Dividend Credit INFY", True, 1100),
+]
+
+
+_POOL = KNOWN + UNKNOWN
+_PREFIX = pd.Series([t.split("{ref}")[0] for t, _, _ in _POOL])
+_SUFFIX = pd.Series([t.split("{ref}")[1] if "{ref}" in t else "" for t, _, _ in _POOL])
+_HAS_REF = np.array(["{ref}" in t for t, _, _ in _POOL])
+_CREDIT = np.array([c for _, c, _ in _POOL])
+_AMOUNT = np.array([a for _, _, a in _POOL], dtype=float)
+
+
+def _descriptions(rng, n, unknown_ratio, ref_ratio):
+    unknown = rng.random(n) < unknown_ratio
+    idx = np.where(unknown, len(KNOWN) + rng.integers(0, len(UNKNOWN), n), rng.integers(0, len(KNOWN), n))
+    # a small pool of reference numbers keeps the unique-description count realistic
+    refs = pd.Series(rng.integers(100000, 100000 + max(1, int(n * ref_ratio)), n).astype(str))
+    refs = refs.where(_HAS_REF[idx], "")
+    desc = _PREFIX[idx].reset_index(drop=True) + refs + _SUFFIX[idx].reset_index(drop=True)
+    return desc.str.strip(), _CREDIT[idx], _AMOUNT[idx]
+
+
+def generate_statement(rows, **kwargs):
+    """One synthetic statement as a DataFrame (see iter_statement_chunks for options)."""
+    return next(iter_statement_chunks(rows, rows or 1, **kwargs), pd.DataFrame())
+
+
+def iter_statement_chunks(rows, chunk_rows=100000, seed=0, unknown_ratio=0.3, ref_ratio=0.01, per_day=500,
+                          start_date="2020-01-01", opening_balance=50000.0):
+    """Yield the statement in DataFrame chunks of `chunk_rows` with a running balance."""
+    rng = np.random.default_rng(seed)
+    balance = opening_balance
+    day = pd.Timestamp(start_date)
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        desc, credit, typical = _descriptions(rng, n, unknown_ratio, ref_ratio)
+        amounts = np.round(typical * rng.lognormal(0, 0.4, n), 2)
+        signed = np.where(credit, amounts, -amounts)
+        balances = balance + np.cumsum(signed)
+        balance = float(balances[-1])
+        # about `per_day` transactions per day, in date order
+        days = day + pd.to_timedelta(np.sort(rng.integers(0, max(1, n // per_day), n)), unit="D")
+        day = days[-1]
+        yield pd.DataFrame({
+            "DATE": days.strftime("%Y-%m-%d"),
+            "DESCRIPTION": desc.values,
+            "DEBIT": np.where(credit, np.nan, amounts),
+            "CREDIT": np.where(credit, amounts, np.nan),
+            "BALANCE": np.round(balances, 2),
+        })
+
+
+def write_statement(path, rows, chunk_rows=100000, **kwargs):
+    """Write a synthetic statement CSV of `rows` rows and return its path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    for i, chunk in enumerate(iter_statement_chunks(rows, chunk_rows, **kwargs)):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--out", default="outputs/bench/statement.csv")
+    parser.add_argument("--unknown-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(write_statement(args.out, args.rows, seed=args.seed, unknown_ratio=args.unknown_ratio))
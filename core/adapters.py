@@ -0,0 +1,155 @@
+# core/adapters.py
+"""
+Versioned LoRA adapters.
+
+    python -m core.adapters list
+    python -m core.adapters rollback [--version v0003]
+
+Every fine-tune is saved as its own version under ADAPTER_VERSIONS_DIR
+together with the Q&A watermark it was trained up to; promoting a version
+copies its files next to the serving adapter path (models/fine_tuned) and
+atomically points that path, a symlink, at the copy; the model loader
+serves it unless MODEL_ADAPTER says otherwise.
+"""
+import argparse, json, os, shutil, tempfile, threading
+from datetime import datetime
+from dotenv import load_dotenv
+load_dotenv()
+
+VERSIONS_DIR = os.getenv("ADAPTER_VERSIONS_DIR", "models/adapters")
+SERVING_DIR = os.getenv("ADAPTER_SERVING_DIR", "models/fine_tuned")
+# trainer leftovers that are not part of a saved adapter
+_SKIP = ("checkpoint-", "runs", "logs")
+
+_lock = threading.Lock()
+
+
+def _registry_path():
+    return os.path.join(VERSIONS_DIR, "registry.json")
+
+
+def _read_registry():
+    try:
+        with open(_registry_path(), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"active": None, "history": [], "versions": {}}
+
+
+def _write_registry(registry):
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    tmp = _registry_path() + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp, _registry_path())
+
+
+def list_versions():
+    """{version: info} of every saved adapter, plus which one is active."""
+    registry = _read_registry()
+    return {"active": registry["active"], "versions": registry["versions"]}
+
+
+def active_version():
+    """Info of the promoted adapter (None if no version was promoted yet)."""
+    registry = _read_registry()
+    return registry["versions"].get(registry["active"]) if registry["active"] else None
+
+
+def save_version(model, tokenizer, info):
+    """Save a trained adapter as a new version; `info` records how it was trained."""
+    with _lock:
+        registry = _read_registry()
+        number = max((int(v[1:]) for v in registry["versions"]), default=0) + 1
+        version = f"v{number:04d}"
+        path = os.path.join(VERSIONS_DIR, version)
+        model.save_pretrained(path)
+        tokenizer.save_pretrained(path)
+        registry["versions"][version] = {
+            **info,
+            "version": version,
+            "path": path,
+            "parent": registry["active"],
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        _write_registry(registry)
+    return version
+
+
+def _swap_in(version, source, serving_dir):
+    """
+    Copy `source` into a new sibling directory and point the `serving_dir`
+    symlink at it with one rename, so a loader sees either the old or the
+    new version, never a mix. The copy it replaced is kept until the next
+    swap, for loaders still reading it.
+    """
+    parent, base = os.path.split(os.path.abspath(serving_dir))
+    prefix = f".{base}-"
+    os.makedirs(parent, exist_ok=True)
+    target = tempfile.mkdtemp(prefix=f"{prefix}{version}-", dir=parent)
+    for name in os.listdir(source):
+        if not name.startswith(_SKIP) and os.path.isfile(os.path.join(source, name)):
+            shutil.copyfile(os.path.join(source, name), os.path.join(target, name))
+    previous = os.path.realpath(serving_dir) if os.path.islink(serving_dir) else None
+    if os.path.isdir(serving_dir) and not os.path.islink(serving_dir):
+        # a plain directory from before versioned serving; moved aside once
+        previous = os.path.join(parent, f"{prefix}unversioned")
+        os.rename(serving_dir, previous)
+    link = os.path.join(parent, f"{prefix}link.tmp")
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(target), link)
+    os.replace(link, serving_dir)
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if name.startswith(prefix) and path not in (target, previous) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _activate(registry, version, serving_dir):
+    if version not in registry["versions"]:
+        raise ValueError(f"Unknown adapter version: {version}")
+    _swap_in(version, registry["versions"][version]["path"], serving_dir)
+    registry["active"] = version
+    _write_registry(registry)
+    print(f"[adapters] Active adapter version {version} ({serving_dir})")
+    from core.model_loader import swap_adapter
+    swap_adapter(serving_dir)
+    return version
+
+
+def promote(version, serving_dir=SERVING_DIR):
+    """Make `version` the serving adapter and hot-swap it into the loaded model."""
+    with _lock:
+        registry = _read_registry()
+        registry["history"].append(version)
+        return _activate(registry, version, serving_dir)
+
+
+def rollback(version=None, serving_dir=SERVING_DIR):
+    """
+    Undo the last promotion, going back to the previously served version,
+    or serve a specific `version`.
+    """
+    if version is not None:
+        return promote(version, serving_dir)
+    with _lock:
+        registry = _read_registry()
+        if len(registry["history"]) < 2:
+            raise ValueError("No earlier adapter version to roll back to")
+        registry["history"].pop()
+        return _activate(registry, registry["history"][-1], serving_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["list", "rollback", "promote"])
+    parser.add_argument("--version")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print(json.dumps(list_versions(), indent=2))
+    elif args.command == "rollback":
+        rollback(args.version)
+    else:
+        promote(args.version)
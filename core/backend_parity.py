@@ -0,0 +1,64 @@
+# core/backend_parity.py
+"""
+Compare a quantized inference backend against the float32 reference.
+
+    python -m core.backend_parity --backend transformers-int8 --csv datasets/bank_transactions.csv
+
+Runs the labeling prompt for every unique description through both backends
+and reports label agreement, latency and load-time memory.
+"""
+import argparse, json, time
+import pandas as pd
+from core.model_loader import get_model, generate_batch_with_model, registry_stats, LOCAL_BACKENDS
+
+
+def _label_prompt(description):
+    from agents.labeling_agent import build_label_prompt
+    return build_label_prompt(description)
+
+
+def _run(backend, prompts, batch_size, max_new_tokens):
+    model, tokenizer = get_model(backend=backend)
+    start = time.perf_counter()
+    outputs = generate_batch_with_model(model, tokenizer, prompts, max_new_tokens=max_new_tokens, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return [o.split("\n")[0].strip() for o in outputs], elapsed
+
+
+def check_backend_parity(prompts, backend="transformers-int8", reference="transformers", batch_size=16, max_new_tokens=32):
+    """
+    Generate `prompts` on `reference` and `backend`.
+    Returns a report with the agreement ratio, per-backend latency and the
+    prompts whose outputs differ.
+    """
+    ref_out, ref_time = _run(reference, prompts, batch_size, max_new_tokens)
+    out, elapsed = _run(backend, prompts, batch_size, max_new_tokens)
+    mismatches = [
+        {"prompt": p, reference: a, backend: b}
+        for p, a, b in zip(prompts, ref_out, out) if a != b
+    ]
+    loaded = {m["backend"]: m for m in registry_stats()["models"]}
+    return {
+        "samples": len(prompts),
+        "agreement": round(1 - len(mismatches) / len(prompts), 4) if prompts else 1.0,
+        "latency_ms_per_sample": {
+            reference: round(1000 * ref_time / max(len(prompts), 1), 2),
+            backend: round(1000 * elapsed / max(len(prompts), 1), 2),
+        },
+        "speedup": round(ref_time / elapsed, 2) if elapsed else None,
+        "load_rss_delta_mb": {b: loaded[b]["rss_delta_mb"] for b in (reference, backend) if b in loaded},
+        "mismatches": mismatches,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="transformers-int8", choices=[b for b in LOCAL_BACKENDS if b != "transformers"])
+    parser.add_argument("--csv", default="datasets/bank_transactions.csv")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    descriptions = pd.read_csv(args.csv, usecols=["DESCRIPTION"])["DESCRIPTION"].dropna().astype(str).unique()[:args.limit]
+    report = check_backend_parity([_label_prompt(d) for d in descriptions], backend=args.backend, batch_size=args.batch_size)
+    print(json.dumps(report, indent=2))
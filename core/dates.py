@@ -0,0 +1,33 @@
+# core/dates.py
+"""
+Statement dates: ISO or day-first, with or without a time after the date.
+iso_date() parses one value, parse_dates() a whole column in one pass per
+format; both accept the same DATE_FORMATS.
+"""
+from datetime import datetime
+import pandas as pd
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d")
+
+
+def iso_date(value):
+    """YYYY-MM-DD for a statement date, "" if it cannot be parsed."""
+    text = str(value or "").strip()[:10]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return ""
+
+
+def parse_dates(values):
+    """datetime64 Series for a Series of statement dates, NaT where they cannot be parsed."""
+    text = values.astype(str).str.strip().str[:10]
+    dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for fmt in DATE_FORMATS:
+        missing = dates.isna()
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(text[missing], format=fmt, errors="coerce")
+    return dates
@@ -0,0 +1,296 @@
+# core/jobs.py
+import os, json, sqlite3, threading, time, traceback, uuid, importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from core.tracing import trace_run
+from dotenv import load_dotenv
+load_dotenv()
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "outputs/jobs/jobs.db")
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", 2))
+
+# Job kinds run in worker processes, so they are referenced by import path.
+JOB_KINDS = {
+    "audit": "crew_setup:run_audit_job",
+    "fine_tune": "agents.fine_tuner_agent:fine_tune_local_model",
+}
+# kinds that may only have one queued/running job at a time; audits may run
+# side by side, but take turns writing the index (faiss_store.exclusive_writer)
+SINGLE_FLIGHT = {"fine_tune"}
+
+ACTIVE = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _connect(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " id TEXT PRIMARY KEY,"
+        " kind TEXT NOT NULL,"
+        " args TEXT,"
+        " dedup_key TEXT,"
+        " status TEXT NOT NULL,"
+        " progress REAL DEFAULT 0,"
+        " message TEXT,"
+        " result TEXT,"
+        " error TEXT,"
+        " cancel_requested INTEGER DEFAULT 0,"
+        " pid INTEGER,"
+        " owner_pid INTEGER,"
+        " created_at TEXT,"
+        " started_at TEXT,"
+        " finished_at TEXT,"
+        " trace TEXT)"
+    )
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if "trace" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN trace TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, dedup_key)")
+    # at most one active job per dedup_key, enforced by SQLite so app
+    # processes submitting at the same time cannot both get one in
+    try:
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS jobs_single_flight ON jobs(dedup_key)"
+            " WHERE dedup_key IS NOT NULL AND status IN ('queued', 'running')"
+        )
+    except sqlite3.IntegrityError:
+        # a table from before the index already has duplicates; they finish on their own
+        print("[jobs] Duplicate active jobs in the table, single-flight index not created yet")
+    conn.commit()
+    return conn
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _row_to_job(cursor, row):
+    job = {col[0]: value for col, value in zip(cursor.description, row)}
+    for key in ("args", "result", "trace"):
+        if job.get(key):
+            job[key] = json.loads(job[key])
+    return job
+
+
+# -------------------------------
+# Worker side
+# -------------------------------
+_current = {"job_id": None, "conn": None}
+
+
+def _init_worker(threads):
+    # give every worker an equal share of the cores so concurrent jobs do not
+    # oversubscribe each other
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def report_progress(fraction=None, message=None):
+    """
+    Record progress of the job running in this process and raise
+    JobCancelled if it was cancelled. Does nothing outside a job, so work
+    functions can call it unconditionally.
+    """
+    job_id, conn = _current["job_id"], _current["conn"]
+    if job_id is None:
+        return
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET progress = COALESCE(?, progress), message = COALESCE(?, message) WHERE id = ?",
+            (fraction, message, job_id),
+        )
+    (cancel,) = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if cancel:
+        raise JobCancelled(job_id)
+
+
+def _run_job(db_path, job_id, target, kwargs):
+    conn = _connect(db_path)
+    try:
+        with conn:
+            started = conn.execute(
+                "UPDATE jobs SET status = 'running', pid = ?, started_at = ? WHERE id = ? AND status = 'queued' AND cancel_requested = 0",
+                (os.getpid(), _now(), job_id),
+            ).rowcount
+        if not started:
+            with conn:
+                conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'", (_now(), job_id))
+            return
+        _current.update(job_id=job_id, conn=conn)
+        module, name = target.split(":")
+        # per-stage timings of the job are kept with its row (see core.tracing)
+        with trace_run(name, run_id=job_id) as trace:
+            try:
+                result = getattr(importlib.import_module(module), name)(**kwargs)
+                status, payload, error = "succeeded", json.dumps(result, default=str), None
+            except JobCancelled:
+                status, payload, error = "cancelled", None, None
+            except Exception:
+                status, payload, error = "failed", None, traceback.format_exc()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, trace = ?,"
+                " progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END WHERE id = ?",
+                (status, payload, error, _now(), json.dumps(trace.summary()), status, job_id),
+            )
+    finally:
+        _current.update(job_id=None, conn=None)
+        conn.close()
+
+
+# -------------------------------
+# Submitting side
+# -------------------------------
+class JobRunner:
+    """
+    Local background job runner.
+
+    Jobs run in a pool of `workers` processes (spawned, so they never inherit
+    Streamlit's threads) and their state lives in a SQLite job table, so any
+    session, or a restarted app, can poll it. Queued jobs start in submission
+    order. Kinds in SINGLE_FLIGHT are de-duplicated: submitting while one is
+    queued or running returns the existing job. Cancellation is immediate for
+    queued jobs and cooperative (at the next report_progress call) for
+    running ones.
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH, workers=JOBS_WORKERS):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._conn = _connect(db_path)
+        self._futures = {}
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,),
+        )
+        self._recover()
+
+    def _recover(self):
+        # jobs submitted by an app process that no longer exists can never finish
+        with self._lock:
+            owners = [pid for (pid,) in self._conn.execute("SELECT DISTINCT owner_pid FROM jobs WHERE status IN ('queued', 'running')")]
+            dead = [pid for pid in owners if pid is not None and not _alive(pid)]
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'failed', error = 'interrupted by restart', finished_at = ? WHERE owner_pid = ? AND status IN ('queued', 'running')",
+                    [(_now(), pid) for pid in dead],
+                )
+
+    def submit(self, kind, **kwargs):
+        """Queue a job of `kind` (see JOB_KINDS) and return its id."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        dedup_key = kind if kind in SINGLE_FLIGHT else None
+        with self._lock:
+            job_id = uuid.uuid4().hex[:12]
+            while True:
+                try:
+                    with self._conn:
+                        self._conn.execute(
+                            "INSERT INTO jobs (id, kind, args, dedup_key, status, owner_pid, created_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                            (job_id, kind, json.dumps(kwargs, default=str), dedup_key, os.getpid(), _now()),
+                        )
+                    break
+                except sqlite3.IntegrityError:
+                    # jobs_single_flight: one is queued or running, possibly submitted by another process
+                    row = self._conn.execute(
+                        "SELECT id FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running')",
+                        (dedup_key,),
+                    ).fetchone()
+                    if row:
+                        print(f"[jobs] {kind} already in progress as job {row[0]}")
+                        return row[0]
+                    # it finished in between; try again
+            future = self._pool.submit(_run_job, self.db_path, job_id, JOB_KINDS[kind], kwargs)
+            self._futures[job_id] = future
+            future.add_done_callback(lambda f, job_id=job_id: self._finished(job_id, f))
+        return job_id
+
+    def _finished(self, job_id, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+            error = None if future.cancelled() else future.exception()
+            if error is not None:
+                # the worker process itself died (e.g. killed for memory)
+                with self._conn:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                        (repr(error), _now(), job_id),
+                    )
+
+    def cancel(self, job_id):
+        """Request cancellation; returns the job's status afterwards."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')", (job_id,))
+            future = self._futures.get(job_id)
+            if future is not None and future.cancel():
+                with self._conn:
+                    self._conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (_now(), job_id))
+        return self.get(job_id)["status"]
+
+    def get(self, job_id):
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            return _row_to_job(cursor, row) if row else None
+
+    def list(self, limit=20, kind=None):
+        sql = "SELECT * FROM jobs"
+        args = []
+        if kind:
+            sql += " WHERE kind = ?"
+            args.append(kind)
+        with self._lock:
+            cursor = self._conn.execute(sql + " ORDER BY created_at DESC LIMIT ?", (*args, limit))
+            return [_row_to_job(cursor, row) for row in cursor.fetchall()]
+
+    def wait(self, job_id, poll_seconds=1.0, timeout=None):
+        """Block until the job leaves the queued/running states (CLI and scripts)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] not in ACTIVE:
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                return job
+            time.sleep(poll_seconds)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_job_runner():
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+    return _runner
@@ -0,0 +1,165 @@
+# core/label_cache.py
+import os, sqlite3, threading, time
+from dotenv import load_dotenv
+load_dotenv()
+
+CACHE_PATH = os.getenv("LABEL_CACHE_PATH", "outputs/cache/label_cache.db")
+MAX_ENTRIES = int(os.getenv("LABEL_CACHE_MAX_ENTRIES", 200000))
+MONGO_MIRROR = os.getenv("LABEL_CACHE_MONGO", "false").lower() in ("1", "true", "yes")
+
+# SQLite caps the number of bound parameters per statement
+_SQL_CHUNK = 500
+
+
+class LabelCache:
+    """
+    Persistent description -> category cache for LLM labels.
+
+    Entries are keyed on (model_version, normalized description), so labels
+    produced by an older adapter are never served once the model changes.
+    The table is size bounded: once it grows past `max_entries` the least
+    recently used rows are evicted, down to 90% of it. Optionally mirrors entries to Mongo so several
+    machines can share labels.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, mongo_mirror=MONGO_MIRROR):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " model_version TEXT NOT NULL,"
+            " description TEXT NOT NULL,"
+            " category TEXT NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model_version, description))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS labels_last_used ON labels(last_used)")
+        self._conn.commit()
+        # upper bound on the row count, so puts do not count the table every time
+        (self._size,) = self._conn.execute("SELECT COUNT(*) FROM labels").fetchone()
+        self._mongo = None
+        if mongo_mirror:
+            try:
+                from database.mongo_client import get_database
+                self._mongo = get_database().label_cache
+            except Exception as e:
+                print("[label_cache] Mongo mirror unavailable:", e)
+
+    def get_many(self, model_version, descriptions):
+        """Return {description: category} for the cached subset of `descriptions`."""
+        descriptions = list(dict.fromkeys(descriptions))
+        found = {}
+        with self._lock:
+            for i in range(0, len(descriptions), _SQL_CHUNK):
+                chunk = descriptions[i:i + _SQL_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT description, category FROM labels WHERE model_version = ? AND description IN ({marks})",
+                    [model_version, *chunk],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE labels SET last_used = ? WHERE model_version = ? AND description = ?",
+                    [(now, model_version, d) for d in found],
+                )
+                self._conn.commit()
+
+        remote = [d for d in descriptions if d not in found]
+        if remote and self._mongo is not None:
+            try:
+                docs = self._mongo.find({"model_version": model_version, "description": {"$in": remote}})
+                mirrored = {doc["description"]: doc["category"] for doc in docs}
+            except Exception as e:
+                print("[label_cache] Mongo lookup failed:", e)
+                mirrored = {}
+            if mirrored:
+                self.put_many(model_version, mirrored, mirror=False)
+                found.update(mirrored)
+
+        self.hits += len(found)
+        self.misses += len(descriptions) - len(found)
+        return found
+
+    def get(self, model_version, description):
+        return self.get_many(model_version, [description]).get(description)
+
+    def put_many(self, model_version, labels, mirror=True):
+        """Store {description: category} pairs and evict down to `max_entries`."""
+        if not labels:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO labels (model_version, description, category, last_used) VALUES (?, ?, ?, ?)",
+                [(model_version, d, c, now) for d, c in labels.items()],
+            )
+            self._evict(len(labels))
+            self._conn.commit()
+        if mirror and self._mongo is not None:
+            try:
+                from pymongo import UpdateOne
+                self._mongo.bulk_write([
+                    UpdateOne(
+                        {"model_version": model_version, "description": d},
+                        {"$set": {"category": c}},
+                        upsert=True,
+                    )
+                    for d, c in labels.items()
+                ], ordered=False)
+            except Exception as e:
+                print("[label_cache] Mongo mirror write failed:", e)
+
+    def put(self, model_version, description, category):
+        self.put_many(model_version, {description: category})
+
+    def _evict(self, added):
+        # `added` counts replaced rows too and other processes insert on their
+        # own, so the table is only counted once the estimate passes the limit;
+        # evicting down to 90% leaves room for many puts before the next count
+        self._size += added
+        if self._size <= self.max_entries:
+            return
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM labels").fetchone()
+        low = self.max_entries - self.max_entries // 10
+        if count > low:
+            self._conn.execute(
+                "DELETE FROM labels WHERE rowid IN (SELECT rowid FROM labels ORDER BY last_used LIMIT ?)",
+                (count - low,),
+            )
+            count = low
+        self._size = count
+
+    def stats(self):
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM labels").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": size,
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM labels")
+            self._conn.commit()
+            self._size = 0
+
+
+_cache = None
+
+def get_label_cache():
+    global _cache
+    if _cache is None:
+        _cache = LabelCache()
+    return _cache
@@ -0,0 +1,205 @@
+# core/labeled_store.py
+"""
+Labeled statements are stored as Parquet, the canonical labeled artifact.
+
+Readers open the file memory-mapped and load only the columns and row
+groups they need (read_labeled / iter_labeled / labeled_row_count), so a
+preview or a one-column review never parses the whole statement. CSV and
+records-JSON copies are produced on demand:
+
+    python -m core.labeled_store export datasets/labeled_data/x_labeled.parquet --format csv
+
+or after every labeling run with LABELED_EXPORTS=csv,json. Readers also
+accept the .csv / .json files written by earlier versions.
+"""
+import os, argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+load_dotenv()
+
+LABELED_EXT = ".parquet"
+LABELED_COMPRESSION = os.getenv("LABELED_COMPRESSION", "zstd")
+LABELED_ROW_GROUP = int(os.getenv("LABELED_ROW_GROUP", 50000))
+# formats exported next to every labeled file, e.g. "csv,json" (none by default)
+LABELED_EXPORTS = [f for f in os.getenv("LABELED_EXPORTS", "").replace(" ", "").split(",") if f]
+
+
+def _schema(df, widen_ints=False):
+    fields = []
+    for name, dtype in df.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            kind = pa.bool_()
+        elif pd.api.types.is_integer_dtype(dtype):
+            kind = pa.float64() if widen_ints else pa.int64()
+        elif pd.api.types.is_float_dtype(dtype):
+            kind = pa.float64()
+        else:
+            kind = pa.string()
+        fields.append(pa.field(str(name), kind))
+    return pa.schema(fields)
+
+
+def _to_table(df, schema):
+    df = df.copy()
+    for field in schema:
+        if pa.types.is_string(field.type):
+            col = df[field.name]
+            df[field.name] = col.where(col.isna(), col.astype(str))
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def write_labeled(df, path):
+    """Write a whole labeled DataFrame to `path` (Parquet) and return the path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pq.write_table(_to_table(df, _schema(df)), path, compression=LABELED_COMPRESSION, row_group_size=LABELED_ROW_GROUP)
+    return path
+
+
+class LabeledWriter:
+    """
+    Appends DataFrame chunks to one Parquet file, one or more row groups per
+    chunk. The schema comes from the first chunk, with integer columns
+    widened to float64 since a later chunk may have gaps in them. A later
+    chunk that does not fit it (text in a column that was empty or numeric
+    so far) turns those columns into strings; the row groups already written
+    are rewritten once with the new schema.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.rows = 0
+        self._writer = None
+        self._file = path
+        self._rewrites = 0
+
+    def write(self, chunk):
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._file, _schema(chunk, widen_ints=True), compression=LABELED_COMPRESSION)
+        try:
+            table = _to_table(chunk, self._writer.schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            table = self._widen(chunk)
+        self._writer.write_table(table, row_group_size=LABELED_ROW_GROUP)
+        self.rows += len(chunk)
+
+    def _widen(self, chunk):
+        fields, widened = [], []
+        for field in self._writer.schema:
+            try:
+                pa.array(chunk[field.name], type=field.type, from_pandas=True)
+                fields.append(field)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                fields.append(pa.field(field.name, pa.string()))
+                widened.append(field.name)
+        schema = pa.schema(fields)
+        print(f"[labeled_store] Column types changed at row {self.rows}, storing {widened} as text")
+        self._writer.close()
+        previous, self._file = self._file, f"{self.path}.{self._rewrites}.tmp"
+        self._rewrites += 1
+        self._writer = pq.ParquetWriter(self._file, schema, compression=LABELED_COMPRESSION)
+        for batch in pq.ParquetFile(previous).iter_batches(batch_size=LABELED_ROW_GROUP):
+            self._writer.write_table(pa.Table.from_batches([batch]).cast(schema), row_group_size=LABELED_ROW_GROUP)
+        if previous != self.path:
+            os.remove(previous)
+        return _to_table(chunk, schema)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            if self._file != self.path:
+                os.replace(self._file, self.path)
+        elif not os.path.exists(self.path):
+            pq.write_table(pa.table({}), self.path)
+
+
+def _legacy(path, columns):
+    if path.endswith(".json"):
+        df = pd.read_json(path)
+        return df[[c for c in columns if c in df.columns]] if columns else df
+    return pd.read_csv(path, usecols=lambda c: columns is None or c in columns)
+
+
+def labeled_row_count(path):
+    """Number of rows, from the Parquet footer (no data is read)."""
+    if not path.endswith(LABELED_EXT):
+        return len(_legacy(path, None))
+    return pq.ParquetFile(path, memory_map=True).metadata.num_rows
+
+
+def read_labeled(path, columns=None, start=0, stop=None):
+    """
+    Rows [start, stop) of the labeled file as a DataFrame, reading only
+    `columns` (all if None) and only the row groups that overlap the range.
+    Columns missing from the file are skipped.
+    """
+    if not path.endswith(LABELED_EXT):
+        return _legacy(path, columns).iloc[start:stop].reset_index(drop=True)
+    pf = pq.ParquetFile(path, memory_map=True)
+    if columns is not None:
+        columns = [c for c in columns if c in pf.schema_arrow.names]
+    stop = pf.metadata.num_rows if stop is None else min(stop, pf.metadata.num_rows)
+    groups, first, offset = [], None, 0
+    for g in range(pf.metadata.num_row_groups):
+        n = pf.metadata.row_group(g).num_rows
+        if offset < stop and offset + n > start:
+            groups.append(g)
+            first = offset if first is None else first
+        offset += n
+    if not groups:
+        return pf.schema_arrow.empty_table().select(columns or pf.schema_arrow.names).to_pandas()
+    table = pf.read_row_groups(groups, columns=columns)
+    return table.slice(start - first, stop - start).to_pandas()
+
+
+def iter_labeled(path, columns=None, batch_size=LABELED_ROW_GROUP):
+    """Yield (DataFrame, first_row_index) batches of `batch_size` rows, reading only `columns`."""
+    if not path.endswith(LABELED_EXT):
+        df = _legacy(path, columns)
+        for offset in range(0, len(df), batch_size):
+            yield df.iloc[offset:offset + batch_size].reset_index(drop=True), offset
+        return
+    pf = pq.ParquetFile(path, memory_map=True)
+    if columns is not None:
+        columns = [c for c in columns if c in pf.schema_arrow.names]
+    offset = 0
+    for batch in pf.iter_batches(batch_size=batch_size, columns=columns):
+        df = batch.to_pandas()
+        yield df, offset
+        offset += len(df)
+
+
+def export_labeled(path, fmt):
+    """Write a .csv or records .json copy next to the labeled file and return its path."""
+    if fmt not in ("csv", "json"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    out = os.path.splitext(path)[0] + "." + fmt
+    if fmt == "csv":
+        for df, offset in iter_labeled(path):
+            df.to_csv(out, index=False, mode="w" if offset == 0 else "a", header=offset == 0)
+    else:
+        with open(out, "w") as f:
+            f.write("[")
+            for df, offset in iter_labeled(path):
+                records = df.to_json(orient="records")[1:-1]
+                if records:
+                    f.write(("," if offset else "") + records)
+            f.write("]")
+    return out
+
+
+def export_configured(path):
+    """Export `path` in every LABELED_EXPORTS format; returns {format: path}."""
+    return {fmt: export_labeled(path, fmt) for fmt in LABELED_EXPORTS}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export labeled statements")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write a CSV or JSON copy of a labeled file")
+    export.add_argument("path")
+    export.add_argument("--format", choices=("csv", "json"), default="csv")
+    args = parser.parse_args()
+    print(export_labeled(args.path, args.format))
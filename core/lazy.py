@@ -0,0 +1,18 @@
+# core/lazy.py
+import sys
+
+
+def lazy_agent(module_name, attr, **spec):
+    """
+    Module-level __getattr__ that builds the crewai Agent `attr` of
+    `module_name` on first access. Importing crewai takes seconds, and most
+    callers only need the module's functions, not the Agent object.
+    """
+    def __getattr__(name):
+        if name != attr:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        from crewai import Agent
+        agent = Agent(**spec)
+        setattr(sys.modules[module_name], attr, agent)
+        return agent
+    return __getattr__
@@ -1,18 +1,267 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-import torch, os
+import os, time, threading
+from core.tracing import traced, count
 
-def load_phi3_model():
-    model_name = os.getenv("MODEL_NAME", "google/flan-t5-base")
-    print(f"[model_loader] Loading model: {model_name} (device_map=cpu)")
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
+# torch / transformers are imported inside the loaders: importing them takes
+# seconds, and most processes that import this module never load a model.
+
+# Local inference backends:
+#   transformers       float32 PyTorch (reference)
+#   transformers-int8  PyTorch with dynamic int8 quantization of all Linear layers
+#   onnx               ONNX Runtime export with KV cache, dynamically quantized to int8
+# ("ollama" is handled by retrieval/generators.py and never reaches this module.)
+LOCAL_BACKENDS = ("transformers", "transformers-int8", "onnx")
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "outputs/onnx")
+
+# Process-wide registry: one loaded (model, tokenizer) per (model name, adapter, backend) key.
+# Every agent goes through get_model(), so the weights live in RAM once no
+# matter how many modules need them.
+_registry = {}
+_registry_lock = threading.RLock()
+# LoRA adapter served by get_model(): MODEL_ADAPTER when set ("none" for the
+# base model), otherwise the version promoted to the serving directory
+# (core.adapters) once there is one
+_active_adapter = os.getenv("MODEL_ADAPTER") or None
+
+def _current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 1024 / (1024 if os.uname().sysname == "Darwin" else 1), 1)
+
+def active_adapter():
+    """Adapter directory served by default, or None for the base model."""
+    if _active_adapter == "none":
+        return None
+    if _active_adapter:
+        return _active_adapter
+    from core.adapters import SERVING_DIR
+    return SERVING_DIR if os.path.exists(os.path.join(SERVING_DIR, "adapter_config.json")) else None
+
+def _default_backend():
+    backend = os.getenv("MODEL_BACKEND", "transformers")
+    return backend if backend in LOCAL_BACKENDS else "transformers"
+
+def _load_torch(model_name, adapter_dir, merge):
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
     model = AutoModelForSeq2SeqLM.from_pretrained(
         model_name,
         device_map="cpu",
         torch_dtype=torch.float32
     )
-    return model, tokenizer
+    if adapter_dir:
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, adapter_dir)
+        if merge:
+            # fold the LoRA deltas into the base weights so the result is a plain model
+            model = model.merge_and_unload()
+    return model.eval()
+
+def _load_onnx(model_name, adapter_dir, tokenizer):
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as e:
+        raise ImportError("MODEL_BACKEND=onnx requires `pip install optimum[onnxruntime]`") from e
+
+    version = get_model_version(model_name, adapter_dir, backend="onnx").replace("/", "--").replace("@", "-")
+    export_dir = os.path.join(ONNX_CACHE_DIR, version, "fp32")
+    quant_dir = os.path.join(ONNX_CACHE_DIR, version, "int8")
+    if not os.path.exists(os.path.join(quant_dir, "config.json")):
+        source = model_name
+        if adapter_dir:
+            source = os.path.join(ONNX_CACHE_DIR, version, "merged")
+            _load_torch(model_name, adapter_dir, merge=True).save_pretrained(source)
+            tokenizer.save_pretrained(source)
+        print(f"[model_loader] Exporting {source} to ONNX (one-off, cached in {export_dir})")
+        ORTModelForSeq2SeqLM.from_pretrained(source, export=True, use_cache=True).save_pretrained(export_dir)
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        for onnx_file in sorted(f for f in os.listdir(export_dir) if f.endswith(".onnx")):
+            ORTQuantizer.from_pretrained(export_dir, file_name=onnx_file).quantize(
+                save_dir=quant_dir, quantization_config=qconfig
+            )
+        tokenizer.save_pretrained(quant_dir)
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        quant_dir,
+        use_cache=True,
+        encoder_file_name="encoder_model_quantized.onnx",
+        decoder_file_name="decoder_model_quantized.onnx",
+        decoder_with_past_file_name="decoder_with_past_model_quantized.onnx",
+    )
+
+def _load(model_name, adapter_dir, backend):
+    print(f"[model_loader] Loading model: {model_name} (device_map=cpu, adapter={adapter_dir}, backend={backend})")
+    import torch
+    from transformers import AutoTokenizer
+    # the serving adapter path is a symlink that a promotion repoints; resolve
+    # it once so every file of the adapter comes from the same version
+    adapter_dir = os.path.realpath(adapter_dir) if adapter_dir else None
+    rss_before = _current_rss_mb()
+    start = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == "onnx":
+        model = _load_onnx(model_name, adapter_dir, tokenizer)
+    elif backend == "transformers-int8":
+        model = torch.quantization.quantize_dynamic(
+            _load_torch(model_name, adapter_dir, merge=True), {torch.nn.Linear}, dtype=torch.qint8
+        )
+    else:
+        model = _load_torch(model_name, adapter_dir, merge=False)
+    load_seconds = round(time.perf_counter() - start, 2)
+    rss_after = _current_rss_mb()
+    print(f"[model_loader] Loaded {model_name} in {load_seconds}s (RSS {rss_after} MB)")
+    return {
+        "model": model,
+        "tokenizer": tokenizer,
+        "model_name": model_name,
+        "adapter": adapter_dir,
+        "adapter_version": _adapter_hash(adapter_dir) if adapter_dir else None,
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "rss_delta_mb": round(rss_after - rss_before, 1),
+    }
 
+def get_model(model_name=None, adapter_dir=None, backend=None):
+    """
+    Return the shared (model, tokenizer), loading it on first use.
+    Without arguments this is the base MODEL_NAME with the active adapter
+    (see swap_adapter) on the MODEL_BACKEND backend; pass `adapter_dir` or
+    `backend` to request a specific variant.
+    """
+    global _active_adapter
+    model_name = model_name or os.getenv("MODEL_NAME", "google/flan-t5-base")
+    if not adapter_dir:
+        adapter_dir = active_adapter()
+        # the adapter loaded here stays the served one until swap_adapter()
+        _active_adapter = adapter_dir or "none"
+    backend = backend or _default_backend()
+    key = (model_name, adapter_dir, backend)
+    entry = _registry.get(key)
+    if entry is None:
+        with _registry_lock:
+            entry = _registry.get(key)
+            if entry is None:
+                entry = _load(model_name, adapter_dir, backend)
+                _registry[key] = entry
+    return entry["model"], entry["tokenizer"]
+
+def swap_adapter(adapter_dir=None, model_name=None):
+    """
+    Hot-swap the LoRA adapter used by get_model() without restarting.
+    If a model is already loaded, the new weights are loaded before the old
+    entry is released, so callers never see a missing model; otherwise the
+    swap takes effect on the next get_model(). Pass None to go back to the
+    base model.
+    """
+    global _active_adapter
+    model_name = model_name or os.getenv("MODEL_NAME", "google/flan-t5-base")
+    backend = _default_backend()
+    with _registry_lock:
+        old_key = (model_name, active_adapter(), backend)
+        new_key = (model_name, adapter_dir, backend)
+        _registry.pop(new_key, None)
+        if old_key in _registry:
+            _registry[new_key] = _load(model_name, adapter_dir, backend)
+        _active_adapter = adapter_dir or "none"
+        if old_key != new_key:
+            _registry.pop(old_key, None)
+    print(f"[model_loader] Active adapter: {adapter_dir or 'none'}")
+    return new_key
+
+def reload_adapter():
+    """Pick up a freshly trained adapter at the active adapter path."""
+    adapter_dir = active_adapter()
+    if adapter_dir:
+        return swap_adapter(adapter_dir)
+    return None
+
+def registry_stats():
+    """Load time and memory of every loaded model, plus current process RSS."""
+    with _registry_lock:
+        models = [
+            {k: v for k, v in entry.items() if k not in ("model", "tokenizer")}
+            for entry in _registry.values()
+        ]
+    return {"models": models, "active_adapter": active_adapter(), "rss_mb": _current_rss_mb()}
+
+def load_phi3_model():
+    return get_model()
+
+def _count_tokens(tokenizer, inputs, generated):
+    count("prompts", int(inputs["input_ids"].shape[0]))
+    count("input_tokens", int(inputs["attention_mask"].sum()))
+    pad = tokenizer.pad_token_id
+    count("output_tokens", int((generated != pad).sum()) if pad is not None else int(generated.numel()))
+
+@traced("llm_generate")
 def generate_with_model(model, tokenizer, prompt, max_new_tokens=64):
     inputs = tokenizer(prompt, return_tensors="pt")
     outputs = model.generate(**inputs, max_new_tokens=max_new_tokens)
-    return tokenizer.decode(outputs[0], skip_special_tokens=True)
\ No newline at end of file
+    _count_tokens(tokenizer, inputs, outputs)
+    return tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+@traced("llm_generate")
+def generate_batch_with_model(model, tokenizer, prompts, max_new_tokens=64, batch_size=16):
+    """
+    Generate for many prompts at once. Each batch is padded to its longest
+    prompt so the encoder runs once per batch instead of once per prompt.
+    Returns the decoded outputs in the same order as `prompts`.
+    """
+    import torch
+    outputs = []
+    for start in range(0, len(prompts), batch_size):
+        batch = prompts[start:start + batch_size]
+        inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True)
+        with torch.inference_mode():
+            generated = model.generate(**inputs, max_new_tokens=max_new_tokens)
+        _count_tokens(tokenizer, inputs, generated)
+        outputs.extend(tokenizer.batch_decode(generated, skip_special_tokens=True))
+    return outputs
+
+_adapter_hash_cache = {}
+
+def _adapter_hash(adapter_dir):
+    weights = os.path.join(adapter_dir, "adapter_model.safetensors")
+    if not os.path.exists(weights):
+        return None
+    stat = os.stat(weights)
+    cache_key = (weights, stat.st_mtime_ns, stat.st_size)
+    if cache_key not in _adapter_hash_cache:
+        import hashlib
+        h = hashlib.sha256()
+        with open(weights, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _adapter_hash_cache[cache_key] = h.hexdigest()[:16]
+    return _adapter_hash_cache[cache_key]
+
+def get_model_version(model_name=None, adapter_dir=None, backend=None):
+    """
+    Identifier for the weights that produce labels: base model name plus a
+    hash of the LoRA adapter (the active one unless `adapter_dir` is given)
+    and the backend when it is a quantized one. A new fine-tune changes the
+    hash, so anything keyed on it goes stale.
+
+    A loaded model reports the hash taken when it was loaded: the adapter
+    directory may since hold a version promoted by another process, which
+    this process does not serve until it swaps adapters.
+    """
+    model_name = model_name or os.getenv("MODEL_NAME", "google/flan-t5-base")
+    adapter_dir = adapter_dir or active_adapter()
+    backend = backend or _default_backend()
+    version = model_name
+    entry = _registry.get((model_name, adapter_dir, backend))
+    if entry is not None:
+        adapter_version = entry["adapter_version"]
+    else:
+        adapter_version = _adapter_hash(adapter_dir) if adapter_dir else None
+    if adapter_version:
+        version += f"@{adapter_version}"
+    if backend != "transformers":
+        version += f"+{backend}"
+    return version
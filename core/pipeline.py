@@ -0,0 +1,196 @@
+# core/pipeline.py
+import os, queue, threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+load_dotenv()
+
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+PIN_CORES = os.getenv("PIPELINE_PIN_CORES", "true").lower() in ("1", "true", "yes")
+
+STAGE_KINDS = ("thread", "process")
+
+_STOP = object()
+
+
+class Stage:
+    """
+    One step of a pipeline: `fn(item) -> item`, run by `workers` workers.
+
+    Thread workers (the default) suit stages that spend their time in torch
+    or tokenizers, which release the GIL. kind="process" gives each worker
+    its own process, for CPU-bound pure-Python work (e.g. normalization and
+    rules) that threads would serialize; `fn` and the items then have to be
+    picklable, i.e. a module-level function or a functools.partial of one.
+    """
+
+    def __init__(self, name, fn, workers=1, kind="thread"):
+        if kind not in STAGE_KINDS:
+            raise ValueError(f"Unknown stage kind: {kind} (expected one of {STAGE_KINDS})")
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.kind = kind
+
+
+class _Failure:
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _core_slices(stages):
+    """Split the available cores evenly over every worker of every stage."""
+    cores = _available_cores()
+    total = sum(s.workers for s in stages)
+    per_worker = max(1, len(cores) // total)
+    # with more workers than cores the slices wrap around and share cores
+    return [
+        [cores[(w * per_worker + j) % len(cores)] for j in range(per_worker)]
+        for w in range(total)
+    ]
+
+
+def _pin_current_thread(cores):
+    # On Linux pid 0 means "the calling thread", so each worker gets its own cores.
+    if PIN_CORES and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+
+
+def _set_torch_threads(n):
+    """Set torch's intra-op thread count (process-wide); returns the previous one, or None without torch."""
+    try:
+        import torch
+    except ImportError:
+        return None
+    previous = torch.get_num_threads()
+    torch.set_num_threads(n)
+    return previous
+
+
+def _init_process(cores):
+    # a process worker: affinity and torch threads are its own
+    _pin_current_thread(cores)
+    _set_torch_threads(len(cores))
+
+
+def run_pipeline(items, stages, queue_size=QUEUE_SIZE, ordered=True):
+    """
+    Push `items` through `stages`, overlapping the stages.
+
+    Stages are connected by bounded queues (`queue_size`), so a fast stage
+    blocks instead of buffering the whole input when a slower one falls
+    behind. Each worker thread is pinned to its own slice of the CPU cores,
+    all slices the same size. torch's thread count is process-wide, so it is
+    set once, for the whole run, to that size: every worker's torch calls
+    then use about as many threads as it has cores, and concurrent stages do
+    not oversubscribe each other. Workers of kind="process" stages run in
+    their own spawned process, pinned and torch-limited the same way.
+
+    Yields the outputs of the last stage, in input order when `ordered`.
+    The first exception raised by any stage is re-raised here.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    slices = _core_slices(stages)
+    torch_threads = _set_torch_threads(len(slices[0]))
+    slices = iter(slices)
+    abort = threading.Event()
+
+    def feed():
+        try:
+            for seq, item in enumerate(items):
+                if abort.is_set():
+                    break
+                queues[0].put((seq, item))
+        except Exception as e:
+            queues[-1].put(_Failure("source", e))
+        finally:
+            for _ in range(stages[0].workers):
+                queues[0].put(_STOP)
+
+    def work(stage_idx, cores, remaining):
+        stage = stages[stage_idx]
+        inbox, outbox = queues[stage_idx], queues[stage_idx + 1]
+        pool = None
+        try:
+            if stage.kind == "process":
+                # this thread only hands items to its process, pinned to the worker's cores
+                pool = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process,
+                    initargs=(cores,),
+                )
+                call = lambda item: pool.submit(stage.fn, item).result()
+            else:
+                _pin_current_thread(cores)
+                call = stage.fn
+            while True:
+                msg = inbox.get()
+                if msg is _STOP:
+                    break
+                if abort.is_set():
+                    continue
+                seq, item = msg
+                try:
+                    outbox.put((seq, call(item)))
+                except Exception as e:
+                    abort.set()
+                    queues[-1].put(_Failure(stage.name, e))
+        except Exception as e:
+            abort.set()
+            queues[-1].put(_Failure(stage.name, e))
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            # the last worker of a stage to finish tells the next stage to stop
+            with remaining[1]:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                downstream = stages[stage_idx + 1].workers if stage_idx + 1 < len(stages) else 1
+                for _ in range(downstream):
+                    outbox.put(_STOP)
+
+    for idx, stage in enumerate(stages):
+        remaining = [stage.workers, threading.Lock()]
+        for w in range(stage.workers):
+            threading.Thread(target=work, args=(idx, next(slices), remaining), name=f"{stage.name}-{w}", daemon=True).start()
+    threading.Thread(target=feed, name="pipeline-source", daemon=True).start()
+
+    buffered, next_seq = {}, 0
+    try:
+        while True:
+            msg = queues[-1].get()
+            if msg is _STOP:
+                break
+            if isinstance(msg, _Failure):
+                raise RuntimeError(f"Pipeline stage '{msg.stage}' failed: {msg.error}") from msg.error
+            seq, result = msg
+            if not ordered:
+                yield result
+                continue
+            buffered[seq] = result
+            while next_seq in buffered:
+                yield buffered.pop(next_seq)
+                next_seq += 1
+    finally:
+        abort.set()
+        # drain so blocked workers can see the abort flag and exit
+        for q in queues:
+            try:
+                while True:
+                    q.get_nowait()
+            except queue.Empty:
+                pass
+        if torch_threads is not None:
+            _set_torch_threads(torch_threads)
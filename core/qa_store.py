@@ -0,0 +1,158 @@
+# core/qa_store.py
+import os, json, sqlite3, hashlib, threading
+from datetime import datetime
+from dotenv import load_dotenv
+load_dotenv()
+
+QA_DIR = "datasets/qa_data"
+STORE_PATH = os.getenv("QA_STORE_PATH", os.path.join(QA_DIR, "qa_store.db"))
+
+
+def pair_hash(question, answer):
+    return hashlib.blake2b(f"{question}\0{answer}".encode("utf-8"), digest_size=16).digest()
+
+
+class QAStore:
+    """
+    Append-only, deduplicated store of Q&A pairs for fine-tuning.
+
+    Every pair gets an increasing sequence number and a content hash with a
+    unique index, so inserting n pairs costs O(n) regardless of how much
+    history the store already holds. Readers stream rows in sequence order
+    (optionally from a given sequence number) instead of loading everything.
+
+    Q&A JSON files found in `qa_dir` (including the old combined_qa.json)
+    are imported once; a file is re-imported only if it changes.
+    """
+
+    def __init__(self, path=STORE_PATH, qa_dir=QA_DIR):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS qa ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " hash BLOB NOT NULL UNIQUE,"
+            " question TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " source TEXT,"
+            " created_at TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS imports (name TEXT PRIMARY KEY, size INTEGER, mtime REAL)")
+        self._conn.commit()
+        if qa_dir:
+            self._import_json_files(qa_dir)
+
+    def _import_json_files(self, qa_dir):
+        if not os.path.isdir(qa_dir):
+            return
+        for name in sorted(os.listdir(qa_dir)):
+            if not name.endswith(".json"):
+                continue
+            full = os.path.join(qa_dir, name)
+            stat = os.stat(full)
+            seen = self._conn.execute("SELECT size, mtime FROM imports WHERE name = ?", (name,)).fetchone()
+            if seen == (stat.st_size, stat.st_mtime):
+                continue
+            try:
+                with open(full, "r") as f:
+                    data = json.load(f) if stat.st_size else []
+            except Exception as e:
+                print(f"[qa_store] Could not import {full}: {e}")
+                data = []
+            added = self.add_many(
+                [{"question": d["question"], "answer": d["answer"]} for d in data if "question" in d and "answer" in d],
+                source=name,
+            )
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO imports (name, size, mtime) VALUES (?, ?, ?)",
+                    (name, stat.st_size, stat.st_mtime),
+                )
+            if added:
+                print(f"[qa_store] Imported {added} Q&A pairs from {full}")
+
+    def add_many(self, pairs, source=None):
+        """Insert {"question", "answer"} pairs, skipping ones already stored. Returns the number added."""
+        if not pairs:
+            return 0
+        now = datetime.utcnow().isoformat()
+        rows = [(pair_hash(p["question"], p["answer"]), p["question"], p["answer"], source, now) for p in pairs]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO qa (hash, question, answer, source, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            return self._conn.total_changes - before
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM qa").fetchone()[0]
+
+    def last_seq(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM qa").fetchone()[0]
+
+    def content_hash(self, after_seq=0, until_seq=None):
+        """(hex digest, count) over the pair hashes in the sequence range (after_seq, until_seq]."""
+        h = hashlib.blake2b(digest_size=16)
+        count = 0
+        sql = "SELECT hash FROM qa WHERE seq > ?"
+        args = [after_seq]
+        if until_seq is not None:
+            sql += " AND seq <= ?"
+            args.append(until_seq)
+        with self._lock:
+            for (row_hash,) in self._conn.execute(sql + " ORDER BY seq", args):
+                h.update(row_hash)
+                count += 1
+        return h.hexdigest(), count
+
+    def iter_pairs(self, after_seq=0, until_seq=None, batch_size=1000):
+        """Yield {"seq", "question", "answer"} in insertion order, `batch_size` rows at a time."""
+        last = after_seq
+        while True:
+            sql = "SELECT seq, question, answer FROM qa WHERE seq > ?"
+            args = [last]
+            if until_seq is not None:
+                sql += " AND seq <= ?"
+                args.append(until_seq)
+            with self._lock:
+                rows = self._conn.execute(sql + " ORDER BY seq LIMIT ?", (*args, batch_size)).fetchall()
+            if not rows:
+                return
+            for seq, question, answer in rows:
+                yield {"seq": seq, "question": question, "answer": answer}
+            last = rows[-1][0]
+
+    def sample(self, n, until_seq=None):
+        """Up to `n` random pairs with sequence number <= `until_seq` (replay data)."""
+        sql = "SELECT question, answer FROM qa"
+        args = []
+        if until_seq is not None:
+            sql += " WHERE seq <= ?"
+            args.append(until_seq)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY RANDOM() LIMIT ?", (*args, n)).fetchall()
+        return [{"question": q, "answer": a} for q, a in rows]
+
+    def tail(self, n=5):
+        """The `n` most recently added pairs, oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT question, answer FROM qa ORDER BY seq DESC LIMIT ?", (n,)).fetchall()
+        return [{"question": q, "answer": a} for q, a in reversed(rows)]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_qa_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = QAStore()
+    return _store
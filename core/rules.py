@@ -0,0 +1,83 @@
+# core/rules.py
+import os, re, json
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+load_dotenv()
+
+RULES_PATH = os.getenv("CATEGORY_RULES_PATH", "config/category_rules.json")
+
+
+class CompiledRules:
+    """
+    Rule table compiled into one case-insensitive regex.
+
+    Each rule becomes a named group (r0, r1, ...) of the combined pattern, so
+    a whole DESCRIPTION column is scanned in a single pass regardless of how
+    many rules exist. When several rules match a description, the one with
+    the highest priority wins.
+    """
+
+    def __init__(self, rules):
+        rules = sorted(rules, key=lambda r: -r.get("priority", 0))
+        self.categories = [r["category"] for r in rules]
+        self.priorities = np.array([r.get("priority", 0) for r in rules])
+        groups, plain = [], []
+        for i, rule in enumerate(rules):
+            alternatives = [re.escape(k) for k in rule.get("keywords", [])] + list(rule.get("regex", []))
+            if not alternatives:
+                raise ValueError(f"Rule for {rule['category']!r} has no keywords or regex.")
+            groups.append(f"(?P<r{i}>{'|'.join(alternatives)})")
+            plain.append(f"(?:{'|'.join(alternatives)})")
+        self.pattern = re.compile("|".join(groups), re.IGNORECASE)
+        # group-free twin of `pattern`, used for the cheap "any rule fires" test
+        self.any_pattern = re.compile("|".join(plain), re.IGNORECASE)
+
+    def match(self, desc):
+        """Category for a single description, or None."""
+        if not isinstance(desc, str): return None
+        best = None
+        for m in self.pattern.finditer(desc):
+            idx = int(m.lastgroup[1:])
+            if best is None or self.priorities[idx] > self.priorities[best]:
+                best = idx
+        return None if best is None else self.categories[best]
+
+    def apply(self, descriptions: pd.Series):
+        """
+        Vectorized rule pass over a Series of descriptions.
+        Returns (categories, needs_llm): a Series of matched categories (None
+        where no rule fired) and a boolean mask of rows left for the LLM.
+        """
+        index = descriptions.index
+        descriptions = descriptions.astype(str).reset_index(drop=True)
+        categories = pd.Series(None, index=descriptions.index, dtype=object)
+        hit = descriptions.str.contains(self.any_pattern, na=False)
+        if hit.any():
+            matches = descriptions[hit].str.extractall(self.pattern)
+            rule_cols = [f"r{i}" for i in range(len(self.categories))]
+            rule_idx = matches[rule_cols].notna().to_numpy().argmax(axis=1)
+            ranked = pd.DataFrame({
+                "row": matches.index.get_level_values(0),
+                "rule": rule_idx,
+                "priority": self.priorities[rule_idx],
+            }).sort_values("priority", ascending=False, kind="stable").drop_duplicates("row")
+            categories.loc[ranked["row"].to_numpy()] = np.array(self.categories, dtype=object)[ranked["rule"].to_numpy()]
+        categories.index, hit.index = index, index
+        return categories, ~hit
+
+
+_compiled = {}
+
+def load_rules(path=None):
+    """Load and compile the rule table at `path` (cached until the file changes)."""
+    path = path or RULES_PATH
+    mtime = os.path.getmtime(path)
+    cached = _compiled.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r") as f:
+            rules = json.load(f)
+        cached = (mtime, CompiledRules(rules))
+        _compiled[path] = cached
+        print(f"[rules] Compiled {len(rules)} category rules from {path}")
+    return cached[1]
@@ -0,0 +1,197 @@
+# core/statement_summary.py
+"""
+Per-statement aggregates computed while labeling and stored next to the
+labeled file as <name>_labeled.summary.json:
+
+- row, missing-category and "Other" counts
+- count, DEBIT and CREDIT totals per category and per month
+- the date range
+- balance continuity: rows whose BALANCE differs from the previous row's
+  BALANCE - DEBIT + CREDIT (rows are expected in date order)
+
+summarize() works on one DataFrame or chunk in a single vectorized pass and
+merge_summaries() combines summaries, so chunks of a streamed statement are
+folded in as they are labeled and several statements roll up without
+re-reading them:
+
+    python -m core.statement_summary rollup datasets/labeled_data/*_labeled.parquet
+"""
+import os, json, argparse
+import numpy as np
+import pandas as pd
+from core.dates import parse_dates
+from dotenv import load_dotenv
+load_dotenv()
+
+# largest |expected - BALANCE| still treated as continuous
+BALANCE_TOLERANCE = float(os.getenv("SUMMARY_BALANCE_TOLERANCE", 0.01))
+MAX_BREAK_ROWS = 20
+SUMMARY_COLUMNS = ["DATE", "DEBIT", "CREDIT", "BALANCE", "CATEGORY"]
+
+
+def summary_path(labeled_path):
+    return os.path.splitext(labeled_path)[0] + ".summary.json"
+
+
+def _amount(df, column):
+    if column not in df:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[column], errors="coerce").fillna(0.0)
+
+
+def _dates(df):
+    if "DATE" not in df:
+        return pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    return parse_dates(df["DATE"])
+
+
+def _totals(keys, debit, credit):
+    grouped = pd.DataFrame({"key": keys, "debit": debit, "credit": credit}).groupby("key", sort=True)
+    table = grouped.agg(count=("debit", "size"), debit=("debit", "sum"), credit=("credit", "sum"))
+    return {str(k): {"count": int(t["count"]), "debit": float(t["debit"]), "credit": float(t["credit"])} for k, t in table.to_dict("index").items()}
+
+
+def _balance(df, debit, credit, start_row):
+    balance = pd.to_numeric(df["BALANCE"], errors="coerce") if "BALANCE" in df else pd.Series(np.nan, index=df.index)
+    expected = balance.shift(1) - debit + credit
+    checked = expected.notna() & balance.notna()
+    breaks = checked & ((expected - balance).abs() > BALANCE_TOLERANCE)
+    first = None
+    if len(df):
+        b = balance.iloc[0]
+        first = {"row": start_row, "balance": None if pd.isna(b) else float(b), "debit": float(debit.iloc[0]), "credit": float(credit.iloc[0])}
+    last = balance.iloc[-1] if len(df) else np.nan
+    return {
+        "checked": int(checked.sum()),
+        "breaks": int(breaks.sum()),
+        "break_rows": (np.flatnonzero(breaks.to_numpy())[:MAX_BREAK_ROWS] + start_row).tolist(),
+        "first": first,
+        "last": None if pd.isna(last) else float(last),
+    }
+
+
+def summarize(df, start_row=0):
+    """Summary of a labeled DataFrame whose first row is row `start_row` of its statement."""
+    debit, credit = _amount(df, "DEBIT"), _amount(df, "CREDIT")
+    category = df["CATEGORY"] if "CATEGORY" in df else pd.Series(np.nan, index=df.index, dtype=object)
+    missing = category.isna() | (category.astype(str).str.strip() == "")
+    dates = _dates(df)
+    # grouped on year * 100 + month; formatting only the distinct keys is far cheaper than strftime per row
+    months = (dates.dt.year * 100 + dates.dt.month).fillna(0).astype(int)
+    return {
+        "rows": len(df),
+        "missing": int(missing.sum()),
+        "other": int(category[~missing].astype(str).str.lower().str.contains("other").sum()),
+        "date_from": dates.min().date().isoformat() if dates.notna().any() else None,
+        "date_to": dates.max().date().isoformat() if dates.notna().any() else None,
+        "categories": _totals(category[~missing].astype(str), debit[~missing], credit[~missing]),
+        "months": {(f"{int(k) // 100:04d}-{int(k) % 100:02d}" if k != "0" else "unknown"): t for k, t in _totals(months, debit, credit).items()},
+        "balance": _balance(df, debit, credit, start_row),
+    }
+
+
+def _add_totals(a, b):
+    out = {k: dict(v) for k, v in a.items()}
+    for key, t in b.items():
+        s = out.setdefault(key, {"count": 0, "debit": 0.0, "credit": 0.0})
+        for field in ("count", "debit", "credit"):
+            s[field] += t[field]
+    return out
+
+
+def merge_summaries(a, b, contiguous=False):
+    """
+    Combine two summaries. With `contiguous=True`, `b` continues the same
+    statement right after `a` and the balance is also checked across the
+    boundary; otherwise (different statements) only the counts are added.
+    """
+    if a is None or not a["rows"]:
+        return b
+    if b is None or not b["rows"]:
+        return a
+    ba, bb = a["balance"], b["balance"]
+    balance = {
+        "checked": ba["checked"] + bb["checked"],
+        "breaks": ba["breaks"] + bb["breaks"],
+        "break_rows": ba["break_rows"],
+        "first": ba["first"],
+        "last": bb["last"],
+    }
+    first = bb["first"]
+    if contiguous and first and first["balance"] is not None and ba["last"] is not None:
+        balance["checked"] += 1
+        if abs(ba["last"] - first["debit"] + first["credit"] - first["balance"]) > BALANCE_TOLERANCE:
+            balance["breaks"] += 1
+            balance["break_rows"] = balance["break_rows"] + [first["row"]]
+    balance["break_rows"] = (balance["break_rows"] + bb["break_rows"])[:MAX_BREAK_ROWS]
+    dates_from = [d for d in (a["date_from"], b["date_from"]) if d]
+    dates_to = [d for d in (a["date_to"], b["date_to"]) if d]
+    return {
+        "rows": a["rows"] + b["rows"],
+        "missing": a["missing"] + b["missing"],
+        "other": a["other"] + b["other"],
+        "date_from": min(dates_from) if dates_from else None,
+        "date_to": max(dates_to) if dates_to else None,
+        "categories": _add_totals(a["categories"], b["categories"]),
+        "months": _add_totals(a["months"], b["months"]),
+        "balance": balance,
+    }
+
+
+def ratios(summary):
+    """missing_ratio and other_ratio of a summary."""
+    rows = summary["rows"]
+    return {
+        "missing_ratio": summary["missing"] / rows if rows else 0.0,
+        "other_ratio": summary["other"] / rows if rows else 0.0,
+    }
+
+
+def write_summary(summary, labeled_path):
+    path = summary_path(labeled_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def read_summary(labeled_path):
+    """The stored summary of a labeled file, or None if it has none or it is older than the file."""
+    path = summary_path(labeled_path)
+    if not os.path.exists(path) or (os.path.exists(labeled_path) and os.path.getmtime(path) < os.path.getmtime(labeled_path)):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_summary(labeled_path):
+    """read_summary, computing and storing it from the labeled file when missing (older outputs)."""
+    summary = read_summary(labeled_path)
+    if summary is None:
+        from core.labeled_store import iter_labeled
+        for df, offset in iter_labeled(labeled_path, columns=SUMMARY_COLUMNS):
+            summary = merge_summaries(summary, summarize(df, offset), contiguous=True)
+        summary = summary or summarize(pd.DataFrame())
+        write_summary(summary, labeled_path)
+    return summary
+
+
+def rollup(labeled_paths):
+    """Merged summary of several statements."""
+    total = None
+    for path in labeled_paths:
+        total = merge_summaries(total, load_summary(path))
+    return total or summarize(pd.DataFrame())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statement summaries")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print the summary of one labeled file")
+    show.add_argument("path")
+    roll = sub.add_parser("rollup", help="merge the summaries of several labeled files")
+    roll.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+    summary = load_summary(args.path) if args.command == "show" else rollup(args.paths)
+    print(json.dumps({**summary, **ratios(summary)}, indent=2))
@@ -0,0 +1,206 @@
+# core/tracing.py
+import os, json, time, threading, functools, contextlib, signal, shutil, subprocess, uuid
+from datetime import datetime
+
+TRACE_DIR = os.getenv("TRACE_DIR", "outputs/traces")
+# opt-in deep dives: "cprofile" writes <run_id>.prof (pstats / snakeviz / flameprof),
+# "py-spy" samples the process into <run_id>.speedscope.json (needs py-spy on PATH)
+TRACE_PROFILE = os.getenv("TRACE_PROFILE", "").lower()
+
+# Spans record into the run being traced in this process (a job worker or the
+# CLI runs one at a time). Without an active run they cost one global lookup.
+_active = None
+_local = threading.local()
+
+
+class RunTrace:
+    """Per-stage totals of one run: calls, wall time, CPU time and counters."""
+
+    def __init__(self, name, run_id=None):
+        self.name = name
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.started_at = datetime.utcnow().isoformat()
+        self._start = time.perf_counter()
+        self._cpu = time.process_time()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.wall_s = self.cpu_s = None
+
+    def record(self, name, parent, wall, cpu, counters):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"parent": parent, "calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_s": 0.0, "counters": {}}
+            stage["calls"] += 1
+            stage["wall_s"] += wall
+            stage["cpu_s"] += cpu
+            stage["max_s"] = max(stage["max_s"], wall)
+            for key, n in counters.items():
+                stage["counters"][key] = stage["counters"].get(key, 0) + n
+
+    def finish(self):
+        self.wall_s = time.perf_counter() - self._start
+        self.cpu_s = time.process_time() - self._cpu
+
+    def summary(self):
+        wall = self.wall_s if self.wall_s is not None else time.perf_counter() - self._start
+        cpu = self.cpu_s if self.cpu_s is not None else time.process_time() - self._cpu
+        with self._lock:
+            stages = {
+                name: {**s, "wall_s": round(s["wall_s"], 4), "cpu_s": round(s["cpu_s"], 4), "max_s": round(s["max_s"], 4), "counters": dict(s["counters"])}
+                for name, s in self.stages.items()
+            }
+        return {"run_id": self.run_id, "name": self.name, "started_at": self.started_at, "wall_s": round(wall, 4), "cpu_s": round(cpu, 4), "stages": stages}
+
+
+class Span:
+    __slots__ = ("name", "counters")
+
+    def __init__(self, name, counters):
+        self.name = name
+        self.counters = counters
+
+    def add(self, key, n=1):
+        self.counters[key] = self.counters.get(key, 0) + n
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextlib.contextmanager
+def span(name, **counters):
+    """
+    Time a block as stage `name` of the active run. CPU time is the process's
+    (so it includes other threads working at the same time, e.g. torch).
+    Counters given here or via count()/Span.add are summed per stage.
+    """
+    trace = _active
+    if trace is None:
+        yield Span(name, counters)
+        return
+    stack = _stack()
+    current = Span(name, counters)
+    parent = stack[-1].name if stack else None
+    stack.append(current)
+    start, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield current
+    finally:
+        stack.pop()
+        trace.record(name, parent, time.perf_counter() - start, time.process_time() - cpu, current.counters)
+
+
+def traced(name=None):
+    """Decorator form of span(); the stage name defaults to the function name."""
+    def decorator(fn):
+        stage = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(key, n=1):
+    """Add `n` to counter `key` of the innermost open span on this thread."""
+    if _active is None:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].add(key, n)
+
+
+def _start_profiler(run_id):
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    if TRACE_PROFILE == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        path = os.path.join(TRACE_DIR, f"{run_id}.prof")
+
+        def stop():
+            profiler.disable()
+            profiler.dump_stats(path)
+            return path
+        return stop
+    if TRACE_PROFILE == "py-spy":
+        exe = shutil.which("py-spy")
+        if exe is None:
+            print("[tracing] TRACE_PROFILE=py-spy but py-spy is not installed; profiling skipped")
+            return None
+        path = os.path.join(TRACE_DIR, f"{run_id}.speedscope.json")
+        proc = subprocess.Popen([exe, "record", "--pid", str(os.getpid()), "--format", "speedscope", "--output", path, "--threads", "--nonblocking"])
+
+        def stop():
+            proc.send_signal(signal.SIGINT)  # py-spy writes its output on SIGINT
+            proc.wait(timeout=60)
+            return path
+        return stop
+    return None
+
+
+@contextlib.contextmanager
+def trace_run(name, run_id=None):
+    """
+    Trace one run (an audit or a fine-tune): spans opened inside, on any
+    thread, are aggregated into the yielded RunTrace. On exit the summary is
+    written to TRACE_DIR/<run_id>.json and logged. Nested calls reuse the
+    outer run.
+    """
+    global _active
+    if _active is not None:
+        yield _active
+        return
+    trace = _active = RunTrace(name, run_id)
+    stop_profiler = _start_profiler(trace.run_id) if TRACE_PROFILE else None
+    try:
+        with span(name):
+            yield trace
+    finally:
+        _active = None
+        trace.finish()
+        summary = trace.summary()
+        if stop_profiler is not None:
+            summary["profile"] = stop_profiler()
+            print(f"[tracing] Profile written to {summary['profile']}")
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(os.path.join(TRACE_DIR, f"{trace.run_id}.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        from database.logger import log_action
+        log_action("Tracing", "Run trace", summary)
+
+
+def breakdown(summary):
+    """Rows (stage, calls, wall_s, cpu_s, share of run wall time, counters), slowest first."""
+    total = summary.get("wall_s") or 0
+    rows = [
+        {
+            "stage": name,
+            "parent": s["parent"],
+            "calls": s["calls"],
+            "wall_s": s["wall_s"],
+            "cpu_s": s["cpu_s"],
+            "max_s": s["max_s"],
+            "share": round(s["wall_s"] / total, 3) if total else None,
+            **s["counters"],
+        }
+        for name, s in summary.get("stages", {}).items()
+    ]
+    return sorted(rows, key=lambda r: r["wall_s"], reverse=True)
+
+
+def format_breakdown(summary):
+    lines = [f"Run {summary['run_id']} ({summary['name']}): {summary['wall_s']:.2f}s wall, {summary['cpu_s']:.2f}s CPU"]
+    for row in breakdown(summary):
+        counters = {k: v for k, v in row.items() if k not in ("stage", "parent", "calls", "wall_s", "cpu_s", "max_s", "share")}
+        share = f"{100 * row['share']:5.1f}%" if row["share"] is not None else "     -"
+        lines.append(f"  {row['stage']:<24} {row['calls']:>6}x {row['wall_s']:>9.3f}s {share}  cpu {row['cpu_s']:.3f}s  {counters or ''}")
+    return "\n".join(lines)
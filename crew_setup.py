@@ -1,30 +1,73 @@
 # crew_setup.py
 print("Starting crew_setup.py...")
 from agents.planner_agent import plan_task
-from agents.executor_agent import execute_audit, answer_query
-from agents.qa_generator_agent import generate_qa_from_labeled_data
+from agents.executor_agent import execute_audit, execute_audit_streaming, execute_audit_parallel, answer_query
+from agents.labeling_agent import labeled_output_path
+from agents.qa_generator_agent import generate_qa_from_labeled_data, build_qa_pairs, append_qa_pairs
+from core.qa_store import get_qa_store
+from agents.reviewer_agent import simple_review_check
+from core.jobs import report_progress
+from core.tracing import span, trace_run, format_breakdown
 from database.logger import log_action
 import os
 
-def run_audit_query(file_path):
+STREAM = os.getenv("AUDIT_STREAM", "false").lower() in ("1", "true", "yes")
+PARALLEL = os.getenv("AUDIT_PARALLEL", "false").lower() in ("1", "true", "yes")
+CHUNK_ROWS = int(os.getenv("AUDIT_CHUNK_ROWS", 50000))
+
+def run_audit_query(file_path, stream=None, chunksize=None, parallel=None):
+    """
+    Plan, label, index and generate Q&A for one statement.
+    With `stream=True` (or AUDIT_STREAM=true) the CSV is processed in chunks
+    of `chunksize` rows (AUDIT_CHUNK_ROWS) so memory stays bounded.
+    `parallel=True` (or AUDIT_PARALLEL=true) also streams, but labels and
+    embeds chunks on concurrent worker threads (PIPELINE_*_WORKERS).
+    """
+    parallel = PARALLEL if parallel is None else parallel
+    stream = parallel or (STREAM if stream is None else stream)
     query = f"Analyze and label bank statement: {file_path}"
     print(query)
-    plan = plan_task(query)
+    report_progress(0.05, "planning")
+    with span("plan"):
+        plan = plan_task(query)
     print(plan)
     log_action("Crew", "Received plan", {"steps": plan})
-    labeled_csv = execute_audit(file_path)
-    labeled_json = labeled_csv.replace(".csv", ".json")
-    qa_file = generate_qa_from_labeled_data(labeled_json)
-    log_action("Crew", "Completed audit flow", {"labeled_csv": labeled_csv, "qa_file": qa_file})
-    return {"labeled_file": labeled_csv, "qa_file": qa_file}
+    if stream:
+        labeled_file = labeled_output_path(file_path)
+        qa_file = get_qa_store().path
+        chunks = (execute_audit_parallel if parallel else execute_audit_streaming)(file_path, chunksize or CHUNK_ROWS)
+        for n, chunk in enumerate(chunks, start=1):
+            # the Q&A store skips pairs it already holds, so each chunk's pairs go in as it is indexed
+            append_qa_pairs(build_qa_pairs(chunk), source=os.path.basename(labeled_file))
+            report_progress(None, f"labeled, indexed and generated Q&A for chunk {n}")
+    else:
+        report_progress(0.1, "labeling and indexing")
+        labeled_file = execute_audit(file_path)
+        report_progress(0.9, "generating Q&A")
+        qa_file = generate_qa_from_labeled_data(labeled_file)
+    log_action("Crew", "Completed audit flow", {"labeled_file": labeled_file, "qa_file": qa_file, "stream": stream, "parallel": parallel})
+    return {"labeled_file": labeled_file, "qa_file": qa_file}
+
+def run_audit_job(file_path, **kwargs):
+    """run_audit_query plus the review of its labels, as run by the background job runner."""
+    result = run_audit_query(file_path, **kwargs)
+    report_progress(0.95, "reviewing")
+    with span("review"):
+        result["review"] = simple_review_check(result["labeled_file"])
+    return result
 
 if __name__ == "__main__":
     import sys
-    fp = sys.argv[1] if len(sys.argv) > 1 else "datasets/bank_statement.csv"
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    stream = "--stream" in sys.argv[1:] or None
+    parallel = "--parallel" in sys.argv[1:] or None
+    fp = args[0] if args else "datasets/bank_statement.csv"
     print(f"\n🚀 Starting audit analysis for: {fp}\n")
     try:
-        result = run_audit_query(fp)
+        with trace_run("audit") as trace:
+            result = run_audit_query(fp, stream=stream, parallel=parallel)
         print("\n✅ Audit completed successfully!", result)
+        print(format_breakdown(trace.summary()))
     except Exception as e:
         import traceback
         print("\n❌ ERROR DURING RUN:")
@@ -1,6 +1,22 @@
 from datetime import datetime
 from database.mongo_client import get_database
+from pymongo.errors import BulkWriteError
+from core.tracing import span
 import numpy as np
+import os, json, time, queue, threading, atexit
+from dotenv import load_dotenv
+load_dotenv()
+
+# Log entries are buffered and written by a background thread with insert_many,
+# so agents never wait on Mongo. When Mongo is unreachable (or the buffer is
+# full) entries go to a local JSONL file instead.
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 200))
+LOG_FLUSH_SECONDS = float(os.getenv("LOG_FLUSH_SECONDS", 1.0))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_PUT_TIMEOUT = float(os.getenv("LOG_PUT_TIMEOUT", 0.05))
+LOG_RETRY_SECONDS = float(os.getenv("LOG_RETRY_SECONDS", 30))
+LOG_FALLBACK_PATH = os.getenv("LOG_FALLBACK_PATH", "outputs/logs/audit_log.jsonl")
 
 def convert_numpy(obj):
     if isinstance(obj, np.integer):
@@ -13,9 +29,106 @@ def convert_numpy(obj):
         return [convert_numpy(i) for i in obj]
     return obj
 
+
+_file_lock = threading.Lock()
+
+def write_fallback(entries):
+    """Append log entries to the local JSONL fallback file."""
+    os.makedirs(os.path.dirname(LOG_FALLBACK_PATH) or ".", exist_ok=True)
+    with _file_lock, open(LOG_FALLBACK_PATH, "a") as f:
+        for entry in entries:
+            f.write(json.dumps({k: v for k, v in entry.items() if k != "_id"}, default=str) + "\n")
+
+
+class LogWriter:
+    """Background batching writer for the `logs` collection."""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._mongo_down_until = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, entry):
+        try:
+            # brief backpressure, then spill to disk rather than stall the caller
+            self._queue.put(entry, timeout=LOG_PUT_TIMEOUT)
+        except queue.Full:
+            write_fallback([entry])
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = []
+            deadline = time.monotonic() + LOG_FLUSH_SECONDS
+            while len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        if time.monotonic() >= self._mongo_down_until:
+            try:
+                with span("mongo_write", rows=len(batch)):
+                    get_database().logs.insert_many(batch, ordered=False)
+                return
+            except BulkWriteError as e:
+                # unordered: every entry not listed as failed was inserted, so
+                # only the failed ones are spilled (replaying the file must not
+                # duplicate entries Mongo already has)
+                failed = sorted({err["index"] for err in e.details.get("writeErrors", [])})
+                print(f"[LOG] Mongo rejected {len(failed)} of {len(batch)} entries, writing them to {LOG_FALLBACK_PATH}")
+                batch = [batch[i] for i in failed]
+                if not batch:
+                    return
+            except Exception as e:
+                print(f"[LOG] Mongo unavailable ({e.__class__.__name__}), using {LOG_FALLBACK_PATH}")
+                self._mongo_down_until = time.monotonic() + LOG_RETRY_SECONDS
+        with span("log_fallback_write", rows=len(batch)):
+            write_fallback(batch)
+
+    def flush(self, timeout=None):
+        """Wait until every submitted entry has been written (or `timeout` passes)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        self._stop.set()
+        self._thread.join(timeout=1)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = LogWriter()
+                atexit.register(_writer.close)
+    return _writer
+
+def flush_logs(timeout=None):
+    """Block until buffered log entries are written."""
+    if _writer is not None:
+        return _writer.flush(timeout)
+    return True
+
 def log_action(agent_name, action, details):
-    db = get_database()
-    
     # Convert any numpy types in details
     safe_details = convert_numpy(details)
     
@@ -26,5 +139,11 @@ def log_action(agent_name, action, details):
         "timestamp": datetime.utcnow()
     }
     
-    db.logs.insert_one(log_entry)
-    print(f"[LOG] {agent_name} → {action}")
\ No newline at end of file
+    if LOG_ASYNC:
+        _get_writer().submit(log_entry)
+    else:
+        try:
+            get_database().logs.insert_one(log_entry)
+        except Exception:
+            write_fallback([log_entry])
+    print(f"[LOG] {agent_name} → {action}")
@@ -1,14 +1,30 @@
 # database/mongo_client.py
 from pymongo import MongoClient
 from dotenv import load_dotenv
-import os
+import os, threading
 
 load_dotenv()
 
+_client = None
+_client_lock = threading.Lock()
+
 def get_mongo_client():
-    mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-    client = MongoClient(mongo_uri)
-    return client
+    """
+    Process-wide MongoClient. MongoClient is thread-safe and keeps its own
+    connection pool, so every caller shares one instead of opening a new
+    pool per call.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+                _client = MongoClient(
+                    mongo_uri,
+                    maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", 20)),
+                    serverSelectionTimeoutMS=int(os.getenv("MONGO_TIMEOUT_MS", 2000)),
+                )
+    return _client
 
 def get_database():
     client = get_mongo_client()
@@ -0,0 +1,179 @@
+# retrieval/answer_cache.py
+import os, re, time, threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "true").lower() in ("1", "true", "yes")
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 5000))
+TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+# cosine similarity above which another question's answer is reused (1.0 disables)
+SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s?.!]+$")
+
+
+def normalize_query(text):
+    return _TRAILING.sub("", _WHITESPACE.sub(" ", str(text).lower()).strip())
+
+
+def filters_key(filters):
+    """Hashable form of retrieval filters ({} and None are the same scope)."""
+    if not filters:
+        return ()
+    return tuple(sorted(
+        (field, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value)
+        for field, value in filters.items() if value is not None
+    ))
+
+
+class AnswerCache:
+    """
+    In-process cache of RAG answers, in two levels.
+
+    The exact level is keyed on the normalized question, top_k, the
+    retrieval filters, the version of the answering model and the store's
+    corpus_version. The semantic level reuses the answer of a cached question
+    whose embedding has cosine similarity >= `similarity` with the new one
+    (same top_k, filters, model and corpus). Every entry remembers the
+    version of each document its results came from and is dropped as soon as
+    one of them changes. Entries expire after `ttl` seconds and the least
+    recently used are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, similarity=SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._matrix_keys = []
+        self.exact_hits = self.semantic_hits = self.misses = 0
+        self.invalidated = self.expired = self.evicted = 0
+
+    def _scope(self, top_k, model_version, store, filters):
+        return (top_k, filters_key(filters), model_version, store.corpus_version)
+
+    def _valid(self, entry, store):
+        if time.monotonic() - entry["created"] > self.ttl:
+            self.expired += 1
+            return False
+        if entry["scope"][-1] != store.corpus_version or any(
+            store.doc_versions.get(doc_id) != version for doc_id, version in entry["docs"].items()
+        ):
+            self.invalidated += 1
+            return False
+        return True
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def get_exact(self, query_text, top_k, model_version, store, filters=None):
+        key = (normalize_query(query_text), *self._scope(top_k, model_version, store, filters))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._valid(entry, store):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry
+
+    def _semantic_index(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            vectors = [self._entries[k]["embedding"] for k in self._matrix_keys]
+            self._matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype="float32")
+        return self._matrix, self._matrix_keys
+
+    def get_similar_many(self, query_embeddings, top_k, model_version, store, filters=None):
+        """For every row of `query_embeddings`, the most similar valid entry or None."""
+        n = len(query_embeddings)
+        found = [None] * n
+        if self.similarity >= 1.0 or n == 0:
+            with self._lock:
+                self.misses += n
+            return found
+        queries = np.asarray(query_embeddings, dtype="float32").reshape(n, -1)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scope = self._scope(top_k, model_version, store, filters)
+        with self._lock:
+            matrix, keys = self._semantic_index()
+            if len(keys):
+                in_scope = np.array([k[1:] == scope for k in keys])
+                scores = queries @ matrix.T
+                scores[:, ~in_scope] = -1.0
+                for i, j in enumerate(scores.argmax(axis=1).tolist()):
+                    if scores[i, j] < self.similarity:
+                        continue
+                    entry = self._entries.get(keys[j])
+                    if entry is None or not self._valid(entry, store):
+                        self._drop(keys[j])
+                        continue
+                    self._entries.move_to_end(keys[j])
+                    found[i] = entry
+            hits = sum(e is not None for e in found)
+            self.semantic_hits += hits
+            self.misses += n - hits
+        return found
+
+    def get_similar(self, query_embedding, top_k, model_version, store, filters=None):
+        return self.get_similar_many(np.asarray(query_embedding).reshape(1, -1), top_k, model_version, store, filters)[0]
+
+    def put(self, query_text, top_k, model_version, store, query_embedding, answer, results, filters=None):
+        scope = self._scope(top_k, model_version, store, filters)
+        key = (normalize_query(query_text), *scope)
+        embedding = np.asarray(query_embedding, dtype="float32").reshape(-1)
+        docs = {r["metadata"].get("doc_id"): None for r in results}
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "results": results,
+                "embedding": embedding / max(float(np.linalg.norm(embedding)), 1e-12),
+                "docs": {doc_id: store.doc_versions.get(doc_id) for doc_id in docs},
+                "scope": scope,
+                "created": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "invalidated": self.invalidated,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
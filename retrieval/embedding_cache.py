@@ -0,0 +1,129 @@
+# retrieval/embedding_cache.py
+import os, json, hashlib, threading, contextlib, fcntl
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "outputs/cache/embeddings")
+CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")  # float16 | float32
+
+_KEY_BYTES = 16
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=_KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache for one embedding model.
+
+    Vectors are appended to a raw matrix file read back through np.memmap,
+    and the 16-byte content hash of each text is appended, in the same order,
+    to a key file that is loaded into a hash -> row dict. Vectors are written
+    before their keys, so a crash can leave an unreferenced vector but never
+    a key pointing past the matrix.
+
+    Several processes (job workers) share the files: appends hold an
+    exclusive file lock and first read the rows other processes appended, so
+    row numbers always match the files, and lookups pick up new rows when
+    the key file grows.
+    """
+
+    def __init__(self, model_name, cache_dir=CACHE_DIR, dtype=CACHE_DTYPE):
+        self.dir = os.path.join(cache_dir, model_name.replace("/", "--"))
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.bin")
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.info_path = os.path.join(self.dir, "info.json")
+        self.lock_path = os.path.join(self.dir, "cache.lock")
+        self._lock = threading.Lock()
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self._rows = {}
+        self._n = 0
+        self._matrix = None
+        with self._lock, self._exclusive():
+            self._refresh(repair=True)
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh(self, repair=False):
+        """
+        Read the rows appended since the last refresh, by any process; caller
+        holds self._lock. With `repair` (only under the file lock, when no
+        append can be in flight) the tail of an interrupted append is dropped
+        so both files line up again.
+        """
+        if self.dim is None and os.path.exists(self.info_path):
+            with open(self.info_path) as f:
+                info = json.load(f)
+            self.dtype, self.dim = np.dtype(info["dtype"]), info["dim"]
+        if self.dim is None or not (os.path.exists(self.keys_path) and os.path.exists(self.vectors_path)):
+            return
+        row_bytes = self.dim * self.dtype.itemsize
+        key_size = os.path.getsize(self.keys_path)
+        vector_size = os.path.getsize(self.vectors_path)
+        n = min(key_size // _KEY_BYTES, vector_size // row_bytes)
+        if repair:
+            for path, size, actual in ((self.vectors_path, n * row_bytes, vector_size), (self.keys_path, n * _KEY_BYTES, key_size)):
+                if actual != size:
+                    os.truncate(path, size)
+        if n <= self._n:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._n * _KEY_BYTES)
+            keys = f.read((n - self._n) * _KEY_BYTES)
+        for i in range(n - self._n):
+            self._rows.setdefault(keys[i * _KEY_BYTES:(i + 1) * _KEY_BYTES], self._n + i)
+        self._n = n
+        self._remap()
+
+    def _remap(self):
+        self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self._n, self.dim)) if self._n else None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get_many(self, hashes):
+        """Return (vectors for the cached hashes, list of positions that hit)."""
+        with self._lock:
+            self._refresh()
+            hits = [(i, self._rows[h]) for i, h in enumerate(hashes) if h in self._rows]
+            if not hits:
+                return None, []
+            positions, rows = zip(*hits)
+            return np.asarray(self._matrix[list(rows)], dtype="float32"), list(positions)
+
+    def put_many(self, hashes, vectors):
+        vectors = np.asarray(vectors)
+        with self._lock:
+            if all(h in self._rows for h in hashes):
+                return
+            with self._exclusive():
+                # rows other processes appended come first; they may include some of ours
+                self._refresh(repair=True)
+                fresh = [i for i, h in enumerate(hashes) if h not in self._rows]
+                if not fresh:
+                    return
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    with open(self.info_path, "w") as f:
+                        json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+                block = np.ascontiguousarray(vectors[fresh], dtype=self.dtype)
+                with open(self.vectors_path, "ab") as f:
+                    f.write(block.tobytes())
+                    f.flush()
+                with open(self.keys_path, "ab") as f:
+                    f.write(b"".join(hashes[i] for i in fresh))
+                for offset, i in enumerate(fresh):
+                    self._rows[hashes[i]] = self._n + offset
+                self._n += len(fresh)
+                self._remap()
@@ -1,23 +1,130 @@
 # retrieval/embeddings.py
-from sentence_transformers import SentenceTransformer
+from concurrent.futures import Future
 from dotenv import load_dotenv
-import os
+import os, queue, threading
+import numpy as np
+from retrieval.embedding_cache import EmbeddingCache, text_hash
+from core.tracing import traced, count
 load_dotenv()
 
 MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+EMBED_CACHE = os.getenv("EMBED_CACHE", "true").lower() in ("1", "true", "yes")
+# query micro-batching: wait up to COALESCE_MS for other concurrent queries
+COALESCE_MS = float(os.getenv("EMBED_COALESCE_MS", 5))
+COALESCE_MAX = int(os.getenv("EMBED_COALESCE_MAX", 64))
 _model = None
+_cache = None
 
 def get_embedding_model():
     global _model
     if _model is None:
+        # imported here: sentence_transformers pulls in torch and transformers
+        from sentence_transformers import SentenceTransformer
         print(f"[embeddings] Loading embedding model: {MODEL_NAME}")
         _model = SentenceTransformer(MODEL_NAME)
     return _model
 
-def embed_texts(texts):
+def get_embedding_cache():
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache(MODEL_NAME)
+    return _cache
+
+def _encode(texts, batch_size):
+    # SentenceTransformer.encode already sorts each call by length, so every
+    # batch of `batch_size` pads to similar-length texts.
+    model = get_embedding_model()
+    return model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+@traced()
+def embed_texts(texts, batch_size=None, use_cache=None):
     """
     texts: list[str] -> numpy.ndarray (n, d)
+    Texts already embedded (by content hash) come from the on-disk cache;
+    duplicates within `texts` are encoded once.
     """
-    model = get_embedding_model()
-    embs = model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
-    return embs
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    use_cache = EMBED_CACHE if use_cache is None else use_cache
+    count("rows", len(texts))
+    if not use_cache:
+        count("encoded", len(texts))
+        return _encode(texts, batch_size)
+
+    hashes = [text_hash(t) for t in texts]
+    cache = get_embedding_cache()
+    cached, hit_positions = cache.get_many(hashes)
+    hit = set(hit_positions)
+
+    first_pos = {}
+    for i, h in enumerate(hashes):
+        if i not in hit:
+            first_pos.setdefault(h, i)
+    missing = list(first_pos.values())
+    count("cache_hits", len(hit_positions))
+    count("encoded", len(missing))
+
+    out = None
+    if cached is not None:
+        out = np.empty((len(texts), cached.shape[1]), dtype="float32")
+        out[hit_positions] = cached
+    if missing:
+        fresh = np.asarray(_encode([texts[i] for i in missing], batch_size), dtype="float32")
+        cache.put_many([hashes[i] for i in missing], fresh)
+        if out is None:
+            out = np.empty((len(texts), fresh.shape[1]), dtype="float32")
+        row_of = {hashes[i]: r for r, i in enumerate(missing)}
+        rest = [i for i in range(len(texts)) if i not in hit]
+        out[rest] = fresh[[row_of[hashes[i]] for i in rest]]
+    if out is None:
+        return np.empty((0, 0), dtype="float32")
+    return out
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent single-query embedding calls into one encoder batch.
+    The first caller waits up to `wait_ms` for others to join, then the whole
+    batch is embedded at once and each caller gets its own row back.
+    """
+
+    def __init__(self, wait_ms=COALESCE_MS, max_batch=COALESCE_MAX):
+        self.wait = wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="query-batcher", daemon=True).start()
+
+    def submit(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.wait))
+            except queue.Empty:
+                pass
+            try:
+                embs = embed_texts([t for t, _ in batch], use_cache=False)
+                for (_, future), emb in zip(batch, embs):
+                    future.set_result(emb)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+@traced()
+def embed_query(text):
+    """Embed one query, sharing an encoder batch with concurrent callers. Returns (1, d)."""
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = QueryBatcher()
+    return _batcher.submit(text).result().reshape(1, -1)
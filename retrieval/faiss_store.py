@@ -1,100 +1,597 @@
 # retrieval/faiss_store.py
 import faiss
 import numpy as np
-import os, json
+import os, bisect, threading, atexit, contextlib, fcntl
 from database.mongo_client import get_database
+from retrieval.meta_store import MetaStore
+from core.tracing import span, traced, count
 from dotenv import load_dotenv
 from datetime import datetime
-from bson import ObjectId
 load_dotenv()
 
 INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "outputs/faiss/faiss_index.idx")
-META_PATH = os.getenv("FAISS_META_PATH", "outputs/faiss/faiss_meta.json")
-DB = get_database()
+META_PATH = os.getenv("FAISS_META_PATH", "outputs/faiss/faiss_meta.db")
+# cross-process lock held by whoever writes to the index (see exclusive_writer)
+LOCK_PATH = os.getenv("FAISS_LOCK_PATH", META_PATH + ".lock")
+# persist at most every FLUSH_SECONDS, or sooner once FLUSH_EVERY rows are pending
+FLUSH_SECONDS = float(os.getenv("FAISS_FLUSH_SECONDS", 30))
+FLUSH_EVERY = int(os.getenv("FAISS_FLUSH_EVERY", 50000))
+# ANN settings: the store stays exact (flat) until ANN_THRESHOLD vectors,
+# then trains an INDEX_TYPE index on everything indexed so far and migrates.
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")  # flat | hnsw | ivf_flat | ivf_pq
+ANN_THRESHOLD = int(os.getenv("FAISS_ANN_THRESHOLD", 100000))
+RETRAIN_FACTOR = float(os.getenv("FAISS_RETRAIN_FACTOR", 4))
+NLIST = int(os.getenv("FAISS_NLIST", 0))  # 0 = 4 * sqrt(n)
+PQ_M = int(os.getenv("FAISS_PQ_M", 16))
+HNSW_M = int(os.getenv("FAISS_HNSW_M", 32))
+EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", 80))
+NPROBE = int(os.getenv("FAISS_NPROBE", 16))
+EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", 64))
+# filtered searches over at most this many vectors score them exactly;
+# larger scopes search the index with an id selector
+EXACT_SCOPE_MAX = int(os.getenv("FAISS_EXACT_SCOPE_MAX", 50000))
+
+# index types that keep only compressed vectors: reconstructing from them is
+# lossy, so they are never retrained from their own contents automatically
+LOSSY_TYPES = ("ivf_pq",)
+
+# metadata fields with an inverted index, plus "date" (range filters)
+FILTER_FIELDS = ("doc_id", "category")
 
 def create_index(d):
-    # Use inner product + normalized vectors for cosine similarity
-    return faiss.IndexFlatIP(d)
-
-def save_index(index):
-    os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
-    faiss.write_index(index, INDEX_PATH)
-
-def load_index():
-    if os.path.exists(INDEX_PATH):
-        return faiss.read_index(INDEX_PATH)
-    return None
-
-def persist_meta(meta):
-    os.makedirs("outputs/meta", exist_ok=True)
-
-    # ✅ recursively convert ObjectIds to strings
-    def convert(o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        if isinstance(o, list):
-            return [convert(x) for x in o]
-        if isinstance(o, dict):
-            return {k: convert(v) for k, v in o.items()}
-        return o
-
-    meta_serializable = convert(meta)
-
-    with open("outputs/meta/meta.json", "w") as f:
-        json.dump(meta_serializable,f,indent=2)
-
-def load_meta():
-    if os.path.exists(META_PATH):
-        with open(META_PATH, "r") as f:
-            return json.load(f)
-    return []
+    # Use inner product + normalized vectors for cosine similarity.
+    # IndexIDMap2 lets vectors carry stable ids that survive removals.
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+
+def _inner(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def index_type_of(index):
+    index = _inner(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+def build_index(index_type, vectors, ids=None):
+    """
+    Build an index of `index_type` over the (already normalized) `vectors`,
+    training it first where the type needs it. Vectors get `ids` (row
+    positions if omitted).
+    """
+    n, d = vectors.shape
+    ids = np.arange(n, dtype="int64") if ids is None else np.asarray(ids, dtype="int64")
+    if index_type == "flat":
+        index = create_index(d)
+    elif index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(d, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(hnsw)
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = NLIST or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, max(1, n // 39))  # faiss wants ~39 training points per list
+        quantizer = faiss.IndexFlatIP(d)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            m = max(k for k in range(1, PQ_M + 1) if d % k == 0)  # sub-quantizers must divide d
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+        sample = vectors
+        if n > nlist * 256:
+            sample = vectors[np.random.default_rng(0).choice(n, nlist * 256, replace=False)]
+        index.train(sample)
+        index.nprobe = NPROBE
+        # IVF stores ids natively; the hashtable direct map allows both
+        # reconstruct (for rebuilds) and remove_ids
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
+    index.add_with_ids(vectors, ids)
+    return index
+
+def ensure_id_mapped(index):
+    """Upgrade an index saved before vectors carried explicit ids (ids = positions)."""
+    inner = faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIDMap):
+        return index
+    if isinstance(inner, faiss.IndexIVF):
+        if inner.direct_map.type != faiss.DirectMap.Hashtable:
+            inner.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index  # `inner` does not own the index memory
+    vectors = inner.reconstruct_n(0, inner.ntotal)
+    return build_index(index_type_of(inner), vectors)
+
+def search_params(index, nprobe=None, ef_search=None, selector=None):
+    """Per-query search parameters for ANN indexes (None for unfiltered flat)."""
+    kind = index_type_of(index)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or EF_SEARCH, sel=selector)
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or NPROBE, sel=selector)
+    return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+class FaissStore:
+    """
+    Long-lived FAISS index plus an in-memory vector_id -> metadata map.
+
+    Index and metadata are loaded from disk once; appends go to memory and
+    are persisted at checkpoints (on a timer, every FLUSH_EVERY rows, on
+    flush() and at exit) instead of on every call. Each checkpoint writes
+    only the changed metadata rows and swaps index + metadata atomically
+    (see MetaStore). Lookups of search hits are O(1) dict accesses.
+
+    Rows indexed through upsert_rows() carry a content fingerprint, so
+    re-indexing a document only embeds new or changed rows and removes the
+    vectors of rows that disappeared.
+
+    `doc_versions` counts the changes to each document and `corpus_version`
+    the documents added or removed (and rebuilds), so caches of search
+    results can tell what they depend on went stale.
+
+    An in-memory inverted index over doc_id, category and date backs
+    filtered searches, so a search scoped to one statement, category or date
+    range only touches the vectors in that scope.
+    """
+
+    def __init__(self, flush_seconds=FLUSH_SECONDS, flush_every=FLUSH_EVERY, index_type=INDEX_TYPE, ann_threshold=ANN_THRESHOLD,
+                 meta_path=META_PATH, index_path=INDEX_PATH):
+        self._meta_store = MetaStore(meta_path, index_path)
+        self.index, self.meta = self._meta_store.load()
+        self._generation = self._meta_store.generation()
+        legacy = self.index is not None and self._meta_store.generation() == 0
+        if self.index is not None:
+            self.index = ensure_id_mapped(self.index)
+        self.documents = self._meta_store.documents()
+        self._doc_rows = {}
+        self.doc_versions = {}
+        self.corpus_version = 0
+        self._postings = {}
+        self._dates = {}
+        self._date_keys = []
+        for vid, entry in self.meta.items():
+            self._post(vid, entry["metadata"])
+            self.doc_versions.setdefault(entry["metadata"].get("doc_id"), 0)
+            if entry.get("row_hash"):
+                self._doc_rows.setdefault(entry["metadata"].get("doc_id"), {})[entry["row_hash"]] = vid
+        next_id = self._meta_store.next_id()
+        if next_id is None:
+            next_id = max(max(self.meta, default=-1) + 1, self.index.ntotal if self.index is not None else 0)
+        self._next_id = next_id
+        # changes not yet committed; a legacy import rewrites everything once
+        self._unsaved = {}
+        self._deleted = set()
+        self._docs_dirty = {}
+        self._replace_meta = legacy
+        self._tombstones = 0
+        self.flush_every = flush_every
+        self.index_type = index_type
+        self.ann_threshold = ann_threshold
+        self._trained_size = self.index.ntotal if self.index is not None else 0
+        self._retrain_due = False
+        self._pending = (len(self.meta) or 1) if self._replace_meta else 0
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        if flush_seconds > 0:
+            threading.Thread(target=self._flush_loop, args=(flush_seconds,), daemon=True).start()
+        atexit.register(self.close)
+
+    def _post(self, vid, metadata, remove=False):
+        """Add (or remove) `vid` to the inverted index; caller holds the lock."""
+        buckets = [self._postings.setdefault((f, metadata.get(f)), set()) for f in FILTER_FIELDS]
+        date = metadata.get("date")
+        if date:
+            if date not in self._dates:
+                self._dates[date] = set()
+                bisect.insort(self._date_keys, date)
+            buckets.append(self._dates[date])
+        for bucket in buckets:
+            if remove:
+                bucket.discard(vid)
+            else:
+                bucket.add(vid)
+        if remove:
+            for f in FILTER_FIELDS:
+                if not self._postings.get((f, metadata.get(f)), True):
+                    del self._postings[(f, metadata.get(f))]
+            if date and not self._dates[date]:
+                del self._dates[date]
+                self._date_keys.pop(bisect.bisect_left(self._date_keys, date))
+
+    def scope_ids(self, doc_id=None, category=None, date_from=None, date_to=None):
+        """
+        Sorted vector ids matching every given filter (None = no filter).
+        `doc_id` and `category` take one value or a list of values; the dates
+        are inclusive ISO dates (YYYY-MM-DD). Rows without a date never match
+        a date filter.
+        """
+        with self._lock:
+            sets = []
+            for field, wanted in (("doc_id", doc_id), ("category", category)):
+                if wanted is None:
+                    continue
+                values = [wanted] if isinstance(wanted, str) else list(wanted)
+                sets.append(set().union(*(self._postings.get((field, v), ()) for v in values)))
+            if date_from is not None or date_to is not None:
+                lo = bisect.bisect_left(self._date_keys, date_from) if date_from else 0
+                hi = bisect.bisect_right(self._date_keys, date_to) if date_to else len(self._date_keys)
+                sets.append(set().union(*(self._dates[d] for d in self._date_keys[lo:hi])))
+            if not sets:
+                return None
+            sets.sort(key=len)
+            ids = sets[0].intersection(*sets[1:])
+        return np.fromiter(sorted(ids), dtype="int64", count=len(ids))
+
+    def _touch(self, doc_ids):
+        """Record a change to `doc_ids`; caller holds the lock."""
+        for doc_id in set(doc_ids):
+            if doc_id not in self.doc_versions:
+                self.corpus_version += 1
+            self.doc_versions[doc_id] = self.doc_versions.get(doc_id, 0) + 1
+
+    def _add_vectors(self, metadatas, embeddings, row_hashes=None):
+        """Add vectors under fresh ids; caller holds the lock. Returns the new entries."""
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        faiss.normalize_L2(embeddings)
+        if self.index is None:
+            self.index = create_index(embeddings.shape[1])
+        ids = np.arange(self._next_id, self._next_id + len(embeddings), dtype="int64")
+        self.index.add_with_ids(embeddings, ids)
+        self._next_id += len(embeddings)
+        now = datetime.utcnow().isoformat()
+        entries = []
+        for i, (vid, m) in enumerate(zip(ids.tolist(), metadatas)):
+            entry = {"vector_id": vid, "metadata": m, "indexed_at": now}
+            if row_hashes is not None:
+                entry["row_hash"] = row_hashes[i]
+                self._doc_rows.setdefault(m.get("doc_id"), {})[row_hashes[i]] = vid
+            self.meta[vid] = entry
+            self._unsaved[vid] = entry
+            self._post(vid, m)
+            entries.append(entry)
+        self._pending += len(entries)
+        self._touch(m.get("doc_id") for m in metadatas)
+        return entries
+
+    def _after_write(self, entries):
+        with self._lock:
+            self._maybe_migrate()
+            flush_now = self._pending >= self.flush_every
+        if entries:
+            try:
+                with span("mongo_write", rows=len(entries)):
+                    get_database().rag_metadata.insert_many([dict(e) for e in entries], ordered=False)
+            except Exception:
+                pass
+        if flush_now:
+            self.flush()
+
+    def add(self, metadatas, embeddings):
+        """Append vectors without fingerprinting (always adds)."""
+        with self._lock:
+            entries = self._add_vectors(metadatas, embeddings)
+        self._after_write(entries)
+        return entries[0]["vector_id"], entries[-1]["vector_id"]
 
+    def document_hash(self, doc_id):
+        return self.documents.get(doc_id)
+
+    def set_document_hash(self, doc_id, file_hash):
+        with self._lock:
+            self.documents[doc_id] = file_hash
+            self._docs_dirty[doc_id] = file_hash
+            self._pending += 1
+
+    def missing_rows(self, doc_id, row_hashes):
+        """Positions in `row_hashes` of the rows of `doc_id` that are not indexed."""
+        with self._lock:
+            known = self._doc_rows.get(doc_id, {})
+            return [i for i, h in enumerate(row_hashes) if h not in known]
+
+    def upsert_rows(self, doc_id, row_hashes, metadatas, embeddings=None, texts=None, embed_fn=None):
+        """
+        Index the rows of `doc_id` whose fingerprint is not indexed yet.
+        Embeddings come from `embeddings` (aligned with the rows) or are
+        computed lazily with `embed_fn(texts)` for the new rows only.
+        Rows already indexed just get their metadata refreshed (e.g. a new
+        row_index). Returns the number of vectors added.
+        """
+        with self._lock:
+            known = self._doc_rows.get(doc_id, {})
+            new = [i for i, h in enumerate(row_hashes) if h not in known]
+            for i, h in enumerate(row_hashes):
+                vid = known.get(h)
+                if vid is not None and self.meta[vid]["metadata"] != metadatas[i]:
+                    self._post(vid, self.meta[vid]["metadata"], remove=True)
+                    self._post(vid, metadatas[i])
+                    self.meta[vid]["metadata"] = metadatas[i]
+                    self._unsaved[vid] = self.meta[vid]
+                    self._pending += 1
+                    self._touch([doc_id])
+        if not new:
+            return 0
+        if embeddings is not None:
+            vectors = np.asarray(embeddings)[new]
+        else:
+            vectors = embed_fn([texts[i] for i in new])
+        with self._lock:
+            # re-check: another writer may have added some of these meanwhile
+            known = self._doc_rows.get(doc_id, {})
+            keep = [j for j, i in enumerate(new) if row_hashes[i] not in known]
+            entries = self._add_vectors(
+                [metadatas[new[j]] for j in keep], np.asarray(vectors)[keep], [row_hashes[new[j]] for j in keep]
+            ) if keep else []
+        self._after_write(entries)
+        return len(entries)
+
+    def prune_document(self, doc_id, keep_hashes):
+        """Remove the vectors of `doc_id` whose fingerprint is not in `keep_hashes`."""
+        with self._lock:
+            rows = self._doc_rows.get(doc_id, {})
+            stale = {h: vid for h, vid in rows.items() if h not in keep_hashes}
+            for h in stale:
+                del rows[h]
+            self._remove(list(stale.values()))
+            if stale:
+                self._touch([doc_id])
+        return len(stale)
+
+    def remove_document(self, doc_id):
+        """Remove every vector of `doc_id`, fingerprinted or not."""
+        with self._lock:
+            ids = sorted(self._postings.get(("doc_id", doc_id), ()))
+            self._doc_rows.pop(doc_id, None)
+            self._remove(ids)
+            if self.doc_versions.pop(doc_id, None) is not None:
+                self.corpus_version += 1
+        return len(ids)
+
+    def _remove(self, ids):
+        if not ids:
+            return
+        try:
+            self.index.remove_ids(np.asarray(ids, dtype="int64"))
+        except RuntimeError:
+            # HNSW cannot delete: drop the metadata (search skips ids without
+            # metadata) and compact on the next rebuild
+            self._tombstones += len(ids)
+        for vid in ids:
+            entry = self.meta.pop(vid, None)
+            if entry is not None:
+                self._post(vid, entry["metadata"], remove=True)
+            self._unsaved.pop(vid, None)
+            self._deleted.add(vid)
+        self._pending += len(ids)
+        try:
+            with span("mongo_write", rows=len(ids)):
+                get_database().rag_metadata.delete_many({"vector_id": {"$in": [int(v) for v in ids]}})
+        except Exception:
+            pass
+        if self._tombstones > 0.25 * max(len(self.meta), 1):
+            self.rebuild()
+
+    def _maybe_migrate(self):
+        n = self.index.ntotal
+        if self.index_type == "flat" or n < self.ann_threshold:
+            return
+        current = index_type_of(self.index)
+        if current == "flat":
+            print(f"[faiss_store] {n} vectors crossed FAISS_ANN_THRESHOLD, migrating flat -> {self.index_type}")
+            self.rebuild()
+        elif current.startswith("ivf") and n >= self._trained_size * RETRAIN_FACTOR:
+            if current in LOSSY_TYPES:
+                if not self._retrain_due:
+                    print(f"[faiss_store] Index grew {n / self._trained_size:.1f}x since training; {current} only keeps "
+                          "compressed vectors, retrain it from the labeled files with `python -m retrieval.rag rebuild`")
+                self._retrain_due = True
+                return
+            print(f"[faiss_store] Index grew {n / self._trained_size:.1f}x since training, retraining {current}")
+            self.rebuild()
+
+    def document_rows(self, doc_id):
+        """{row fingerprint: vector_id} of the rows of `doc_id` indexed through upsert_rows()."""
+        with self._lock:
+            return dict(self._doc_rows.get(doc_id, {}))
+
+    def rebuild(self, index_type=None, vectors=None):
+        """
+        Retrain (or change the type of) the index over every live vector.
+        `vectors` ({vector_id: original embedding}) supplies the vectors to
+        train on; the others are reconstructed from the index, which for
+        LOSSY_TYPES returns decoded approximations (see retrieval.rag.rebuild_index).
+        """
+        with self._lock:
+            if self.index is None:
+                return
+            index_type = index_type or (self.index_type if self.index.ntotal >= self.ann_threshold else "flat")
+            ids = np.fromiter(sorted(self.meta), dtype="int64", count=len(self.meta))
+            if not len(ids):
+                self.index = create_index(self.index.d)
+            else:
+                vectors = vectors or {}
+                known = np.fromiter((vid in vectors for vid in ids.tolist()), dtype=bool, count=len(ids))
+                matrix = np.empty((len(ids), self.index.d), dtype="float32")
+                if known.any():
+                    originals = np.ascontiguousarray(np.stack([vectors[vid] for vid in ids[known].tolist()]), dtype="float32")
+                    faiss.normalize_L2(originals)
+                    matrix[known] = originals
+                if (~known).any():
+                    current = index_type_of(self.index)
+                    if current in LOSSY_TYPES:
+                        print(f"[faiss_store] Rebuilding {(~known).sum()} vectors from their {current} approximations")
+                    matrix[~known] = self.index.reconstruct_batch(ids[~known])
+                self.index = build_index(index_type, matrix, ids)
+            self._retrain_due = False
+            self._trained_size = self.index.ntotal
+            self._tombstones = 0
+            self._pending += 1
+            # an approximate index can rank differently from the one it replaces
+            self.corpus_version += 1
+
+    def search(self, query_embedding, top_k=5, nprobe=None, ef_search=None, filters=None):
+        """
+        Nearest neighbours of `query_embedding`. `nprobe` (IVF) and `ef_search`
+        (HNSW) trade recall for latency per query; flat indexes ignore them.
+        `filters` (see scope_ids) restricts the search to matching rows.
+        """
+        if query_embedding.ndim == 1:
+            query_embedding = query_embedding.reshape(1, -1)
+        return self.search_batch(query_embedding[:1], top_k, nprobe=nprobe, ef_search=ef_search, filters=filters)[0]
+
+    def search_batch(self, query_embeddings, top_k=5, nprobe=None, ef_search=None, filters=None):
+        """
+        Nearest neighbours of every row of `query_embeddings` with one search.
+        With `filters`, scopes of up to EXACT_SCOPE_MAX vectors are scored
+        exactly against just their vectors; larger ones search the index with
+        an id selector.
+        """
+        n = len(query_embeddings)
+        if self.index is None or self.index.ntotal == 0 or n == 0:
+            return [[] for _ in range(n)]
+        queries = np.ascontiguousarray(query_embeddings, dtype="float32").reshape(n, -1)
+        faiss.normalize_L2(queries)
+        with self._lock:
+            scope = self.scope_ids(**filters) if filters else None
+            if scope is not None and not len(scope):
+                return [[] for _ in range(n)]
+            if scope is not None and len(scope) <= EXACT_SCOPE_MAX:
+                vectors = self.index.reconstruct_batch(scope)
+                scores = queries @ vectors.T
+                k = min(top_k, len(scope))
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+                I = scope[np.take_along_axis(top, order, axis=1)]
+            else:
+                selector = faiss.IDSelectorBatch(scope) if scope is not None else None
+                params = search_params(self.index, nprobe, ef_search, selector)
+                D, I = self.index.search(queries, top_k, params=params)
+            return [[self.meta[vid] for vid in row if vid in self.meta] for row in I.tolist()]
+
+    @traced("faiss_flush")
+    def flush(self):
+        """Checkpoint the index and metadata to disk if anything changed."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending or self.index is None:
+                    return
+                index_bytes = faiss.serialize_index(self.index)
+                replace = self._replace_meta
+                rows = list(self.meta.values()) if replace else list(self._unsaved.values())
+                deleted, documents = self._deleted, self._docs_dirty
+                pending = self._pending
+                self._unsaved, self._deleted, self._docs_dirty = {}, set(), {}
+                self._pending, self._replace_meta = 0, False
+                next_id = self._next_id
+            count("rows", len(rows))
+            try:
+                self._generation = self._meta_store.commit(index_bytes, rows, replace=replace, deleted_ids=deleted, documents=documents, next_id=next_id)
+            except Exception:
+                with self._lock:
+                    # keep the changes so the next checkpoint retries them
+                    if not replace:
+                        for row in rows:
+                            self._unsaved.setdefault(row["vector_id"], row)
+                    self._deleted |= deleted
+                    self._docs_dirty = {**documents, **self._docs_dirty}
+                    self._pending += pending
+                    self._replace_meta = self._replace_meta or replace
+                raise
+
+    def _flush_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print("[faiss_store] Background flush failed:", e)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def stale(self):
+        """True once another process has checkpointed since this store was loaded or last flushed."""
+        return self._meta_store.generation() != self._generation
+
+    def detach(self):
+        """Stop checkpointing this instance; it is being replaced by a fresh load."""
+        self._stop.set()
+        atexit.unregister(self.close)
+        if self._pending:
+            print(f"[faiss_store] Discarding {self._pending} unsaved changes made outside exclusive_writer()")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FaissStore()
+    return _store
+
+def reload_store():
+    """The process store, reloaded from disk if another process checkpointed since it was loaded."""
+    global _store
+    with _store_lock:
+        if _store is not None and not _store.stale():
+            return _store
+        old, _store = _store, FaissStore()
+        if old is not None:
+            old.detach()
+            # cached search results keyed on the old instance's versions must not match the new one
+            _store.corpus_version = old.corpus_version + 1
+        return _store
+
+@contextlib.contextmanager
+def exclusive_writer():
+    """
+    Serialize index writes across processes (job workers, the CLI). Every
+    process keeps its own in-memory copy of the index and hands out vector
+    ids from it, so a writer takes this file lock, reloads the store if
+    another process checkpointed since, writes, and checkpoints before
+    releasing the lock.
+    """
+    os.makedirs(os.path.dirname(LOCK_PATH) or ".", exist_ok=True)
+    with open(LOCK_PATH, "a") as lock:
+        with span("index_lock_wait"):
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            store = reload_store()
+            yield store
+            store.flush()
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+@traced()
 def index_documents(texts, metadatas, embeddings):
     """
     texts: list[str]
     metadatas: list[dict]
     embeddings: np.ndarray shape (n,dim)
     """
-    if embeddings.ndim == 1:
-        embeddings = embeddings.reshape(1, -1)
-    faiss.normalize_L2(embeddings)
-    index = load_index()
-    dim = embeddings.shape[1]
-    if index is None:
-        index = create_index(dim)
-    start_id = index.ntotal
-    index.add(embeddings)
-    save_index(index)
-
-    meta = load_meta()
-    for i, m in enumerate(metadatas):
-        meta_entry = {
-            "vector_id": start_id + i,
-            "metadata": m,
-            "indexed_at": datetime.utcnow().isoformat()
-        }
-        meta.append(meta_entry)
-        try:
-            DB.rag_metadata.insert_one(meta_entry)
-        except Exception:
-            pass
-    persist_meta(meta)
-    return start_id, start_id + len(metadatas) - 1
-
-def retrieve(query_embedding, top_k=5):
-    index = load_index()
-    if index is None or index.ntotal == 0:
-        return []
-    if query_embedding.ndim == 1:
-        query_embedding = query_embedding.reshape(1, -1)
-    faiss.normalize_L2(query_embedding)
-    D, I = index.search(query_embedding, top_k)
-    ids = I[0].tolist()
-    meta = load_meta()
-    results = []
-    for vid in ids:
-        for item in meta:
-            if item["vector_id"] == vid:
-                results.append(item)
-                break
-    return results
+    return get_store().add(metadatas, embeddings)
+
+@traced()
+def retrieve(query_embedding, top_k=5, nprobe=None, ef_search=None, filters=None):
+    """
+    Top-k rows for `query_embedding`, optionally only among the rows matching
+    `filters`, e.g. {"doc_id": "statement_labeled.json", "category": ["Shopping", "Expense"],
+    "date_from": "2025-01-01", "date_to": "2025-03-31"}.
+    """
+    return get_store().search(query_embedding, top_k, nprobe=nprobe, ef_search=ef_search, filters=filters)
+
+@traced()
+def retrieve_batch(query_embeddings, top_k=5, nprobe=None, ef_search=None, filters=None):
+    """retrieve() for many queries at once: one result list per row of `query_embeddings`."""
+    count("queries", len(query_embeddings))
+    return get_store().search_batch(query_embeddings, top_k, nprobe=nprobe, ef_search=ef_search, filters=filters)
@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 load_dotenv()
 BACKEND = os.getenv("MODEL_BACKEND", "transformers")
 MODEL_NAME = os.getenv("MODEL_NAME", "microsoft/phi-3-mini-4k-instruct")
+ANSWER_BATCH_SIZE = int(os.getenv("ANSWER_BATCH_SIZE", 16))
+ANSWER_MAX_NEW_TOKENS = int(os.getenv("ANSWER_MAX_NEW_TOKENS", 200))
 
 if BACKEND == "ollama":
     from openai import OpenAI
@@ -17,10 +19,29 @@ if BACKEND == "ollama":
             temperature=0.1
         )
         return resp.choices[0].message.content.strip()
+
+    def answer_model_version():
+        return f"ollama:{os.getenv('OPENAI_MODEL')}"
+
+    def batch_generator_fn(prompts):
+        # the server schedules concurrent requests itself, so just keep it busy
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(len(prompts), ANSWER_BATCH_SIZE) or 1) as pool:
+            return list(pool.map(lambda p: generator_fn(None, None, p), prompts))
 else:
-    from core.model_loader import load_phi3_model, generate_with_model
-    model, tokenizer = load_phi3_model()
+    from core.model_loader import get_model, generate_with_model, generate_batch_with_model, get_model_version
+
+    def answer_model_version():
+        # changes with the adapter, so answers of an older fine-tune are not reused
+        return get_model_version()
     def generator_fn(context, query, prompt=None):
         if prompt is None:
             prompt = f"Context:\n{context}\n\nQuestion: {query}\nAnswer in 1-2 sentences:"
-        return generate_with_model(model, tokenizer, prompt, max_new_tokens=200)
+        # shared with the labeling agent; loaded on first use
+        model, tokenizer = get_model()
+        return generate_with_model(model, tokenizer, prompt, max_new_tokens=ANSWER_MAX_NEW_TOKENS)
+
+    def batch_generator_fn(prompts):
+        """Answers for many prompts, generated as padded batches of ANSWER_BATCH_SIZE."""
+        model, tokenizer = get_model()
+        return generate_batch_with_model(model, tokenizer, prompts, max_new_tokens=ANSWER_MAX_NEW_TOKENS, batch_size=ANSWER_BATCH_SIZE)
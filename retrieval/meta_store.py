@@ -0,0 +1,155 @@
+# retrieval/meta_store.py
+import os, re, json, sqlite3, threading
+from datetime import datetime
+import faiss
+
+# Legacy locations written by earlier versions (full JSON rewrite per append)
+LEGACY_META_PATHS = ("outputs/meta/meta.json", "outputs/faiss/faiss_meta.json")
+
+
+class MetaStore:
+    """
+    Crash-safe persistence for a FAISS index and its vector metadata.
+
+    Metadata lives in SQLite (one row per vector_id, appended incrementally).
+    Each checkpoint writes the index to a new generation file
+    (`faiss_index.<gen>.idx`, temp file + rename) and then, in one SQLite
+    transaction, appends the new metadata rows and points the `state` table
+    at that file. The transaction commit is the single switch-over point: an
+    interrupted run leaves the previous index + metadata pair intact and at
+    most an orphaned index file, which the next checkpoint removes.
+    """
+
+    def __init__(self, meta_path, index_path):
+        os.makedirs(os.path.dirname(meta_path) or ".", exist_ok=True)
+        self.meta_path = meta_path
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(meta_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " vector_id INTEGER PRIMARY KEY,"
+            " doc_id TEXT,"
+            " metadata TEXT NOT NULL,"
+            " indexed_at TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(meta)")}
+        if "row_hash" not in columns:
+            self._conn.execute("ALTER TABLE meta ADD COLUMN row_hash TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS meta_doc ON meta(doc_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, file_hash TEXT, updated_at TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def _state(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def generation(self):
+        return int(self._state("generation", 0))
+
+    def _generation_path(self, generation):
+        root, ext = os.path.splitext(self.index_path)
+        return f"{root}.{generation}{ext}"
+
+    def next_id(self):
+        value = self._state("next_id")
+        return int(value) if value is not None else None
+
+    def documents(self):
+        """{doc_id: file_hash} of documents indexed as a whole file."""
+        return dict(self._conn.execute("SELECT doc_id, file_hash FROM documents"))
+
+    def load(self):
+        """Return (index or None, {vector_id: entry}) from the last committed checkpoint."""
+        with self._lock:
+            index_file = self._state("index_file")
+            if index_file is None:
+                return self._load_legacy()
+            index = faiss.read_index(os.path.join(os.path.dirname(self.index_path), index_file))
+            meta = {}
+            for vector_id, metadata, indexed_at, row_hash in self._conn.execute(
+                "SELECT vector_id, metadata, indexed_at, row_hash FROM meta"
+            ):
+                meta[vector_id] = {"vector_id": vector_id, "metadata": json.loads(metadata), "indexed_at": indexed_at, "row_hash": row_hash}
+            return index, meta
+
+    def _load_legacy(self):
+        # Pre-checkpoint layout: a single index file plus a JSON list whose
+        # path did not always match; keep only entries the index really holds.
+        if not os.path.exists(self.index_path):
+            return None, {}
+        index = faiss.read_index(self.index_path)
+        meta = {}
+        for path in LEGACY_META_PATHS:
+            if not os.path.exists(path):
+                continue
+            with open(path, "r") as f:
+                for item in json.load(f):
+                    if item.get("vector_id", -1) < index.ntotal:
+                        item.pop("_id", None)
+                        meta[item["vector_id"]] = item
+        print(f"[meta_store] Imported legacy index ({index.ntotal} vectors, {len(meta)} with metadata)")
+        return index, meta
+
+    def commit(self, index_bytes, new_entries, replace=False, deleted_ids=(), documents=None, next_id=None):
+        """
+        Atomically persist the serialized index (`faiss.serialize_index`
+        output) together with `new_entries` (metadata rows added or changed
+        since the last commit), `deleted_ids`, `documents` ({doc_id: file_hash}
+        updates) and the `next_id` counter. With `replace=True` the metadata
+        table is rewritten to exactly `new_entries` (used after importing
+        legacy data).
+        """
+        with self._lock:
+            generation = self.generation() + 1
+            path = self._generation_path(generation)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(memoryview(index_bytes))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+
+            with self._conn:
+                if replace:
+                    self._conn.execute("DELETE FROM meta")
+                self._conn.executemany(
+                    "DELETE FROM meta WHERE vector_id = ?", [(int(v),) for v in deleted_ids]
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO meta (vector_id, doc_id, metadata, indexed_at, row_hash) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (e["vector_id"], e["metadata"].get("doc_id"), json.dumps(e["metadata"], default=str), e.get("indexed_at"), e.get("row_hash"))
+                        for e in new_entries
+                    ],
+                )
+                if documents:
+                    now = datetime.utcnow().isoformat()
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO documents (doc_id, file_hash, updated_at) VALUES (?, ?, ?)",
+                        [(d, h, now) for d, h in documents.items()],
+                    )
+                state = [("generation", str(generation)), ("index_file", os.path.basename(path))]
+                if next_id is not None:
+                    state.append(("next_id", str(next_id)))
+                self._conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", state)
+            self._remove_stale(keep=path)
+            return generation
+
+    def _remove_stale(self, keep):
+        directory = os.path.dirname(keep) or "."
+        root, ext = os.path.splitext(os.path.basename(self.index_path))
+        # only generation files (and their leftover .tmp), never other files next to the index
+        generation_file = re.compile(rf"{re.escape(root)}\.\d+{re.escape(ext)}(\.tmp)?")
+        for name in os.listdir(directory):
+            full = os.path.join(directory, name)
+            if generation_file.fullmatch(name) and full != keep:
+                try:
+                    os.remove(full)
+                except OSError:
+                    pass
@@ -1,38 +1,298 @@
 # retrieval/rag.py
-import json, os
-from retrieval.embeddings import embed_texts
-from retrieval.faiss_store import index_documents, retrieve
+import os, hashlib, time, argparse
+from retrieval.embeddings import embed_texts, embed_query
+from retrieval.faiss_store import get_store, exclusive_writer, retrieve, retrieve_batch
+from retrieval.generators import ANSWER_BATCH_SIZE, answer_model_version
+from retrieval.answer_cache import ANSWER_CACHE, get_answer_cache
 from database.logger import log_action
+from core.tracing import span, traced, count
+from core.labeled_store import iter_labeled
+from core.dates import iso_date
 
-def chunk_text_rows_from_labeled_json(labeled_json_path):
-    with open(labeled_json_path, "r") as f:
-        data = json.load(f)
+def chunk_text_rows(records, doc_id, start_row=0):
+    """Texts and metadata for labeled transaction records (dicts), numbered from `start_row`."""
     texts, meta = [], []
-    for i, txn in enumerate(data):
+    for i, txn in enumerate(records, start=start_row):
         text = f"{txn.get('DATE','')} {txn.get('DESCRIPTION','')} DEBIT:{txn.get('DEBIT','')} CREDIT:{txn.get('CREDIT','')} BALANCE:{txn.get('BALANCE','')} CATEGORY:{txn.get('CATEGORY','')}"
         texts.append(text)
         meta.append({
-            "doc_id": os.path.basename(labeled_json_path),
+            "doc_id": doc_id,
             "row_index": i,
             "description": txn.get("DESCRIPTION",""),
-            "category": txn.get("CATEGORY","")
+            "category": txn.get("CATEGORY",""),
+            "date": iso_date(txn.get("DATE")),
         })
     return texts, meta
 
-def index_labeled_file(labeled_json_path):
-    texts, metadatas = chunk_text_rows_from_labeled_json(labeled_json_path)
-    if not texts:
-        return None
-    embeddings = embed_texts(texts)
-    start, end = index_documents(texts, metadatas, embeddings)
-    log_action("RAG", "Indexed file", {"file": labeled_json_path, "rows_indexed": len(texts)})
-    return {"start": start, "end": end, "count": len(texts)}
-
-def retrieve_and_answer(query_text, generator_fn, top_k=5):
-    query_emb = embed_texts([query_text])
-    results = retrieve(query_emb, top_k)
-    context = "\n\n".join([f"{r['metadata']['description']} (category: {r['metadata']['category']})" for r in results])
-    prompt = f"Context:\n{context}\n\nQuestion: {query_text}\nAnswer:"
-    answer = generator_fn(context, query_text, prompt)
-    log_action("RAG", "Retrieved and answered", {"query": query_text, "top_k": top_k})
+# columns chunk_text_rows reads; index_labeled_file loads nothing else
+INDEX_COLUMNS = ["DATE", "DESCRIPTION", "DEBIT", "CREDIT", "BALANCE", "CATEGORY"]
+
+def labeled_doc_id(labeled_path):
+    """
+    Index id of a labeled file. Ids keep the ".json" suffix of the former
+    JSON outputs so statements indexed before the switch to Parquet (and
+    filters naming them) keep matching.
+    """
+    return os.path.splitext(os.path.basename(labeled_path))[0] + ".json"
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def row_fingerprints(texts, counts):
+    """
+    Content hash of each row text. Identical rows are told apart by their
+    occurrence number, tracked in `counts` across the chunks of a document.
+    """
+    hashes = []
+    for text in texts:
+        n = counts.get(text, 0)
+        counts[text] = n + 1
+        hashes.append(hashlib.sha1(f"{text}#{n}".encode("utf-8")).hexdigest())
+    return hashes
+
+class DocumentIndexer:
+    """
+    Incrementally (re-)index one document, chunk by chunk in file order.
+    Only rows whose fingerprint is not indexed yet are embedded and added;
+    finish() removes the vectors of rows that no longer exist.
+
+    Embedding happens before the cross-process index lock is taken, so
+    audits in other job processes only wait for each other's index writes
+    (see exclusive_writer).
+    """
+
+    def __init__(self, doc_id):
+        self.doc_id = doc_id
+        self._counts = {}
+        self._seen = set()
+        self.rows = self.added = self.removed = 0
+
+    def index(self, texts, metadatas, embeddings=None):
+        if not texts:
+            return None
+        with span("index_documents", rows=len(texts)) as s:
+            hashes = row_fingerprints(texts, self._counts)
+            self._seen.update(hashes)
+            vectors = {}
+
+            def embed_fn(batch):
+                # rows another process removed since are embedded under the lock
+                missing = [t for t in batch if t not in vectors]
+                if missing:
+                    vectors.update(zip(missing, embed_texts(missing)))
+                return [vectors[t] for t in batch]
+
+            if embeddings is None:
+                # rows another process indexes meanwhile are skipped by upsert_rows
+                embed_fn([texts[i] for i in get_store().missing_rows(self.doc_id, hashes)])
+            with exclusive_writer() as store:
+                added = store.upsert_rows(self.doc_id, hashes, metadatas, embeddings=embeddings, texts=texts, embed_fn=embed_fn)
+            s.add("added", added)
+        self.rows += len(texts)
+        self.added += added
+        return {"count": len(texts), "added": added}
+
+    def finish(self, file_hash=None):
+        """Remove the rows not seen; `file_hash` is recorded as the document's hash in the same write."""
+        with span("index_prune") as s:
+            with exclusive_writer() as store:
+                self.removed = store.prune_document(self.doc_id, self._seen)
+                if file_hash is not None:
+                    store.set_document_hash(self.doc_id, file_hash)
+            s.add("removed", self.removed)
+        return {"count": self.rows, "added": self.added, "removed": self.removed}
+
+@traced()
+def index_labeled_file(labeled_path):
+    """Index a labeled file, reading only INDEX_COLUMNS one row batch at a time."""
+    doc_id = labeled_doc_id(labeled_path)
+    digest = file_hash(labeled_path)
+    if get_store().document_hash(doc_id) == digest:
+        count("skipped")
+        log_action("RAG", "Skipped unchanged file", {"file": labeled_path})
+        return {"count": 0, "added": 0, "removed": 0, "skipped": True}
+    indexer = DocumentIndexer(doc_id)
+    for df, offset in iter_labeled(labeled_path, columns=INDEX_COLUMNS):
+        indexer.index(*embed_labeled_rows(df, doc_id, offset, embed=False))
+    info = indexer.finish(digest)
+    log_action("RAG", "Indexed file", {"file": labeled_path, "rows_indexed": info["added"], "rows_removed": info["removed"], "rows": info["count"]})
+    return info
+
+def embed_labeled_rows(df, doc_id, start_row=0, embed=True):
+    """
+    Texts, metadata and embeddings for one labeled chunk (DataFrame).
+    With `embed=False` embeddings are None and DocumentIndexer computes
+    them for new rows only.
+    """
+    texts, metadatas = chunk_text_rows(df.to_dict(orient="records"), doc_id, start_row)
+    embeddings = embed_texts(texts) if texts and embed else None
+    return texts, metadatas, embeddings
+
+@traced()
+def rebuild_index(labeled_paths, index_type=None):
+    """
+    Retrain the vector index on the original embeddings of the rows of
+    `labeled_paths` (re-embedded, mostly from the embedding cache) instead of
+    the vectors the index holds, which ivf_pq only keeps compressed. Rows
+    that are in none of the files are rebuilt from the index.
+    """
+    with exclusive_writer() as store:
+        vectors = {}
+        for path in labeled_paths:
+            doc_id = labeled_doc_id(path)
+            rows, counts = store.document_rows(doc_id), {}
+            for df, offset in iter_labeled(path, columns=INDEX_COLUMNS):
+                texts, _ = chunk_text_rows(df.to_dict(orient="records"), doc_id, offset)
+                hashes = row_fingerprints(texts, counts)
+                for h, embedding in zip(hashes, embed_texts(texts)):
+                    if h in rows:
+                        vectors[rows[h]] = embedding
+        store.rebuild(index_type, vectors=vectors)
+        count("rows", len(vectors))
+    log_action("RAG", "Rebuilt index", {"files": list(labeled_paths), "from_originals": len(vectors), "vectors": len(store.meta)})
+    return {"from_originals": len(vectors), "vectors": len(store.meta)}
+
+def context_line(result):
+    return f"{result['metadata']['description']} (category: {result['metadata']['category']})"
+
+def answer_prompt(query_text, context):
+    return f"Context:\n{context}\n\nQuestion: {query_text}\nAnswer:"
+
+def _answer_cache(use_cache):
+    return get_answer_cache() if (ANSWER_CACHE if use_cache is None else use_cache) else None
+
+def retrieve_and_answer(query_text, generator_fn, top_k=5, use_cache=None, filters=None):
+    """
+    Answer one question from the indexed rows, or only from the rows
+    matching `filters` (doc_id, category, date_from, date_to; see
+    faiss_store.retrieve). With the answer cache on (ANSWER_CACHE, see
+    retrieval.answer_cache) a repeated or near-identical question skips
+    search and generation; the cache assumes `generator_fn` is the
+    configured answering model.
+    """
+    cache, store = _answer_cache(use_cache), get_store()
+    if cache is not None:
+        model_version = answer_model_version()
+        hit = cache.get_exact(query_text, top_k, model_version, store, filters)
+        if hit is not None:
+            count("answer_cache_exact_hits")
+            return hit["answer"], hit["results"]
+    query_emb = embed_query(query_text)
+    if cache is not None:
+        hit = cache.get_similar(query_emb, top_k, model_version, store, filters)
+        if hit is not None:
+            count("answer_cache_semantic_hits")
+            return hit["answer"], hit["results"]
+    results = retrieve(query_emb, top_k, filters=filters)
+    context = "\n\n".join(context_line(r) for r in results)
+    prompt = answer_prompt(query_text, context)
+    with span("generate_answer"):
+        answer = generator_fn(context, query_text, prompt)
+    if cache is not None:
+        cache.put(query_text, top_k, model_version, store, query_emb, answer, results, filters)
+    log_action("RAG", "Retrieved and answered", {"query": query_text, "top_k": top_k, "filters": filters})
     return answer, results
+
+@traced()
+def retrieve_and_answer_batch(queries, batch_generator_fn, top_k=5, batch_size=None, use_cache=None, filters=None):
+    """
+    Answer a checklist of questions in one call.
+    Repeated questions are answered once, and questions the answer cache
+    knows (exactly or semantically) are not searched or generated. The rest
+    are embedded in one encoder pass and searched with a single index.search;
+    each retrieved row's context line is formatted once however many
+    questions share it. Prompts are generated `batch_size` (ANSWER_BATCH_SIZE)
+    at a time, grouped by length so batches pad little.
+    `filters` scopes every question as in retrieve_and_answer.
+    Returns one {"query", "answer", "results", "latency_s", "cached"} per
+    query, in order; latency_s is the time from the call until that answer
+    was ready.
+    """
+    batch_size = batch_size or ANSWER_BATCH_SIZE
+    start = time.perf_counter()
+    unique = list(dict.fromkeys(queries))
+    count("queries", len(queries))
+    count("unique_queries", len(unique))
+    if not unique:
+        return []
+    answers, results, ready, cached = [None] * len(unique), [None] * len(unique), [None] * len(unique), [None] * len(unique)
+    cache, store = _answer_cache(use_cache), get_store()
+    model_version = answer_model_version() if cache is not None else None
+
+    def resolve(i, hit, how):
+        answers[i], results[i], cached[i] = hit["answer"], hit["results"], how
+        ready[i] = time.perf_counter() - start
+
+    pending = list(range(len(unique)))
+    if cache is not None:
+        for i in pending:
+            hit = cache.get_exact(unique[i], top_k, model_version, store, filters)
+            if hit is not None:
+                resolve(i, hit, "exact")
+        pending = [i for i in pending if cached[i] is None]
+
+    if pending:
+        with span("embed_queries"):
+            query_embs = embed_texts([unique[i] for i in pending], use_cache=False)
+        if cache is not None:
+            hits = cache.get_similar_many(query_embs, top_k, model_version, store, filters)
+            for i, hit in zip(pending, hits):
+                if hit is not None:
+                    resolve(i, hit, "semantic")
+            keep = [j for j, i in enumerate(pending) if cached[i] is None]
+            pending, query_embs = [pending[j] for j in keep], query_embs[keep]
+        count("answer_cache_hits", len(unique) - len(pending))
+
+    if pending:
+        for i, hits in zip(pending, retrieve_batch(query_embs, top_k, filters=filters)):
+            results[i] = hits
+        lines, prompts = {}, {}
+        for i in pending:
+            for r in results[i]:
+                if r["vector_id"] not in lines:
+                    lines[r["vector_id"]] = context_line(r)
+            prompts[i] = answer_prompt(unique[i], "\n\n".join(lines[r["vector_id"]] for r in results[i]))
+
+        order = sorted(pending, key=lambda i: len(prompts[i]))
+        with span("generate_answers", prompts=len(prompts)):
+            for b in range(0, len(order), batch_size):
+                batch = order[b:b + batch_size]
+                outputs = batch_generator_fn([prompts[i] for i in batch])
+                done = time.perf_counter() - start
+                for i, answer in zip(batch, outputs):
+                    answers[i], ready[i] = answer, done
+        if cache is not None:
+            row_of = {i: j for j, i in enumerate(pending)}
+            for i in pending:
+                cache.put(unique[i], top_k, model_version, store, query_embs[row_of[i]], answers[i], results[i], filters)
+
+    position = {q: i for i, q in enumerate(unique)}
+    seconds = time.perf_counter() - start
+    log_action("RAG", "Retrieved and answered batch", {
+        "queries": len(queries), "unique_queries": len(unique), "top_k": top_k, "filters": filters,
+        "cache_hits": sum(c is not None for c in cached),
+        "seconds": round(seconds, 3), "questions_per_sec": round(len(queries) / seconds, 2) if seconds else None,
+    })
+    return [
+        {
+            "query": q,
+            "answer": answers[position[q]],
+            "results": results[position[q]],
+            "latency_s": round(ready[position[q]], 4),
+            "cached": cached[position[q]],
+        }
+        for q in queries
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector index maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="retrain the index on the original embeddings of labeled files")
+    rebuild.add_argument("paths", nargs="+")
+    rebuild.add_argument("--index-type", choices=("flat", "hnsw", "ivf_flat", "ivf_pq"))
+    args = parser.parse_args()
+    print(rebuild_index(args.paths, args.index_type))
@@ -0,0 +1,103 @@
+# tests/test_adapters.py
+import os, threading
+
+import core.adapters as adapters
+import core.model_loader as model_loader
+
+
+def _version(registry, root, version, files):
+    path = root / version
+    path.mkdir()
+    for name in files:
+        (path / name).write_text(f"{version}:{name}")
+    registry["versions"][version] = {"version": version, "path": str(path)}
+
+
+def test_rollback_serves_exactly_the_older_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(adapters, "VERSIONS_DIR", str(tmp_path / "adapters"))
+    monkeypatch.setattr(adapters, "SERVING_DIR", str(tmp_path / "fine_tuned"))
+    monkeypatch.setattr(model_loader, "_active_adapter", None)
+    os.makedirs(adapters.VERSIONS_DIR)
+    registry = {"active": None, "history": [], "versions": {}}
+    _version(registry, tmp_path, "v0001", ["adapter_config.json", "adapter_model.safetensors"])
+    _version(registry, tmp_path, "v0002", ["adapter_config.json", "adapter_model.safetensors", "added_tokens.json"])
+    adapters._write_registry(registry)
+
+    assert model_loader.active_adapter() is None
+    serving = str(tmp_path / "fine_tuned")
+    adapters.promote("v0001", serving)
+    adapters.promote("v0002", serving)
+    assert model_loader.active_adapter() == adapters.SERVING_DIR
+    adapters.rollback(serving_dir=serving)
+
+    assert sorted(os.listdir(serving)) == ["adapter_config.json", "adapter_model.safetensors"]
+    assert (tmp_path / "fine_tuned" / "adapter_model.safetensors").read_text() == "v0001:adapter_model.safetensors"
+    assert adapters.list_versions()["active"] == "v0001"
+
+
+def test_promoted_adapter_is_served_by_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(adapters, "SERVING_DIR", str(tmp_path / "fine_tuned"))
+    monkeypatch.setattr(model_loader, "_active_adapter", None)
+    assert model_loader.active_adapter() is None
+    (tmp_path / "fine_tuned").mkdir()
+    (tmp_path / "fine_tuned" / "adapter_config.json").write_text("{}")
+    assert model_loader.active_adapter() == str(tmp_path / "fine_tuned")
+    monkeypatch.setattr(model_loader, "_active_adapter", "none")
+    assert model_loader.active_adapter() is None
+
+
+def test_model_version_is_the_loaded_adapter(tmp_path, monkeypatch):
+    serving = tmp_path / "fine_tuned"
+    serving.mkdir()
+    (serving / "adapter_config.json").write_text("{}")
+    (serving / "adapter_model.safetensors").write_bytes(b"v0001")
+    monkeypatch.setattr(adapters, "SERVING_DIR", str(serving))
+    monkeypatch.setattr(model_loader, "_active_adapter", None)
+    monkeypatch.setenv("MODEL_BACKEND", "transformers")
+    loaded = model_loader.get_model_version()
+    key = ("google/flan-t5-base", str(serving), "transformers")
+    monkeypatch.setitem(model_loader._registry, key, {"adapter_version": model_loader._adapter_hash(str(serving))})
+    # another process promotes a new version into the serving directory
+    (serving / "adapter_model.safetensors").write_bytes(b"v0002 trained elsewhere")
+    assert model_loader.get_model_version("google/flan-t5-base") == loaded
+    monkeypatch.delitem(model_loader._registry, key)
+    assert model_loader.get_model_version("google/flan-t5-base") != loaded
+
+
+def test_swap_is_atomic_for_readers(tmp_path, monkeypatch):
+    monkeypatch.setattr(adapters, "VERSIONS_DIR", str(tmp_path / "adapters"))
+    monkeypatch.setattr(model_loader, "_active_adapter", None)
+    os.makedirs(adapters.VERSIONS_DIR)
+    registry = {"active": None, "history": [], "versions": {}}
+    for version in ("v0001", "v0002"):
+        _version(registry, tmp_path, version, ["adapter_config.json", "adapter_model.safetensors"])
+    adapters._write_registry(registry)
+    serving = tmp_path / "fine_tuned"
+    serving.mkdir()
+    (serving / "adapter_config.json").write_text("unversioned")
+
+    stop, mixed = threading.Event(), []
+
+    def read():
+        while not stop.is_set():
+            path = os.path.realpath(serving)
+            try:
+                versions = {open(os.path.join(path, n)).read().split(":")[0] for n in ("adapter_config.json", "adapter_model.safetensors")}
+            except FileNotFoundError:
+                continue
+            if len(versions) > 1:
+                mixed.append(versions)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for _ in range(50):
+        adapters.promote("v0001", str(serving))
+        adapters.promote("v0002", str(serving))
+    stop.set()
+    reader.join()
+
+    assert not mixed
+    assert os.path.islink(serving)
+    assert (serving / "adapter_model.safetensors").read_text() == "v0002:adapter_model.safetensors"
+    # the live copy and the one it replaced
+    assert len([n for n in os.listdir(tmp_path) if n.startswith(".fine_tuned-")]) == 2
@@ -0,0 +1,11 @@
+# tests/test_dates.py
+import pandas as pd
+
+from core.dates import iso_date, parse_dates
+
+
+def test_scalar_and_column_parsers_agree():
+    values = pd.Series(["2025-01-03", "03/02/2025", "3.2.2025", "2025/12/31 10:00", " 31-12-2024", "x", None])
+    parsed = parse_dates(values)
+    assert [iso_date(v) for v in values] == [d.date().isoformat() if pd.notna(d) else "" for d in parsed]
+    assert iso_date("03/02/2025") == "2025-02-03"
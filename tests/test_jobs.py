@@ -0,0 +1,41 @@
+# tests/test_jobs.py
+import sqlite3
+from concurrent.futures import Future
+
+import pytest
+
+from core.jobs import JobRunner, _connect
+
+
+class _Pool:
+    def submit(self, *args):
+        return Future()
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def _runner(path):
+    runner = JobRunner(str(path), workers=1)
+    runner._pool.shutdown(wait=False)
+    runner._pool = _Pool()
+    return runner
+
+
+def test_single_flight_across_runners(tmp_path):
+    db = tmp_path / "jobs.db"
+    first, second = _runner(db), _runner(db)
+    job_id = first.submit("fine_tune", mode="global")
+    assert second.submit("fine_tune", mode="delta") == job_id
+    assert second.submit("audit", file_path="a.csv") != second.submit("audit", file_path="a.csv")
+
+
+def test_active_dedup_key_is_unique_in_sqlite(tmp_path):
+    conn = _connect(str(tmp_path / "jobs.db"))
+    insert = "INSERT INTO jobs (id, kind, dedup_key, status) VALUES (?, 'fine_tune', 'fine_tune', ?)"
+    conn.execute(insert, ("a", "succeeded"))
+    conn.execute(insert, ("b", "running"))
+    conn.commit()
+    # another process that missed the running job cannot queue a second one
+    with pytest.raises(sqlite3.IntegrityError):
+        _connect(str(tmp_path / "jobs.db")).execute(insert, ("c", "queued"))
@@ -0,0 +1,54 @@
+# tests/test_labeled_store.py
+import pandas as pd
+import pyarrow.parquet as pq
+
+from core.labeled_store import LabeledWriter, read_labeled
+from agents.labeling_agent import read_statement_chunks
+
+
+def _write_chunks(path, chunks):
+    writer = LabeledWriter(str(path))
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.close()
+    return read_labeled(str(path))
+
+
+def test_text_in_a_column_empty_so_far(tmp_path):
+    chunks = [
+        pd.DataFrame({"DESCRIPTION": ["a", "b"], "REF": [None, None], "DEBIT": [1.0, 2.0]}),
+        pd.DataFrame({"DESCRIPTION": ["c", "d"], "REF": ["R3", None], "DEBIT": [3.0, None]}),
+    ]
+    df = _write_chunks(tmp_path / "x_labeled.parquet", chunks)
+    assert df["REF"].tolist()[2] == "R3"
+    assert df["REF"].isna().tolist() == [True, True, False, True]
+    assert df["DEBIT"].tolist()[:3] == [1.0, 2.0, 3.0]
+
+
+def test_text_in_a_numeric_column_rewrites_earlier_row_groups(tmp_path):
+    chunks = [
+        pd.DataFrame({"DESCRIPTION": ["a", "b"], "DEBIT": [500.0, None]}),
+        pd.DataFrame({"DESCRIPTION": ["c"], "DEBIT": ["1,000.00"]}),
+        pd.DataFrame({"DESCRIPTION": ["d"], "DEBIT": [7.5]}),
+    ]
+    path = tmp_path / "x_labeled.parquet"
+    df = _write_chunks(path, chunks)
+    assert len(df) == 4
+    assert df["DEBIT"].tolist()[2] == "1,000.00"
+    assert float(df["DEBIT"][0]) == 500.0 and pd.isna(df["DEBIT"][1])
+    assert pq.ParquetFile(str(path)).schema_arrow.field("DEBIT").type == "string"
+    assert [p.name for p in tmp_path.iterdir()] == ["x_labeled.parquet"]
+
+
+def test_streamed_statement_with_dtype_drift(tmp_path):
+    csv = tmp_path / "statement.csv"
+    rows = ["DATE,DESCRIPTION,REF,DEBIT,CREDIT,BALANCE"]
+    rows += [f"2025-01-0{i},Shop {i},,{i}0,,{1000 - i * 10}" for i in range(1, 5)]
+    rows += ["2025-01-05,Shop 5,R3,\"1,000.00\",,0"]
+    csv.write_text("\n".join(rows) + "\n")
+    chunks = [chunk for chunk, _ in read_statement_chunks(str(csv), chunksize=2)]
+    df = _write_chunks(tmp_path / "statement_labeled.parquet", chunks)
+    assert len(df) == 5
+    assert df["REF"].tolist()[4] == "R3"
+    assert df["DEBIT"].tolist()[4] == "1,000.00"
+    assert df["DESCRIPTION"].tolist() == [f"Shop {i}" for i in range(1, 6)]
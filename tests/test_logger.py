@@ -0,0 +1,23 @@
+# tests/test_logger.py
+import json, types
+
+from pymongo.errors import BulkWriteError
+
+import database.logger as logger
+
+
+def test_partial_insert_spills_only_rejected_entries(tmp_path, monkeypatch):
+    def insert_many(batch, ordered=True):
+        assert ordered is False
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 10334, "errmsg": "too large"}], "nInserted": 2})
+
+    db = types.SimpleNamespace(logs=types.SimpleNamespace(insert_many=insert_many))
+    monkeypatch.setattr(logger, "get_database", lambda: db)
+    monkeypatch.setattr(logger, "LOG_FALLBACK_PATH", str(tmp_path / "audit_log.jsonl"))
+    writer = logger.LogWriter.__new__(logger.LogWriter)
+    writer._mongo_down_until = 0.0
+    writer._write([{"action": "a"}, {"action": "b"}, {"action": "c"}])
+    lines = (tmp_path / "audit_log.jsonl").read_text().splitlines()
+    assert [json.loads(line)["action"] for line in lines] == ["b"]
+    # rejected entries do not mean Mongo is down
+    assert writer._mongo_down_until == 0.0
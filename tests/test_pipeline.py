@@ -0,0 +1,20 @@
+# tests/test_pipeline.py
+import sys, types, operator
+from functools import partial
+
+from core.pipeline import Stage, run_pipeline, _core_slices
+
+
+def test_torch_threads_set_once_per_run(monkeypatch):
+    calls = []
+    torch = types.SimpleNamespace(get_num_threads=lambda: 8, set_num_threads=calls.append)
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    stages = [Stage("label", lambda x: x + 1, workers=2), Stage("embed", lambda x: x * 2, workers=2)]
+    out = list(run_pipeline(range(20), stages))
+    assert out == [(x + 1) * 2 for x in range(20)]
+    assert calls == [len(_core_slices(stages)[0]), 8]
+
+
+def test_process_stage():
+    stages = [Stage("square", partial(pow, exp=2), workers=2, kind="process"), Stage("negate", operator.neg)]
+    assert list(run_pipeline(range(10), stages)) == [-(x * x) for x in range(10)]